@@ -57,7 +57,10 @@ def run_linear_drift_test():
             file.write(f'For Batch {i}, the errors are: {digest_errors_per_batch_index[i]} --- Average Error for batch: {average_ground_truths[i]}\n')
 
 
-def plot_linear_drift(figure_name):
+def plot_linear_drift(figure_name, results_file=None):
+    """
+    :param results_file: results of experiment_runner.py to plot instead of the recorded errors below
+    """
     errors__batch_1 = [0.003249682561656899, 0.0030789682207203475, 0.00276602009533181, 0.004828636919028153, 0.0021760575010173443, 0.005460144879716818, 0.002562906348910881, 0.004487768205029619, 0.004683567335243509, 0.0040580832735104, 0.004453990142660114, 0.0033651054980726285, 0.004727232401839503, 0.0034489076938657814, 0.003694247600070715]
     min_max_KS_batch_1 = "[0,0.01]"
 
@@ -76,6 +79,12 @@ def plot_linear_drift(figure_name):
     data = [errors__batch_1, errors__batch_2, errors__batch_3, errors__batch_4, errors__batch_5]
     # labels = ['0.003', '0.151', '0.295', '0.450', '0.550']  # Labels for each boxplot
     labels = [min_max_KS_batch_1, min_max_KS_batch_2, min_max_KS_batch_3, min_max_KS_batch_4, min_max_KS_batch_5]
+    if results_file:
+        # pyarrow is only needed to read the results of experiment_runner.py.
+        from experiment_runner import grouped_errors, ks_range_labels, load_results
+        results = load_results(results_file)
+        _, data = grouped_errors(results, 'linear_drift')
+        labels = ks_range_labels(results, 'linear_drift')
 
     if TAKE_ABS_ERRORS:
         for errors_list in data:
@@ -43,7 +43,10 @@ def run_eval_ks(train_ds_list, test_ds_list):
             file.write(f'Average True KS for {new_percentage}%: {average_ground_truth_ks} \n')
 
 
-def plot_graph(figure_name):
+def plot_graph(figure_name, results_file=None):
+    """
+    :param results_file: results of experiment_runner.py to plot instead of the recorded errors below
+    """
     errors_0 = [0.0006660189837035422, -7.821681864264574e-06, 0.000566425466035532, 0.00045727131493215976, 0.0006865379709670629, 0.0017801650387723024, 0.0003429368294116074, 4.684972463381027e-05, -2.5469495322993745e-05, 0.00031087708946402406, 0.0004344837545198193, 0.00037559606970073885, 8.834969183684101e-05, -2.3265952650862454e-05, 0.0006639978070445839]
     errors_5 = [-0.0001575466669211517, -0.0001483060892622512, -0.00034781336586331424, 0.00012872941010043382,
                 0.0003441403578011426, 0.0002696512668117282, -0.0005321529030635555, -0.00016181425497353852,
@@ -64,6 +67,11 @@ def plot_graph(figure_name):
 
     data = [errors_0, errors_5, errors_10, errors_20, errors_50]
     labels = ['0%', '5%', '10%', '20%', '50%']  # Labels for each boxplot
+    if results_file:
+        # pyarrow is only needed to read the results of experiment_runner.py.
+        from experiment_runner import grouped_errors, load_results
+        levels, data = grouped_errors(load_results(results_file), 'sudden_drift')
+        labels = [f'{level}%' for level in levels]
 
     if TAKE_ABS_ERRORS:
         for errors_list in data:
@@ -1,17 +1,23 @@
+import argparse
 import time
+import sys
+import os
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 from edge_client.client import EdgeClient
 
+# the shared sketch code lives in the framework package.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'framework'))
+from sketches.histogram import HistogramSketch
+from benchmarks.runtime_results import load_results, runtime_series
+
 file_path = '../data/fraud/real_world_creditcard_dep.csv'
-df = pd.read_csv(file_path)
-df = df[["Amount"]]
-dataset = df["Amount"].tolist()
 
 
 def client_eval():
     SUPPORT_ITERATIONS = 10
+    dataset = pd.read_csv(file_path)["Amount"].tolist()
 
     for supp in range(SUPPORT_ITERATIONS):
         for client_batch_size in range(1000, 100000, 5000):
@@ -20,42 +26,11 @@ def client_eval():
             def histo_eval(hist_batch_values):
                 start_time = time.time()
                 client_handler = EdgeClient()
-                max_val = max(dataset)
-                min_val = min(dataset)
-
-                def get_create_histogram():
-                    num_bins = 1000
-                    return [0] * (num_bins + 2)
-
-                def update_histogram(histogram, sample):
-                    num_bins = 1000
-
-                    step = (max_val - min_val) / num_bins
-
-                    def get_index(val):
-                        if val < min_val:
-                            bin_index = 0
-                        elif val > max_val:
-                            bin_index = num_bins + 1
-                        else:
-                            # Subtract min_val to start from 0 and then divide by step to find the appropriate bin.
-                            # Add 1 to skip the bin reserved for <min_val
-                            bin_index = 1 + int((val - min_val) / step)
 
-                            # Handle edge case where value equals max_val. It should be placed in the max-step --> max bin.
-                            if bin_index == num_bins + 1:
-                                bin_index -= 1
+                hist = HistogramSketch(min(dataset), max(dataset), num_bins=1000)
+                hist.batch_update(hist_batch_values)
 
-                        return bin_index
-
-                    histogram[get_index(sample)] += 1
-
-                hist = get_create_histogram()
-
-                for val in hist_batch_values:
-                    update_histogram(hist, val)
-
-                client_handler.send_any_object(hist)
+                client_handler.send_any_object(hist.counts.tolist())
                 total_time = time.time() - start_time
                 print(f'Client Histogram with batch size: {len(hist_batch_values)} finished in: {total_time}')
                 client_handler.clear_queue_from_all_messages()
@@ -119,13 +94,18 @@ def client_eval():
     print("client eval finished")
 
 
-def plot_client_runtimes(t_digest_times: dict, streaming_times: dict, figure_name="figure"):
+def plot_client_runtimes(t_digest_times: dict, streaming_times: dict, figure_name="figure", other_times=None):
+    """
+    :param other_times: optional {label: {d: runtime}} of more methods to plot
+    """
     keys2, values2 = zip(*t_digest_times.items())
     keys3, values3 = zip(*streaming_times.items())
 
     # Plot ground truth
     plt.plot(keys2, values2, label='T-Digest-Merge')
     plt.plot(keys3, values3, label='T-Digest-Stream')
+    for label, times in (other_times or {}).items():
+        plt.plot(*zip(*times.items()), label=label)
 
     # Add labels, title, and legend
     plt.xlabel('d', fontsize=20)
@@ -141,6 +121,18 @@ def plot_client_runtimes(t_digest_times: dict, streaming_times: dict, figure_nam
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plot the client runtimes.")
+    parser.add_argument('--results', default=None,
+                        help="json of framework/benchmarks/runtime_suite.py to plot instead of the recorded runtimes")
+    args = parser.parse_args()
+    if args.results:
+        results = load_results(args.results)
+        plot_client_runtimes(runtime_series(results, 'client', 'T-Digest-Merge'),
+                             runtime_series(results, 'client', 'T-Digest-Stream'), "Runtimes_client",
+                             {method: runtime_series(results, 'client', method)
+                              for method in ('Histogram', 'Per-Value-Stream')})
+        sys.exit(0)
+
     client_Hist_runtimes_supported = {1000: 0.3093174934387207, 6000: 0.31273660659790037, 11000: 0.3203922748565674,
                                       16000: 0.3194575309753418, 21000: 0.32211325168609617, 26000: 0.3216524362564087,
                                       31000: 0.3316672325134277, 36000: 0.3289741039276123, 41000: 0.3352306365966797,
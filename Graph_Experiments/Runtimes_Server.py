@@ -1,10 +1,17 @@
 from matplotlib.ticker import FuncFormatter
+import argparse
 import time
+import sys
+import os
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 from queue_consumer_server.sqs_server import RedisHandler, SQSServer
 
+# the benchmark output readers live in the framework package.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'framework'))
+from benchmarks.runtime_results import load_results, runtime_series
+
 
 def plt_server_runtimes(phase_2_times, total_run_digest_times, total_run_streaming_times, figure_name='figure'):
     # we want to add phase 2 as a common phase, and then the total runtimes for the two methods
@@ -31,6 +38,17 @@ def plt_server_runtimes(phase_2_times, total_run_digest_times, total_run_streami
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plot the server runtimes.")
+    parser.add_argument('--results', default=None,
+                        help="json of framework/benchmarks/runtime_suite.py to plot instead of the recorded runtimes")
+    args = parser.parse_args()
+    if args.results:
+        results = load_results(args.results)
+        plt_server_runtimes(runtime_series(results, 'server', 'Computing-KS'),
+                            runtime_series(results, 'server', 'T-Digest-Merge'),
+                            runtime_series(results, 'server', 'T-Digest-Stream'), "Runtimes_server")
+        sys.exit(0)
+
     # these are the times from phase 1 if needed (different run so not 100% the same as the total below but with support=10)
     dist_aggregation_times_per_server_batch_size = {
         100000: 0.43591976165771484,
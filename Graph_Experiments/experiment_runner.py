@@ -0,0 +1,267 @@
+"""
+Runs the accuracy experiments (AccuracyTest_*.py) as a grid of (scenario, level, support iteration) tasks on a process
+pool. The datasets are loaded once and shared with the workers through shared memory, every task draws its samples
+from its own seed, and the results go to one parquet file instead of the appended text logs.
+The level is the drift percentage of sudden_drift and the batch index of linear_drift and network_requests.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+# the shared sketch code lives in the framework package.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'framework'))
+from sketches.ks import SortedSample, centroid_arrays, grid_ks
+from sketches.merging_digest import MergingDigest
+
+SCENARIOS = ('sudden_drift', 'linear_drift', 'network_requests')
+SUDDEN_DRIFT_PERCENTAGES = [0, 5, 10, 20, 50]
+LINEAR_DRIFT_BATCHES = 5
+RESULT_COLUMNS = ('scenario', 'level', 'support', 'seed', 'chunk_size', 'true_ks', 'digest_ks', 'error',
+                  'true_seconds', 'digest_seconds')
+
+# the shared arrays attached by a worker process, and their blocks which have to stay open while they are used.
+_worker_arrays = {}
+_worker_blocks = []
+
+
+class SharedArrays:
+    """
+    Float64 arrays copied once into shared memory blocks. Workers map the blocks with attach_arrays, so the datasets
+    are not pickled into every task.
+    """
+
+    def __init__(self, arrays):
+        self.blocks = []
+        self.specs = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array, dtype=np.float64)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=np.float64, buffer=block.buf)[:] = array
+            self.blocks.append(block)
+            self.specs[name] = (block.name, array.shape)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def attach_arrays(specs):
+    """
+    Pool initializer: map the shared arrays of SharedArrays.specs read-only into this process.
+    """
+    for name, (block_name, shape) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+        array.flags.writeable = False
+        _worker_blocks.append(block)
+        _worker_arrays[name] = array
+
+
+def read_csv_column(file_path, column):
+    table = pa_csv.read_csv(file_path, convert_options=pa_csv.ConvertOptions(include_columns=[column]))
+    return table.column(column).to_numpy().astype(np.float64)
+
+
+def load_arrays(scenario, data_dir):
+    """
+    The datasets of a scenario, as read by its AccuracyTest script.
+    """
+    if scenario == 'sudden_drift':
+        return {'train': read_csv_column(os.path.join(data_dir, 'fraud', 'fraudTrain.csv'), 'amt'),
+                'drift': read_csv_column(os.path.join(data_dir, 'fraud', 'PS_20174392719_1491204439457_log.csv'),
+                                         'amount')}
+    if scenario == 'linear_drift':
+        return {'amounts': read_csv_column(os.path.join(data_dir, 'fraud', 'real_world_creditcard_dep.csv'),
+                                           'Amount')}
+    if scenario == 'network_requests':
+        from sklearn.datasets import fetch_kddcup99
+        return {'src_bytes': fetch_kddcup99(as_frame=True).data['src_bytes'].to_numpy().astype(np.float64)}
+    raise Exception(f"Unsupported scenario: {scenario}")
+
+
+def synthetic_arrays(scenario, seed=0):
+    """
+    Stand-in datasets with the sizes of the real ones, to try the runner without the data directory.
+    """
+    rng = np.random.default_rng(seed)
+    if scenario == 'sudden_drift':
+        return {'train': rng.lognormal(4, 1.2, 1296675), 'drift': rng.lognormal(11, 1.5, 6362620)}
+    if scenario == 'linear_drift':
+        return {'amounts': rng.lognormal(3, 1.5, 284807)}
+    if scenario == 'network_requests':
+        return {'src_bytes': np.round(rng.lognormal(5, 2, 494021))}
+    raise Exception(f"Unsupported scenario: {scenario}")
+
+
+def task_seed(base_seed, scenario, support, level=None):
+    """
+    Deterministic seed of a task, independent of the pool size and of the order the tasks run in.
+    """
+    entropy = [base_seed, SCENARIOS.index(scenario), support]
+    if level is not None:
+        entropy.append(level)
+    return int(np.random.SeedSequence(entropy).generate_state(1)[0])
+
+
+def scenario_levels(scenario, arrays, chunk_size):
+    if scenario == 'sudden_drift':
+        return SUDDEN_DRIFT_PERCENTAGES
+    if scenario == 'linear_drift':
+        return list(range(LINEAR_DRIFT_BATCHES))
+    return list(range(int(np.ceil((len(arrays['src_bytes']) - chunk_size) / chunk_size))))
+
+
+def build_samples(scenario, level, support, chunk_size, base_seed):
+    """
+    The reference and test samples of a task, drawn from the shared arrays.
+    """
+    rng = np.random.default_rng(task_seed(base_seed, scenario, support, level))
+    if scenario == 'sudden_drift':
+        train, drift = _worker_arrays['train'], _worker_arrays['drift']
+        num_drifted = int(chunk_size * level / 100)
+        test = np.concatenate((rng.choice(train[chunk_size:], chunk_size - num_drifted, replace=False),
+                               rng.choice(drift, num_drifted, replace=False)))
+        return train[:chunk_size], test
+
+    if scenario == 'linear_drift':
+        # the dataset of a support iteration is shared by its batches, so it is drawn from the support seed only.
+        amounts = _worker_arrays['amounts']
+        dataset_rng = np.random.default_rng(task_seed(base_seed, scenario, support))
+        dataset = np.concatenate((amounts, dataset_rng.choice(amounts, 600000 - len(amounts))))
+        dataset_rng.shuffle(dataset)
+        start = chunk_size * (level + 1)
+        test = dataset[start:start + chunk_size]
+        return dataset[:chunk_size], test + level * (level - 0.5) * rng.normal(3.5, 1, len(test))
+
+    src_bytes = _worker_arrays['src_bytes']
+    start = chunk_size * (level + 1)
+    return src_bytes[:chunk_size], src_bytes[start:start + chunk_size]
+
+
+def digest_ks(ref_data, test_data, grid_strategy, batch_size=20000):
+    """
+    The KS statistic of T-DIGEST-MERGE (test digests of batch_size values merged), as in utils.get_digest_ks.
+    """
+    reference_digest = MergingDigest()
+    reference_digest.batch_update(ref_data)
+    test_digest = MergingDigest()
+    for i in range(0, len(test_data), batch_size):
+        batch_digest = MergingDigest()
+        batch_digest.batch_update(test_data[i:i + batch_size])
+        test_digest.merge(batch_digest)
+    ref_means, ref_counts = centroid_arrays(reference_digest)
+    test_means, test_counts = centroid_arrays(test_digest)
+    ks_value, _ = grid_ks(ref_means, ref_counts, test_means, test_counts, grid_strategy, ref_points=ref_data)
+    return ks_value
+
+
+def run_task(task):
+    scenario, level, support, chunk_size, base_seed, grid_strategy = task
+    ref_data, test_data = build_samples(scenario, level, support, chunk_size, base_seed)
+
+    start_time = time.perf_counter()
+    true_ks, _ = SortedSample(ref_data).ks(test_data)
+    true_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    digest_value = digest_ks(ref_data, test_data, grid_strategy)
+    digest_seconds = time.perf_counter() - start_time
+    return (scenario, level, support, task_seed(base_seed, scenario, support, level), chunk_size, true_ks,
+            digest_value, digest_value - true_ks, true_seconds, digest_seconds)
+
+
+def run_experiments(scenarios, arrays, chunk_sizes, supports, workers=None, base_seed=0,
+                    grid_strategy='reference_points'):
+    """
+    Run every (scenario, level, support) task on a process pool.
+    :param arrays: the datasets of all the scenarios, see load_arrays
+    :param chunk_sizes: {scenario: reference and test sample size}
+    :param supports: {scenario: number of support iterations}
+    :return: the results as {column: list of values}, in task order
+    """
+    tasks = [(scenario, level, support, chunk_sizes[scenario], base_seed, grid_strategy)
+             for scenario in scenarios
+             for level in scenario_levels(scenario, arrays, chunk_sizes[scenario])
+             for support in range(supports[scenario])]
+    with SharedArrays(arrays) as shared:
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_arrays,
+                                 initargs=(shared.specs,)) as executor:
+            rows = list(executor.map(run_task, tasks))
+    return {column: [row[index] for row in rows] for index, column in enumerate(RESULT_COLUMNS)}
+
+
+def save_results(results, file_path):
+    pq.write_table(pa.table(results), file_path)
+
+
+def load_results(file_path):
+    return pq.read_table(file_path).to_pydict()
+
+
+def grouped_errors(results, scenario, absolute=False):
+    """
+    The digest errors of a scenario per level, in the layout the plot functions use.
+    :return: (levels, [errors of every support iteration for each level])
+    """
+    by_level = {}
+    for row_scenario, level, error in zip(results['scenario'], results['level'], results['error']):
+        if row_scenario == scenario:
+            by_level.setdefault(level, []).append(abs(error) if absolute else error)
+    levels = sorted(by_level)
+    return levels, [by_level[level] for level in levels]
+
+
+def ks_range_labels(results, scenario):
+    """
+    "[min,max]" of the true KS of every level of a scenario, the labels of the linear drift plot.
+    """
+    by_level = {}
+    for row_scenario, level, true_ks in zip(results['scenario'], results['level'], results['true_ks']):
+        if row_scenario == scenario:
+            by_level.setdefault(level, []).append(true_ks)
+    return [f"[{min(by_level[level]):.2f},{max(by_level[level]):.2f}]" for level in sorted(by_level)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the accuracy experiments on a process pool.")
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument('--data-dir', default='../data')
+    parser.add_argument('--synthetic', action='store_true', help="use stand-in data instead of --data-dir")
+    parser.add_argument('--supports', type=int, default=15, help="support iterations of the sampled scenarios")
+    parser.add_argument('--chunk-scale', type=float, default=1., help="scale of the experiments' chunk sizes")
+    parser.add_argument('--workers', type=int, default=None, help="processes, default one per core")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--grid-strategy', default='reference_points', help="see sketches.ks.GRID_STRATEGIES")
+    parser.add_argument('--output', default='experiment_results/accuracy_results.parquet')
+    args = parser.parse_args()
+
+    scenario_arrays = {}
+    for name in args.scenarios:
+        scenario_arrays.update(synthetic_arrays(name, args.seed) if args.synthetic else load_arrays(name, args.data_dir))
+    sizes = {name: int(size * args.chunk_scale) for name, size in
+             (('sudden_drift', 500000), ('linear_drift', 100000), ('network_requests', 50000))}
+    # the network requests test is not sampled, one pass over the chunks.
+    support_counts = {name: 1 if name == 'network_requests' else args.supports for name in args.scenarios}
+
+    start = time.time()
+    experiment_results = run_experiments(args.scenarios, scenario_arrays, sizes, support_counts, args.workers,
+                                         args.seed, args.grid_strategy)
+    save_results(experiment_results, args.output)
+    print(f"{len(experiment_results['error'])} tasks in {time.time() - start:.1f}s, results in {args.output}")
+    for name in args.scenarios:
+        for level, errors in zip(*grouped_errors(experiment_results, name, absolute=True)):
+            print(f"{name} level {level}: mean |error| {np.mean(errors):.5f}, max |error| {np.max(errors):.5f}")
@@ -1,63 +1,44 @@
-from tdigest import TDigest
-from scipy.stats import ks_2samp
 import matplotlib.pyplot as plt
 import time
+import sys
+import os
 
-plt.figure(figsize=(8, 6), dpi=300)
-
-
-def get_original_ks(ref_data, t_data):
-    ks_score, _ = ks_2samp(ref_data, t_data, method='exact')
-    return ks_score
-
-
-def get_bins_ks(ref_data, t_data):
-    max_val = max(ref_data)
-    min_val = min(ref_data)
+# the shared sketch code lives in the framework package.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'framework'))
+from sketches.ks import centroid_arrays, digest_ks, grid_ks, SortedSample
+from sketches.histogram import HistogramSketch
+from sketches.merging_digest import MergingDigest
 
-    num_bins = 1000
-
-    step = (max_val - min_val) / num_bins
-
-    def get_index(val):
-        if val < min_val:
-            bin_index = 0
-        elif val > max_val:
-            bin_index = num_bins + 1
-        else:
-            # Subtract min_val to start from 0 and then divide by step to find the appropriate bin.
-            # Add 1 to skip the bin reserved for <min_val
-            bin_index = 1 + int((val - min_val) / step)
+plt.figure(figsize=(8, 6), dpi=300)
 
-            # Handle edge case where value equals max_val. It should be placed in the max-step --> max bin.
-            if bin_index == num_bins + 1:
-                bin_index -= 1
 
-        return bin_index
+# the sorted reference of every reference dataset, so the support iterations sort it once.
+_sorted_references = {}
 
-    ref_hist = [0] * (num_bins + 2)
-    new_hist = [0] * (num_bins + 2)
 
-    for i in ref_data:
-        ref_hist[get_index(i)] += 1
+def get_sorted_reference(ref_data):
+    cached = _sorted_references.get(id(ref_data))
+    if cached is None or cached[0] is not ref_data:
+        cached = (ref_data, SortedSample(ref_data))
+        _sorted_references[id(ref_data)] = cached
+    return cached[1]
 
-    for i in t_data:
-        new_hist[get_index(i)] += 1
 
-    max_count_diff = 0
-    new_count = 0
-    ref_count = 0
+def get_original_ks(ref_data, t_data):
+    """
+    The ground truth KS statistic of the raw data, the same value as ks_2samp(ref_data, t_data).statistic
+    """
+    ks_score, _ = get_sorted_reference(ref_data).ks(t_data)
+    return ks_score
 
-    # to align ref and test sizes.
-    ref_to_test_ratio = (len(ref_data) / len(t_data))
 
-    for i in range(len(new_hist)):
-        new_count += new_hist[i] * ref_to_test_ratio
-        ref_count += ref_hist[i]
-        if abs(ref_count - new_count) > max_count_diff:
-            max_count_diff = abs(ref_count - new_count)
+def get_bins_ks(ref_data, t_data):
+    ref_hist = HistogramSketch.from_reference(ref_data, num_bins=1000)
+    new_hist = ref_hist.empty_copy()
+    new_hist.batch_update(t_data)
 
-    return max_count_diff / len(ref_data)
+    ks_value, _ = new_hist.ks(ref_hist)
+    return ks_value
 
 
 def batch_generator(data):
@@ -66,15 +47,16 @@ def batch_generator(data):
         yield data[i:i + 20000]
 
 
-def get_digest_ks(ref_data, t_data):
+def get_digest_ks(ref_data, t_data, grid_strategy='reference_points'):
     """
     We calculate the KS value in case the T-DIGEST-MERGE method is used
     :param ref_data: the reference data to be compared to
     :param t_data:  the new sampled data that we want to digest
+    :param grid_strategy: the points the CDFs are compared at, one of sketches.ks.GRID_STRATEGIES
     :return: KS statistic according to T-DIGEST-MERGE
     """
-    reference_digest = TDigest()
-    test_digest = TDigest()
+    reference_digest = MergingDigest()
+    test_digest = MergingDigest()
 
     start_time = time.time()
     reference_digest.batch_update(ref_data[:1])
@@ -82,26 +64,24 @@ def get_digest_ks(ref_data, t_data):
 
     start_time = time.time()
     for batch in batch_generator(t_data):
-        temp_digest = TDigest()
+        temp_digest = MergingDigest()
         temp_digest.batch_update(batch)
-        test_digest.update_from_dict(temp_digest.to_dict())
+        test_digest.merge(temp_digest)
     print(f"test_digest.batch_update(ref_data) took:{time.time() - start_time} seconds to run.")
 
     start_time = time.time()
 
-    max_cdf = 0
-    for item in ref_data:
-        curr = abs(reference_digest.cdf(item) - test_digest.cdf(item))
-        if curr > max_cdf:
-            max_cdf = curr
+    ref_means, ref_counts = centroid_arrays(reference_digest)
+    test_means, test_counts = centroid_arrays(test_digest)
+    max_cdf, _ = grid_ks(ref_means, ref_counts, test_means, test_counts, grid_strategy, ref_points=ref_data)
     print(f"checking the loop took:{time.time() - start_time} seconds to run.")
 
     return max_cdf
 
 
 def get_digest_ks_run_times(ref_data, t_data):
-    reference_digest = TDigest()
-    test_digest = TDigest()
+    reference_digest = MergingDigest()
+    test_digest = MergingDigest()
 
     start_time = time.time()
     reference_digest.batch_update(ref_data)
@@ -112,11 +92,7 @@ def get_digest_ks_run_times(ref_data, t_data):
     print(f"test_digest.batch_update(ref_data) took:{client_time} seconds to run.")
     start_time = time.time()
 
-    max_cdf = 0
-    for item in ref_data:
-        curr = abs(reference_digest.cdf(item) - test_digest.cdf(item))
-        if curr > max_cdf:
-            max_cdf = curr
+    digest_ks(reference_digest, test_digest, ref_data)
     loop_time = time.time() - start_time
     print(f"checking the loop took:{loop_time} seconds to run.")
 
@@ -1,8 +1,11 @@
+import argparse
 import threading
 import random
 import time
 from edge_client.client import EdgeClient
 from queue_consumer_server.sqs_server import SQSServer, RedisHandler
+from transport.clients import TRANSPORTS, create_sqs_client
+from transport.socket_broker import DEFAULT_BROKER_ADDRESS, SocketBroker
 
 
 # configurations  for localstack run:
@@ -10,38 +13,75 @@ from queue_consumer_server.sqs_server import SQSServer, RedisHandler
 # 2. aws --endpoint=http://localhost:4566 sqs create-queue --queue-name local-queue
 # 3. copy queue url to both client and server configs
 # 4. Run Redis and add the credentials to RedisHandler code
+# without localstack, run with --transport local (one process) or --transport socket (a broker on this machine,
+# --start-broker to serve it from this process), and --fakeredis without a Redis server.
 
 
-def run_client(client: EdgeClient):
-    for _ in range(100):
+def run_client(client: EdgeClient, rounds, interval):
+    for _ in range(rounds):
         random_values = [random.randint(1, 100) for _ in range(10)]  # Generate 10 random numbers
         client.update_digest_with_vals(random_values)
         client.send_t_digest()
-        print("client finished sampling random 100 and sending to server")
-        time.sleep(1)
+        print(f"client finished sampling random {len(random_values)} and sending to server")
+        time.sleep(interval)
 
 
 # Function for running the server
-def run_server(server: SQSServer):
-    while True:
+def run_server(server: SQSServer, stop_event):
+    while not stop_event.is_set():
         server.poll_messages()
         server.print_combined_digest_dict()
 
 
-# Create server and 3 client instances
-server = SQSServer()
-clients = [EdgeClient() for _ in range(3)]
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End to end simulation of edge clients and the server.")
+    parser.add_argument('--transport', default=None, choices=TRANSPORTS,
+                        help="queue transport, the one of the configuration files when not given")
+    parser.add_argument('--broker-address', default=DEFAULT_BROKER_ADDRESS, help="address of the socket transport")
+    parser.add_argument('--start-broker', action='store_true', help="serve the socket broker from this process")
+    parser.add_argument('--fakeredis', action='store_true', help="in-process fakeredis instead of a Redis server")
+    parser.add_argument('--clients', type=int, default=3)
+    parser.add_argument('--rounds', type=int, default=100, help="digests sent by every client")
+    parser.add_argument('--interval', type=float, default=1, help="seconds between the sends of a client")
+    args = parser.parse_args()
 
-# Start server thread
-server_thread = threading.Thread(target=run_server, args=(server,))
-server_thread.start()
+    broker = SocketBroker(args.broker_address).start() if args.start_broker else None
 
-time.sleep(2)
+    def new_sqs():
+        # one queue client per instance, None leaves it to the configuration files.
+        if args.transport is None:
+            return None
+        return create_sqs_client(dict(EdgeClient.read_config('client_configs.json'), transport=args.transport,
+                                      broker_address=args.broker_address))
 
-# Start client threads
-client_threads = []
-for client in clients:
-    thread = threading.Thread(target=run_client, args=(client,))
-    client_threads.append(thread)
-    thread.start()
+    redis_client = None
+    if args.fakeredis:
+        import fakeredis
+        redis_client = fakeredis.FakeRedis()
 
+    # Create server and client instances
+    server = SQSServer(sqs_client=new_sqs(), redis_client=redis_client)
+    clients = [EdgeClient(sqs_client=new_sqs()) for _ in range(args.clients)]
+    if args.transport and args.transport != 'sqs':
+        server.configs = dict(server.configs, wait_time_seconds=1)
+
+    # Start server thread
+    stop_server = threading.Event()
+    server_thread = threading.Thread(target=run_server, args=(server, stop_server))
+    server_thread.start()
+
+    time.sleep(2)
+
+    # Start client threads
+    client_threads = []
+    for client in clients:
+        thread = threading.Thread(target=run_client, args=(client, args.rounds, args.interval))
+        client_threads.append(thread)
+        thread.start()
+
+    for thread in client_threads:
+        thread.join()
+    stop_server.set()
+    server_thread.join()
+    if broker is not None:
+        broker.stop()
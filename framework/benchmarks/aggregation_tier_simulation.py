@@ -0,0 +1,96 @@
+import argparse
+import contextlib
+import io
+import json
+import time
+import fakeredis
+from queue_consumer_server.sqs_server import SQSServer
+from regional_aggregator.aggregator import RegionalAggregator
+from transport.local_queue import LocalBroker, LocalSQS
+from benchmarks.polling_benchmark import make_bodies
+from sketches.codec import item_count_attributes
+
+
+def send_device_digests(sqs, bodies, devices, messages_per_device, items_per_message):
+    for device in range(devices):
+        for i in range(messages_per_device):
+            sqs.send_message(QueueUrl='local', MessageBody=bodies[(device + i) % len(bodies)],
+                             MessageAttributes=item_count_attributes(items_per_message))
+
+
+def drain_server(server_sqs):
+    """
+    Consume the server queue and measure the server side cost.
+    """
+    server = SQSServer(sqs_client=server_sqs, redis_client=fakeredis.FakeRedis())
+    server.configs = dict(server.configs, queue_url='local', wait_time_seconds=0)
+    redis_updates = []
+    update_digest = server.redis_handler.update_digest
+    server.redis_handler.update_digest = lambda *args, **kwargs: redis_updates.append(update_digest(*args, **kwargs))
+
+    messages = server_sqs.pending()
+    start_time = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        while server_sqs.pending():
+            server.poll_messages()
+    return messages, len(redis_updates), time.time() - start_time
+
+
+def simulate(devices, region_size, flush_message_count, bodies, messages_per_device, items_per_message):
+    results = []
+
+    # every device sends to the server queue directly.
+    server_sqs = LocalSQS()
+    send_device_digests(server_sqs, bodies, devices, messages_per_device, items_per_message)
+    messages, updates, seconds = drain_server(server_sqs)
+    results.append({'mode': 'direct', 'devices': devices, 'server_messages': messages, 'redis_updates': updates,
+                    'server_seconds': seconds, 'aggregator_seconds': 0.})
+
+    # devices send to their regional aggregator, which forwards to the server queue. The regional queues and the
+    # server queue are queues of one LocalBroker, as with the "local" transport.
+    broker = LocalBroker()
+    server_sqs = broker.queue('local')
+    aggregator_seconds = 0.
+    for first_device in range(0, devices, region_size):
+        aggregator = RegionalAggregator(sqs_client=broker)
+        regional_url = f'regional-{first_device}'
+        aggregator.configs = dict(aggregator.configs, input_queue_url=regional_url, output_queue_url='local',
+                                  wait_time_seconds=0)
+        aggregator.flush_message_count = flush_message_count
+        regional_sqs = broker.queue(regional_url)
+        send_device_digests(regional_sqs, bodies, min(region_size, devices - first_device), messages_per_device,
+                            items_per_message)
+        start_time = time.time()
+        while regional_sqs.pending() > len(aggregator.pending_receipt_handles):
+            aggregator.poll_messages()
+        aggregator.flush()
+        aggregator_seconds += time.time() - start_time
+    messages, updates, seconds = drain_server(server_sqs)
+    results.append({'mode': 'tiered', 'devices': devices, 'server_messages': messages, 'redis_updates': updates,
+                    'server_seconds': seconds, 'aggregator_seconds': aggregator_seconds})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Server load with and without the regional aggregation tier.")
+    parser.add_argument('--devices', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--region-size', type=int, default=100, help="devices per regional aggregator")
+    parser.add_argument('--flush-message-count', type=int, default=100, help="aggregator fan-in per forwarded digest")
+    parser.add_argument('--messages-per-device', type=int, default=2)
+    parser.add_argument('--values-per-digest', type=int, default=2000)
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    message_bodies = make_bodies(20, args.values_per_digest)
+    all_results = []
+    for num_devices in args.devices:
+        for result in simulate(num_devices, args.region_size, args.flush_message_count, message_bodies,
+                               args.messages_per_device, args.values_per_digest):
+            all_results.append(result)
+            print(f"{num_devices:6d} devices - {result['mode']:6s}: server received {result['server_messages']:6d} "
+                  f"messages, {result['redis_updates']:5d} Redis merges, server {result['server_seconds']:.3f}s, "
+                  f"aggregators {result['aggregator_seconds']:.3f}s")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(all_results, file, indent=2)
@@ -0,0 +1,107 @@
+"""
+Checks that the asyncio path (AsyncEdgeClient and AsyncSQSServer) computes the same KS statistic as the synchronous one
+(EdgeClient and SQSServer): both send the same value batches through the in-process queue into fakeredis, and the
+statistic of the aggregated sketch is compared for every sketch type and Redis handler. Exits with an AssertionError
+on the first mismatch.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import fakeredis
+from fakeredis import aioredis
+import numpy as np
+from edge_client.async_client import AsyncEdgeClient
+from edge_client.client import EdgeClient
+from queue_consumer_server.async_server import AsyncSQSServer
+from queue_consumer_server.reference_artifact import ReferenceArtifact
+from queue_consumer_server.sqs_server import SQSServer
+from transport.local_queue import AsyncLocalSQS, LocalSQS
+
+# (sketch_type, atomic_redis_merge)
+CASES = [('tdigest', False), ('tdigest', True), ('histogram', False)]
+
+
+def write_configs(work_dir, reference_data, sketch_type, atomic_redis_merge):
+    """
+    :return: the server and the client configuration files of one case
+    """
+    artifact_path = os.path.join(work_dir, 'reference.ksref')
+    ReferenceArtifact.from_data(reference_data, grid_size=2000).save(artifact_path)
+    server_configs = SQSServer.read_config('server_configs.json')
+    server_configs.update(reference_artifact=artifact_path, sketch_type=sketch_type,
+                          atomic_redis_merge=atomic_redis_merge, queue_url='local', wait_time_seconds=0,
+                          monitors=[], window={})
+    client_configs = EdgeClient.read_config('client_configs.json')
+    # the clients take their histogram edges from the server's reference artifact.
+    client_configs.update(reference_artifact=artifact_path, histogram_min=None, histogram_max=None,
+                          sketch_type=sketch_type, queue_url='local',
+                          histogram_bins=server_configs['histogram_bins'], auto_flush=False, send_coalescing=False)
+    config_files = []
+    for name, configs in (('server', server_configs), ('client', client_configs)):
+        config_files.append(os.path.join(work_dir, f'{name}_configs.json'))
+        with open(config_files[-1], 'w') as file:
+            json.dump(configs, file)
+    return config_files
+
+
+def run_sync(server_config, client_config, batches):
+    sqs = LocalSQS()
+    server = SQSServer(server_config, aggregation_size=float('inf'), sqs_client=sqs,
+                       redis_client=fakeredis.FakeRedis())
+    client = EdgeClient(client_config, sqs_client=sqs)
+    for batch in batches:
+        client.update_digest_with_vals(batch)
+        client.send_t_digest()
+    while sqs.pending():
+        server.poll_messages()
+    return server.compute_ks()
+
+
+async def run_async(server_config, client_config, batches):
+    sqs = AsyncLocalSQS()
+    server = AsyncSQSServer(server_config, aggregation_size=float('inf'), sqs_client=sqs,
+                            redis_client=aioredis.FakeRedis())
+    async with server, AsyncEdgeClient(client_config, sqs_client=sqs) as client:
+        for batch in batches:
+            client.update_digest_with_vals(batch)
+            await client.send_t_digest()
+        while sqs.pending():
+            await server.poll_messages()
+        return await server.compute_ks()
+
+
+def check(num_messages=50, values_per_message=2000, drift=0.2, seed=0):
+    rng = np.random.default_rng(seed)
+    reference_data = rng.lognormal(3, 1, 100000)
+    batches = [rng.lognormal(3 + drift, 1, values_per_message) for _ in range(num_messages)]
+    results = []
+    for sketch_type, atomic_redis_merge in CASES:
+        with tempfile.TemporaryDirectory() as work_dir:
+            server_config, client_config = write_configs(work_dir, reference_data, sketch_type, atomic_redis_merge)
+            # the servers print the aggregation count of every message.
+            with contextlib.redirect_stdout(io.StringIO()):
+                sync_ks, _ = run_sync(server_config, client_config, batches)
+                async_ks, _ = asyncio.run(run_async(server_config, client_config, batches))
+        assert sync_ks > 0, f"{sketch_type}: no drift measured, the sketches were not aggregated"
+        assert np.isclose(sync_ks, async_ks, rtol=0, atol=1e-12), \
+            f"{sketch_type} (atomic merge: {atomic_redis_merge}): sync KS {sync_ks} != async KS {async_ks}"
+        results.append({'sketch_type': sketch_type, 'atomic_redis_merge': atomic_redis_merge,
+                        'sync_ks': float(sync_ks), 'async_ks': float(async_ks)})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check that the asyncio client and server compute the same KS "
+                                                 "statistic as the synchronous ones.")
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--values-per-message', type=int, default=2000)
+    parser.add_argument('--drift', type=float, default=0.2, help="shift of the log-mean of the sent values")
+    args = parser.parse_args()
+
+    for result in check(args.messages, args.values_per_message, args.drift):
+        print(f"{result['sketch_type']:9s} atomic merge {str(result['atomic_redis_merge']):5s}: "
+              f"sync KS {result['sync_ks']:.6f}, async KS {result['async_ks']:.6f}")
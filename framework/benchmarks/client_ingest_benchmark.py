@@ -0,0 +1,104 @@
+import argparse
+import json
+import threading
+import time
+import numpy as np
+from edge_client.client import EdgeClient
+from transport.local_queue import LocalSQS
+from sketches.codec import encode_body
+
+# bin edges of the histogram runs, about the 0 - 99.99% range of the lognormal(3, 1) values the producers send.
+HISTOGRAM_RANGE = (0., 1000.)
+
+
+class SingleLockClient(EdgeClient):
+    """
+    The previous EdgeClient behaviour: one digest behind one lock, held across the send_message round trip.
+    """
+
+    def __init__(self, config_file='client_configs.json', sqs_client=None):
+        super().__init__(config_file, sqs_client)
+        self.digest = self.new_sketch()
+        self.lock = threading.Lock()
+
+    def update_digest_with_vals(self, new_values: list):
+        with self.lock:
+            self.digest.batch_update(new_values)
+
+    def send_t_digest(self):
+        with self.lock:
+            response = self.sqs.send_message(
+                QueueUrl=self.configs['queue_url'],
+                MessageBody=encode_body(self.digest, self.configs.get('digest_format', 'json'),
+                                        self.configs.get('digest_precision', 'float64'))
+            )
+            self.digest = self.new_sketch()
+            return response
+
+
+def run(client_class, num_threads, duration, batch_size, flush_interval, latency, sketch_type):
+    sqs = LocalSQS(latency=latency)
+    client = client_class(sqs_client=sqs)
+    client.configs = dict(client.configs, queue_url='local', sketch_type=sketch_type,
+                          histogram_min=HISTOGRAM_RANGE[0], histogram_max=HISTOGRAM_RANGE[1])
+    if isinstance(client, SingleLockClient):
+        client.digest = client.new_sketch()
+
+    stop_event = threading.Event()
+    ingested = [0] * num_threads
+    # longest time a single update_digest_with_vals call took, a stall means it waited on a send.
+    worst_call = [0.] * num_threads
+
+    def produce(index):
+        rng = np.random.default_rng(index)
+        batch = rng.lognormal(3, 1, batch_size).tolist()
+        while not stop_event.is_set():
+            call_start = time.perf_counter()
+            client.update_digest_with_vals(batch)
+            worst_call[index] = max(worst_call[index], time.perf_counter() - call_start)
+            ingested[index] += batch_size
+
+    def flush():
+        while not stop_event.wait(flush_interval):
+            client.send_t_digest()
+
+    threads = [threading.Thread(target=produce, args=(i,)) for i in range(num_threads)]
+    threads.append(threading.Thread(target=flush))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+
+    return {'client': client_class.__name__, 'threads': num_threads, 'sketch_type': sketch_type,
+            'latency': latency, 'values_per_second': sum(ingested) / duration,
+            'worst_update_seconds': max(worst_call), 'digests_sent': sqs.calls}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="EdgeClient ingestion throughput with concurrent producers while "
+                                                 "digests are being sent.")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--duration', type=float, default=3.0, help="seconds per run")
+    parser.add_argument('--batch-size', type=int, default=100, help="values per update_digest_with_vals call")
+    parser.add_argument('--flush-interval', type=float, default=0.2, help="seconds between send_t_digest calls")
+    parser.add_argument('--latency', type=float, default=0.05, help="simulated send_message round trip, in seconds")
+    parser.add_argument('--sketch-types', nargs='+', default=['tdigest', 'histogram'])
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    results = []
+    for sketch in args.sketch_types:
+        for threads_count in args.threads:
+            for client_type in (SingleLockClient, EdgeClient):
+                result = run(client_type, threads_count, args.duration, args.batch_size, args.flush_interval,
+                             args.latency, sketch)
+                results.append(result)
+                print(f"{sketch:9s} {threads_count:2d} threads - {client_type.__name__:16s}: "
+                      f"{result['values_per_second']:10.0f} values/s, worst update "
+                      f"{result['worst_update_seconds'] * 1000:6.1f}ms")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
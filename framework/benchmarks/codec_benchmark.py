@@ -0,0 +1,57 @@
+import argparse
+import json
+import time
+import numpy as np
+from tdigest import TDigest
+from sketches.codec import encode_body, decode_body
+
+
+def time_call(func, repeats):
+    start_time = time.time()
+    for _ in range(repeats):
+        func()
+    return (time.time() - start_time) / repeats
+
+
+def benchmark_digest(digest, repeats):
+    """
+    Payload size and encode/decode time of one digest for the JSON path and the binary codec.
+    Decoding the JSON path includes update_from_dict, as the server has to rebuild the digest from it.
+    """
+    results = []
+    for name, digest_format, precision in (('json', 'json', 'float64'), ('binary-f64', 'binary', 'float64'),
+                                           ('binary-f32', 'binary', 'float32')):
+        body = encode_body(digest, digest_format, precision)
+        encode_time = time_call(lambda: encode_body(digest, digest_format, precision), repeats)
+        if digest_format == 'json':
+            decode_time = time_call(lambda: TDigest().update_from_dict(decode_body(body)), repeats)
+        else:
+            decode_time = time_call(lambda: decode_body(body), repeats)
+        results.append({'format': name, 'centroids': len(digest), 'bytes': len(body),
+                        'encode_per_second': 1 / encode_time, 'decode_per_second': 1 / decode_time})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Digest wire format: payload size and encode/decode throughput.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 20000, 100000],
+                        help="number of values summarized by each digest")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    all_results = []
+    for size in args.sizes:
+        test_digest = TDigest()
+        test_digest.batch_update(rng.lognormal(3, 1, size).tolist())
+        for result in benchmark_digest(test_digest, args.repeats):
+            result['values'] = size
+            all_results.append(result)
+            print(f"{size:7d} values, {result['centroids']:5d} centroids - {result['format']:10s}: "
+                  f"{result['bytes']:7d} bytes, encode {result['encode_per_second']:9.1f}/s, "
+                  f"decode {result['decode_per_second']:9.1f}/s")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(all_results, file, indent=2)
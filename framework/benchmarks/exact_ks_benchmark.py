@@ -0,0 +1,70 @@
+import argparse
+import json
+import random
+import time
+import warnings
+import numpy as np
+from scipy.stats import ks_2samp
+from sketches.ks import SortedSample
+
+
+def make_data(train_size, drift_size, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.lognormal(3, 1, train_size).tolist(), rng.lognormal(4, 1.5, drift_size).tolist()
+
+
+def run(train_list, drift_list, chunk_size, percentages, iterations, seed=0):
+    """
+    The ground truth KS of the accuracy experiments on the same test sets: ks_2samp(method='exact') on Python lists,
+    as the experiments called it, against a SortedSample of the reference, sorted once.
+    """
+    random.seed(seed)
+    ref_data = train_list[:chunk_size]
+    baseline_time = fast_time = 0.
+    max_difference = 0.
+    tests = 0
+
+    start_time = time.perf_counter()
+    sorted_ref = SortedSample(ref_data)
+    fast_time += time.perf_counter() - start_time
+    for new_percentage in percentages:
+        for _ in range(iterations):
+            test_data = random.sample(train_list[chunk_size:], int(chunk_size * (0.01 * (100 - new_percentage))))
+            test_data = test_data + random.sample(drift_list, int(chunk_size * new_percentage / 100))
+
+            start_time = time.perf_counter()
+            with warnings.catch_warnings():
+                # samples this large make scipy fall back from 'exact' to 'asymp' with a warning.
+                warnings.simplefilter('ignore', RuntimeWarning)
+                baseline_ks = ks_2samp(ref_data, test_data, method='exact').statistic
+            baseline_time += time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            fast_ks, _ = sorted_ref.ks(test_data)
+            fast_time += time.perf_counter() - start_time
+            max_difference = max(max_difference, abs(baseline_ks - fast_ks))
+            tests += 1
+    return {'chunk_size': chunk_size, 'tests': tests, 'baseline_seconds': baseline_time, 'fast_seconds': fast_time,
+            'speedup': baseline_time / fast_time, 'max_abs_difference': max_difference}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ground truth KS: ks_2samp against a sorted reference.")
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--percentages', type=int, nargs='+', default=[0, 5, 10, 20, 50])
+    parser.add_argument('--iterations', type=int, default=3, help="test sets per percentage")
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.chunk_sizes:
+        train, drift = make_data(3 * size, size)
+        result = run(train, drift, size, args.percentages, args.iterations)
+        results.append(result)
+        print(f"chunk {size:7d}: ks_2samp {result['baseline_seconds']:8.3f}s, SortedSample "
+              f"{result['fast_seconds']:7.3f}s over {result['tests']} tests, speedup {result['speedup']:5.1f}x, "
+              f"max |difference| {result['max_abs_difference']:.2e}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,97 @@
+import argparse
+import csv
+import json
+import time
+import numpy as np
+from scipy.stats import ks_2samp
+from tdigest import TDigest
+from sketches.codec import decode_body, encode_body
+from sketches.ks import GRID_STRATEGIES, grid_ks
+
+
+def read_column(csv_path, column):
+    with open(csv_path, newline='') as file:
+        return np.array([float(row[column]) for row in csv.DictReader(file)])
+
+
+def make_digest(data, batch_size=20000):
+    """
+    Digest merged from batches of batch_size values (T-DIGEST-MERGE d=20k), decoded the way the server receives it.
+    """
+    digest = TDigest()
+    for i in range(0, len(data), batch_size):
+        batch_digest = TDigest()
+        batch_digest.batch_update(data[i:i + batch_size].tolist())
+        digest.update_from_dict(batch_digest.to_dict())
+    return decode_body(encode_body(digest, 'binary'))
+
+
+def run(ref_data, train_data, drift_data, percentages, iterations, grid_size, seed=0):
+    """
+    The sudden drift accuracy experiment: test sets mixing new_percentage% of the drifted data into the training data,
+    the KS statistic of every grid strategy against the exact KS of the raw data.
+    """
+    rng = np.random.default_rng(seed)
+    reference = make_digest(ref_data)
+    chunk_size = len(ref_data)
+    results = {strategy: {'errors': [], 'seconds': 0.} for strategy in GRID_STRATEGIES}
+    for new_percentage in percentages:
+        num_drifted = int(chunk_size * new_percentage / 100)
+        for _ in range(iterations):
+            test_data = np.concatenate((rng.choice(train_data, chunk_size - num_drifted, replace=False),
+                                        rng.choice(drift_data, num_drifted)))
+            true_ks = ks_2samp(ref_data, test_data).statistic
+            test = make_digest(test_data)
+            for strategy in GRID_STRATEGIES:
+                start_time = time.perf_counter()
+                digest_ks, _ = grid_ks(reference['means'], reference['counts'], test['means'], test['counts'],
+                                       strategy, ref_points=ref_data, grid_size=grid_size)
+                results[strategy]['seconds'] += time.perf_counter() - start_time
+                results[strategy]['errors'].append(abs(digest_ks - true_ks))
+
+    summary = []
+    for strategy, result in results.items():
+        errors = np.array(result['errors'])
+        summary.append({'strategy': strategy, 'grid_size': grid_size, 'tests': len(errors),
+                        'ms_per_test': 1000 * result['seconds'] / len(errors),
+                        'mean_abs_error': float(errors.mean()), 'max_abs_error': float(errors.max())})
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="KS accuracy against evaluation time of the digest grid strategies.")
+    parser.add_argument('--train-csv', default=None, help="csv of the training data, synthetic data when not given")
+    parser.add_argument('--drift-csv', default=None, help="csv of the drifted data")
+    parser.add_argument('--train-column', default='amt')
+    parser.add_argument('--drift-column', default='amount')
+    parser.add_argument('--chunk-size', type=int, default=100000, help="size of the reference and of the test sets")
+    parser.add_argument('--percentages', type=int, nargs='+', default=[0, 5, 10, 20, 50])
+    parser.add_argument('--iterations', type=int, default=3, help="test sets per percentage")
+    parser.add_argument('--grid-size', type=int, default=1000, help="grid size of 'quantiles' and 'adaptive'")
+    parser.add_argument('--error-bound', type=float, default=0.003, help="largest acceptable max |KS error|")
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    if args.train_csv:
+        train = read_column(args.train_csv, args.train_column)
+        drift = read_column(args.drift_csv, args.drift_column)
+    else:
+        data_rng = np.random.default_rng(1)
+        train = data_rng.lognormal(3, 1, 3 * args.chunk_size)
+        drift = data_rng.lognormal(4, 1.5, args.chunk_size)
+    results = run(train[:args.chunk_size], train[args.chunk_size:], drift, args.percentages, args.iterations,
+                  args.grid_size)
+    for result in results:
+        print(f"{result['strategy']:20s}: {result['ms_per_test']:8.3f}ms per test, mean |error| "
+              f"{result['mean_abs_error']:.5f}, max |error| {result['max_abs_error']:.5f}")
+
+    within_bound = [result for result in results if result['max_abs_error'] <= args.error_bound]
+    if within_bound:
+        cheapest = min(within_bound, key=lambda result: result['ms_per_test'])
+        print(f"cheapest strategy within {args.error_bound}: {cheapest['strategy']}")
+    else:
+        print(f"no strategy within {args.error_bound}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
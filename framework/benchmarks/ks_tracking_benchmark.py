@@ -0,0 +1,78 @@
+import argparse
+import json
+import time
+import fakeredis
+import numpy as np
+from tdigest import TDigest
+from queue_consumer_server.reference_artifact import ReferenceArtifact
+from queue_consumer_server.sqs_server import AtomicRedisHandler
+from sketches.codec import decode_body, encode_body
+from sketches.ks import IncrementalKS, ks_statistic
+
+
+def make_digests(num_messages, values_per_digest, shift, seed=1):
+    rng = np.random.default_rng(seed)
+    digests = []
+    for _ in range(num_messages):
+        digest = TDigest()
+        digest.batch_update(rng.lognormal(3 + shift, 1, values_per_digest).tolist())
+        # decoded the way the server receives them.
+        digests.append(decode_body(encode_body(digest, 'binary')))
+    return digests
+
+
+def run(reference, digests):
+    """
+    Merge the digests into Redis one by one and get the KS statistic after every message, once by reading the
+    aggregate back and testing it in full (the previous per-message check) and once with the incremental tracker.
+    max_abs_difference is mostly the error of the aggregate compressed in Redis: the tracker mixes the CDFs of the
+    digests as they were sent.
+    """
+    handler = AtomicRedisHandler(redis_client=fakeredis.FakeRedis())
+    tracker = IncrementalKS(reference.grid, reference.grid_cdf)
+    full_time = incremental_time = 0.
+    max_error = 0.
+    for digest in digests:
+        handler.update_digest(digest)
+
+        start_time = time.perf_counter()
+        test_means, test_counts = handler.get_centroid_arrays()
+        full_ks, _ = ks_statistic(reference.means, reference.counts, test_means, test_counts, reference.grid)
+        full_time += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        tracker.add_digest(digest)
+        running_ks, _ = tracker.statistic()
+        incremental_time += time.perf_counter() - start_time
+        max_error = max(max_error, abs(full_ks - running_ks))
+    return {'messages': len(digests), 'grid_size': len(reference.grid),
+            'full_ms_per_message': 1000 * full_time / len(digests),
+            'incremental_ms_per_message': 1000 * incremental_time / len(digests),
+            'max_abs_difference': max_error}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Per-message KS cost: full recompute against incremental tracking.")
+    parser.add_argument('--reference-size', type=int, default=100000)
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=[0, 2000, 500],
+                        help="evaluation grid sizes of the reference artifact, 0 keeps every reference value")
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--values-per-digest', type=int, default=2000)
+    parser.add_argument('--shift', type=float, default=0.1, help="shift of the tested distribution")
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    ref_data = np.random.default_rng(0).lognormal(3, 1, args.reference_size)
+    message_digests = make_digests(args.messages, args.values_per_digest, args.shift)
+    results = []
+    for grid_size in args.grid_sizes:
+        artifact = ReferenceArtifact.from_data(ref_data, grid_size=grid_size or None)
+        result = run(artifact, message_digests)
+        results.append(result)
+        print(f"grid {result['grid_size']:7d}: full {result['full_ms_per_message']:8.3f}ms, incremental "
+              f"{result['incremental_ms_per_message']:7.3f}ms per message, max |difference| "
+              f"{result['max_abs_difference']:.5f}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
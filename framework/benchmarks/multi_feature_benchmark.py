@@ -0,0 +1,69 @@
+import argparse
+import json
+import time
+import numpy as np
+from edge_client.client import EdgeClient, MultiFeatureEdgeClient
+from transport.local_queue import LocalSQS
+
+
+def make_batches(num_rows, num_features, batch_size, seed=0):
+    rng = np.random.default_rng(seed)
+    data = rng.lognormal(3, 1, (num_rows, num_features))
+    return [data[i:i + batch_size] for i in range(0, num_rows, batch_size)]
+
+
+def run_per_column(batches, feature_names, digest_format):
+    """
+    One EdgeClient per column, every column sent as its own message.
+    """
+    sqs = LocalSQS()
+    clients = []
+    for _ in feature_names:
+        client = EdgeClient(sqs_client=sqs)
+        client.configs = dict(client.configs, queue_url='local', digest_format=digest_format, sketch_type='tdigest')
+        clients.append(client)
+
+    start_time = time.time()
+    for batch in batches:
+        for index, client in enumerate(clients):
+            client.update_digest_with_vals(batch[:, index].tolist())
+    for client in clients:
+        client.send_t_digest()
+    return time.time() - start_time, sqs
+
+
+def run_multi_feature(batches, feature_names, digest_format):
+    sqs = LocalSQS()
+    client = MultiFeatureEdgeClient(sqs_client=sqs, features=feature_names)
+    client.configs = dict(client.configs, queue_url='local', digest_format=digest_format, sketch_type='tdigest')
+
+    start_time = time.time()
+    for batch in batches:
+        client.update_batch(batch)
+    client.send_t_digest()
+    return time.time() - start_time, sqs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Per-column EdgeClients against one MultiFeatureEdgeClient.")
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--features', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=1000, help="rows per update")
+    parser.add_argument('--digest-format', default='binary')
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    row_batches = make_batches(args.rows, args.features, args.batch_size)
+    names = [f'feature_{i}' for i in range(args.features)]
+    results = []
+    for label, runner in (('per-column', run_per_column), ('multi-feature', run_multi_feature)):
+        seconds, local_sqs = runner(row_batches, names, args.digest_format)
+        results.append({'client': label, 'rows': args.rows, 'features': args.features, 'seconds': seconds,
+                        'values_per_second': args.rows * args.features / seconds, 'messages': local_sqs.calls,
+                        'bytes_sent': local_sqs.bytes_sent})
+        print(f"{label:13s}: {results[-1]['values_per_second']:10.0f} values/s, {local_sqs.calls:3d} messages, "
+              f"{local_sqs.bytes_sent} bytes")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import time
+import fakeredis
+from fakeredis import aioredis
+import numpy as np
+from tdigest import TDigest
+from queue_consumer_server.sqs_server import SQSServer
+from queue_consumer_server.sqs_pipeline import SQSPipeline
+from queue_consumer_server.async_server import AsyncSQSServer
+from transport.local_queue import AsyncLocalSQS, LocalSQS
+from sketches.codec import encode_body
+
+
+def make_bodies(num_distinct, values_per_digest, digest_format='binary', seed=0):
+    rng = np.random.default_rng(seed)
+    bodies = []
+    for _ in range(num_distinct):
+        digest = TDigest()
+        digest.batch_update(rng.lognormal(3, 1, values_per_digest).tolist())
+        bodies.append(encode_body(digest, digest_format))
+    return bodies
+
+
+def consume_per_message(server):
+    """
+    The original poll loop: every message is merged into Redis and deleted on its own.
+    """
+    messages = server.sqs.receive_message(QueueUrl=server.configs['queue_url'], MaxNumberOfMessages=10,
+                                          WaitTimeSeconds=0).get('Messages', [])
+    for message in messages:
+        server.process_message(message)
+        server.delete_message(message['ReceiptHandle'])
+
+
+async def run_async(bodies, num_messages, latency, num_queues=4):
+    """
+    AsyncSQSServer long-polling num_queues queues from one event loop, the messages spread evenly over them.
+    """
+    sqs = AsyncLocalSQS(latency=latency)
+    queue_urls = [f'local-{i}' for i in range(num_queues)]
+    for i in range(num_messages):
+        await sqs.send_message(QueueUrl=queue_urls[i % num_queues], MessageBody=bodies[i % len(bodies)])
+
+    server = AsyncSQSServer(sqs_client=sqs, redis_client=aioredis.FakeRedis())
+    server.configs = dict(server.configs, wait_time_seconds=1)
+    server.queue_urls = queue_urls
+    calls_before = sqs.calls
+
+    async with server:
+        stop_event = asyncio.Event()
+        start_time = time.time()
+        consumer = asyncio.create_task(server.run(stop_event))
+        while sqs.pending():
+            await asyncio.sleep(0.001)
+        total_time = time.time() - start_time
+        stop_event.set()
+        await consumer
+    return {'mode': 'async', 'messages': num_messages, 'latency': latency, 'seconds': total_time,
+            'messages_per_second': num_messages / total_time, 'sqs_calls': sqs.calls - calls_before}
+
+
+def run(mode, bodies, num_messages, latency):
+    if mode == 'async':
+        with contextlib.redirect_stdout(io.StringIO()):
+            return asyncio.run(run_async(bodies, num_messages, latency))
+
+    sqs = LocalSQS(latency=latency)
+    for i in range(num_messages):
+        sqs.send_message(QueueUrl='local', MessageBody=bodies[i % len(bodies)])
+
+    server = SQSServer(sqs_client=sqs, redis_client=fakeredis.FakeRedis())
+    server.configs = dict(server.configs, queue_url='local', wait_time_seconds=0)
+    calls_before = sqs.calls
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.time()
+        if mode == 'per-message':
+            while sqs.pending():
+                consume_per_message(server)
+        elif mode == 'batched':
+            while sqs.pending():
+                server.poll_messages()
+        else:
+            # long polling, so the receiver does not spin on an empty queue.
+            server.configs['wait_time_seconds'] = 1
+            pipeline = SQSPipeline(server)
+            pipeline.start()
+            while sqs.pending():
+                time.sleep(0.001)
+        total_time = time.time() - start_time
+        if mode == 'pipeline':
+            pipeline.stop()
+    return {'mode': mode, 'messages': num_messages, 'latency': latency, 'seconds': total_time,
+            'messages_per_second': num_messages / total_time, 'sqs_calls': sqs.calls - calls_before}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="SQSServer consumption throughput on the local SQS stand-in.")
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--values-per-digest', type=int, default=2000)
+    parser.add_argument('--latencies', type=float, nargs='+', default=[0.0, 0.005],
+                        help="simulated round trip per SQS call, in seconds")
+    parser.add_argument('--modes', nargs='+', default=['per-message', 'batched', 'pipeline', 'async'])
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    message_bodies = make_bodies(20, args.values_per_digest)
+    results = []
+    for sqs_latency in args.latencies:
+        for consume_mode in args.modes:
+            result = run(consume_mode, message_bodies, args.messages, sqs_latency)
+            results.append(result)
+            print(f"latency {sqs_latency * 1000:5.1f}ms - {consume_mode:12s}: {result['messages_per_second']:9.1f} "
+                  f"messages/s, {result['sqs_calls']} SQS calls")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
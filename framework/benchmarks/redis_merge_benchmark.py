@@ -0,0 +1,83 @@
+import argparse
+import json
+import threading
+import time
+import numpy as np
+import redis
+from tdigest import TDigest
+from queue_consumer_server.sqs_server import RedisHandler, AtomicRedisHandler
+
+
+def make_redis_factory(redis_url=None):
+    """
+    Returns a function creating a new Redis connection per consumer, against a local Redis when a url is given and an
+    in-process fakeredis server otherwise.
+    """
+    if redis_url:
+        return lambda: redis.Redis.from_url(redis_url)
+
+    import fakeredis
+    server = fakeredis.FakeServer()
+    return lambda: fakeredis.FakeRedis(server=server)
+
+
+def make_digest_dicts(num_digests, values_per_digest, seed=0):
+    rng = np.random.default_rng(seed)
+    digest_dicts = []
+    for _ in range(num_digests):
+        digest = TDigest()
+        digest.batch_update(rng.lognormal(3, 1, values_per_digest).tolist())
+        digest_dicts.append(digest.to_dict())
+    return digest_dicts
+
+
+def run_consumers(handler_class, redis_factory, digest_dicts, num_consumers, digest_name):
+    """
+    Every consumer gets its own handler and connection, as separate servers or lambdas would, and merges its share of
+    the digests into the same key.
+    :return: (merges per second, fraction of the merged weight that was lost)
+    """
+    handler_class(digest_name=digest_name, restart_digest=True, redis_client=redis_factory())
+    handlers = [handler_class(digest_name=digest_name, restart_digest=False, redis_client=redis_factory())
+                for _ in range(num_consumers)]
+
+    def consume(handler, share):
+        for digest_dict in share:
+            handler.update_digest(digest_dict, digest_name)
+
+    threads = [threading.Thread(target=consume, args=(handler, digest_dicts[i::num_consumers]))
+               for i, handler in enumerate(handlers)]
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total_time = time.time() - start_time
+
+    expected_weight = sum(c['c'] for d in digest_dicts for c in d['centroids'])
+    _, counts = handlers[0].get_centroid_arrays(digest_name)
+    return len(digest_dicts) / total_time, 1 - counts.sum() / expected_weight
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Redis digest merge throughput: JSON GET/SET vs the Lua script.")
+    parser.add_argument('--redis-url', default=None, help="local Redis to use instead of fakeredis")
+    parser.add_argument('--digests', type=int, default=200)
+    parser.add_argument('--values-per-digest', type=int, default=2000)
+    parser.add_argument('--consumers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    factory = make_redis_factory(args.redis_url)
+    dicts = make_digest_dicts(args.digests, args.values_per_digest)
+
+    results = []
+    for consumers in args.consumers:
+        for name, handler_cls in (('json', RedisHandler), ('lua', AtomicRedisHandler)):
+            rate, lost = run_consumers(handler_cls, factory, dicts, consumers, f"benchmark_digest_{name}")
+            results.append({'handler': name, 'consumers': consumers, 'merges_per_second': rate, 'lost_weight': lost})
+            print(f"{name:5s} consumers: {consumers:3d} - {rate:10.1f} merges/s, lost weight: {lost:.2%}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,20 @@
+"""
+Reading the output of runtime_suite.py, kept free of the framework imports so the Runtimes_* scripts of
+Graph_Experiments can plot it next to their own copies of the client and server packages.
+"""
+import json
+
+
+def load_results(file_path):
+    with open(file_path) as file:
+        return json.load(file)
+
+
+def runtime_series(results, side, method, statistic='mean'):
+    """
+    {d or aggregation size: runtime} of one method, the dictionaries the Runtimes_* plot functions take.
+    :param side: 'client' or 'server'
+    :param statistic: 'mean', 'median', 'min' or 'std'
+    """
+    return {result['x']: result[statistic] for result in results['results']
+            if result['side'] == side and result['method'] == method}
@@ -0,0 +1,206 @@
+"""
+The client and server runtime experiments of Graph_Experiments/Runtimes_Client.py and Runtimes_Server.py, against
+LocalSQS and fakeredis instead of AWS. Every point of the d (client) and aggregation size (server) sweeps is run
+warmup + repeats times, the results are written as json and the Runtimes_* scripts plot them with --results.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import fakeredis
+import numpy as np
+from tdigest import TDigest
+from edge_client.client import EdgeClient
+from queue_consumer_server.reference_artifact import ReferenceArtifact
+from queue_consumer_server.sqs_server import SQSServer
+from sketches.codec import encode_body, item_count_attributes
+from transport.local_queue import LocalSQS
+
+CLIENT_METHODS = ('T-Digest-Merge', 'T-Digest-Stream', 'Histogram', 'Per-Value-Stream')
+SERVER_METHODS = ('T-Digest-Merge', 'T-Digest-Stream', 'Histogram', 'Computing-KS')
+# raw values per message of the T-Digest-Stream clients, as in streaming_client_eval_with_catch_sending.
+STREAM_BATCH_SIZE = 1000
+# items summarized by every digest message the server receives (d=20000).
+SERVER_DIGEST_SIZE = 20000
+PAPER_CLIENT_SIZES = list(range(1000, 100000, 5000))
+PAPER_SERVER_SIZES = list(range(100000, 5000000, 200000))
+
+
+def new_client(sqs, dataset_range, sketch_type='tdigest'):
+    client = EdgeClient(sqs_client=sqs)
+    client.configs = dict(client.configs, queue_url='local', sketch_type=sketch_type, histogram_min=dataset_range[0],
+                          histogram_max=dataset_range[1], histogram_bins=1000)
+    return client
+
+
+def client_run(method, values, dataset_range):
+    """
+    Time one client sending the d values of a batch with a method, as in client_eval.
+    """
+    sqs = LocalSQS()
+    start_time = time.perf_counter()
+    if method == 'T-Digest-Merge':
+        client = new_client(sqs, dataset_range)
+        client.update_digest_with_vals(values)
+        client.send_t_digest()
+    elif method == 'Histogram':
+        client = new_client(sqs, dataset_range, 'histogram')
+        client.update_digest_with_vals(values)
+        client.send_t_digest()
+    elif method == 'T-Digest-Stream':
+        client = new_client(sqs, dataset_range)
+        for i in range(0, len(values), STREAM_BATCH_SIZE):
+            client.send_any_object(values[i:i + STREAM_BATCH_SIZE])
+    elif method == 'Per-Value-Stream':
+        client = new_client(sqs, dataset_range)
+        for value in values:
+            client.send_any_object(value)
+    else:
+        raise Exception(f"Unsupported client method: {method}")
+    return time.perf_counter() - start_time
+
+
+class ServerBench:
+    """
+    Servers of both sketch types on fakeredis, with the reference artifact of the dataset, and the messages the
+    clients would send them (built once, outside the timings).
+    """
+
+    def __init__(self, dataset, work_dir, num_messages=10, seed=0):
+        rng = np.random.default_rng(seed)
+        artifact_path = os.path.join(work_dir, 'reference.ksref')
+        ReferenceArtifact.from_data(dataset[:100000], grid_size=2000).save(artifact_path)
+        self.config_files = {}
+        for sketch_type in ('tdigest', 'histogram'):
+            configs = SQSServer.read_config('server_configs.json')
+            configs.update(reference_artifact=artifact_path, sketch_type=sketch_type, histogram_bins=1000,
+                           monitors=[], window={})
+            self.config_files[sketch_type] = os.path.join(work_dir, f'{sketch_type}_server_configs.json')
+            with open(self.config_files[sketch_type], 'w') as file:
+                json.dump(configs, file)
+
+        batches = [rng.choice(dataset, SERVER_DIGEST_SIZE) for _ in range(num_messages)]
+        self.digest_messages = []
+        for batch in batches:
+            digest = TDigest()
+            digest.batch_update(batch.tolist())
+            self.digest_messages.append(self.message(encode_body(digest, 'binary')))
+        histogram_server = self.new_server('histogram', SERVER_DIGEST_SIZE)
+        self.histogram_messages = []
+        for batch in batches:
+            histogram = histogram_server.ref_histogram.empty_copy()
+            histogram.batch_update(batch)
+            self.histogram_messages.append(self.message(encode_body(histogram, 'binary')))
+        self.stream_messages = [{'Body': json.dumps(batch[i:i + STREAM_BATCH_SIZE].tolist())}
+                                for batch in batches for i in range(0, len(batch), STREAM_BATCH_SIZE)]
+
+    @staticmethod
+    def message(body):
+        return {'Body': body, 'MessageAttributes': item_count_attributes(SERVER_DIGEST_SIZE)}
+
+    def new_server(self, sketch_type, aggregation_size):
+        return SQSServer(self.config_files[sketch_type], aggregation_size=aggregation_size, sqs_client=LocalSQS(),
+                         redis_client=fakeredis.FakeRedis())
+
+    def run(self, method, aggregation_size):
+        """
+        Time the server aggregating aggregation_size items and running the KS test once, as in the server runtime
+        experiment. 'Computing-KS' times the KS test alone (phase 2).
+        """
+        server = self.new_server('histogram' if method == 'Histogram' else 'tdigest', aggregation_size)
+        # the server prints the aggregation count of every message.
+        with contextlib.redirect_stdout(io.StringIO()):
+            return self.timed_run(server, method, aggregation_size)
+
+    def timed_run(self, server, method, aggregation_size):
+        # the aggregation ends with the KS test on the message that reaches aggregation_size.
+        num_messages = -(-aggregation_size // SERVER_DIGEST_SIZE)
+        if method in ('T-Digest-Merge', 'Histogram', 'Computing-KS'):
+            messages = self.histogram_messages if method == 'Histogram' else self.digest_messages
+            if method == 'Computing-KS':
+                server.aggregation_size = float('inf')
+            start_time = time.perf_counter()
+            for i in range(num_messages):
+                server.process_message(messages[i % len(messages)])
+            if method != 'Computing-KS':
+                return time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            server.compute_ks()
+            return time.perf_counter() - start_time
+
+        if method == 'T-Digest-Stream':
+            handler = server.redis_handler
+            handler.batch_size = SERVER_DIGEST_SIZE
+            num_stream_messages = num_messages * SERVER_DIGEST_SIZE // STREAM_BATCH_SIZE
+            start_time = time.perf_counter()
+            for i in range(num_stream_messages):
+                handler.update_digest_w_values_using_batching(
+                    json.loads(self.stream_messages[i % len(self.stream_messages)]['Body']))
+            server.compute_ks()
+            return time.perf_counter() - start_time
+        raise Exception(f"Unsupported server method: {method}")
+
+
+def repeat(run, warmup, repeats):
+    """
+    :return: the statistics of repeats timed calls of run, after warmup untimed ones
+    """
+    for _ in range(warmup):
+        run()
+    runs = [run() for _ in range(repeats)]
+    return {'warmup': warmup, 'repeats': repeats, 'runs': runs, 'mean': float(np.mean(runs)),
+            'std': float(np.std(runs)), 'min': float(np.min(runs)), 'median': float(np.median(runs))}
+
+
+def run_suite(dataset, client_sizes, server_sizes, client_methods, server_methods, warmup, repeats, seed=0):
+    rng = np.random.default_rng(seed)
+    dataset_range = (float(dataset.min()), float(dataset.max()))
+    results = []
+    for d in client_sizes:
+        values = rng.choice(dataset, d).tolist()
+        for method in client_methods:
+            stats = repeat(lambda: client_run(method, values, dataset_range), warmup, repeats)
+            results.append(dict(side='client', method=method, x=d, **stats))
+            print(f"client {method:16s} d={d:7d}: {stats['mean']:.4f}s +- {stats['std']:.4f}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        bench = ServerBench(dataset, work_dir, seed=seed)
+        for aggregation_size in server_sizes:
+            for method in server_methods:
+                stats = repeat(lambda: bench.run(method, aggregation_size), warmup, repeats)
+                results.append(dict(side='server', method=method, x=aggregation_size, **stats))
+                print(f"server {method:16s} size={aggregation_size:8d}: {stats['mean']:.4f}s +- {stats['std']:.4f}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Client and server runtime sweeps on LocalSQS and fakeredis.")
+    parser.add_argument('--data', default=None, help="csv of the runtime experiments, synthetic data when not given")
+    parser.add_argument('--column', default='Amount')
+    parser.add_argument('--client-sizes', type=int, nargs='+', default=[1000, 21000, 41000, 61000, 81000])
+    parser.add_argument('--server-sizes', type=int, nargs='+', default=[100000, 300000, 500000])
+    parser.add_argument('--paper-sweeps', action='store_true', help="the full d and aggregation size sweeps")
+    parser.add_argument('--client-methods', nargs='+', default=list(CLIENT_METHODS), choices=CLIENT_METHODS)
+    parser.add_argument('--server-methods', nargs='+', default=list(SERVER_METHODS), choices=SERVER_METHODS)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='runtime_results.json')
+    args = parser.parse_args()
+
+    if args.data:
+        from queue_consumer_server.reference_artifact import read_reference_data
+        data = np.asarray(read_reference_data(args.data, args.column), dtype=np.float64)
+    else:
+        data = np.random.default_rng(args.seed).lognormal(3, 1.5, 284807)
+    suite_results = run_suite(data, PAPER_CLIENT_SIZES if args.paper_sweeps else args.client_sizes,
+                              PAPER_SERVER_SIZES if args.paper_sweeps else args.server_sizes,
+                              args.client_methods, args.server_methods, args.warmup, args.repeats, args.seed)
+    with open(args.output, 'w') as output_file:
+        json.dump({'config': dict(vars(args), python=platform.python_version(), machine=platform.machine()),
+                   'results': suite_results}, output_file, indent=2)
+    print(f"results in {args.output}")
@@ -0,0 +1,91 @@
+import argparse
+import json
+import time
+import numpy as np
+from edge_client.client import EdgeClient
+from transport.local_queue import LocalSQS
+from sketches.codec import decode_message_digests, decompress_body
+
+# (name, send_coalescing, body_compression)
+MODES = (('one message per send', False, None), ('coalesced', True, None), ('zlib', False, 'zlib'),
+         ('coalesced + zlib', True, 'zlib'), ('coalesced + zstd', True, 'zstd'))
+
+
+def new_client(sqs, coalescing, compression, digest_format):
+    client = EdgeClient(sqs_client=sqs)
+    client.configs = dict(client.configs, queue_url='local', send_coalescing=coalescing, body_compression=compression,
+                          compression_min_bytes=1024, digest_format=digest_format)
+    return client
+
+
+def stream_run(values, chunk_size, coalescing, compression, latency):
+    """
+    The streaming client of streaming_client_eval_with_catch_sending: raw values sent in chunks of chunk_size.
+    """
+    sqs = LocalSQS(latency=latency)
+    client = new_client(sqs, coalescing, compression, 'json')
+    start_time = time.perf_counter()
+    for i in range(0, len(values), chunk_size):
+        client.send_any_object(values[i:i + chunk_size])
+    client.flush_sends()
+    seconds = time.perf_counter() - start_time
+    # what the consumer reads back, to check nothing was lost on the way.
+    received = sum(len(json.loads(decompress_body(body))) for _, body, _ in sqs.visible)
+    return seconds, sqs, received
+
+
+def digest_run(values, batch_size, coalescing, compression, latency, digest_format):
+    """
+    T-DIGEST-MERGE clients: one digest of batch_size values per send_t_digest.
+    """
+    sqs = LocalSQS(latency=latency)
+    client = new_client(sqs, coalescing, compression, digest_format)
+    start_time = time.perf_counter()
+    for i in range(0, len(values), batch_size):
+        client.update_digest_with_vals(values[i:i + batch_size])
+        client.send_t_digest()
+    client.flush_sends()
+    seconds = time.perf_counter() - start_time
+    received = sum(item_count for _, body, attributes in sqs.visible
+                   for _, _, _, item_count in decode_message_digests({'Body': body, 'MessageAttributes': attributes}))
+    return seconds, sqs, received
+
+
+def run(values, workload, chunk_size, latency, digest_format='json', modes=MODES):
+    results = []
+    for name, coalescing, compression in modes:
+        if workload == 'stream':
+            seconds, sqs, received = stream_run(values, chunk_size, coalescing, compression, latency)
+        else:
+            seconds, sqs, received = digest_run(values, chunk_size, coalescing, compression, latency, digest_format)
+        messages = len(sqs.visible)
+        results.append({'workload': workload, 'mode': name, 'latency': latency, 'messages': messages,
+                        'sqs_calls': sqs.calls, 'bytes_on_wire': sqs.bytes_sent, 'seconds': seconds,
+                        'messages_per_second': messages / seconds, 'values_received': received})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Messages per second and bytes on the wire of the client sends, with "
+                                                 "and without coalescing and compression, on LocalSQS.")
+    parser.add_argument('--values', type=int, default=200000)
+    parser.add_argument('--stream-chunk', type=int, default=1000, help="values per streamed message")
+    parser.add_argument('--digest-batch', type=int, default=2000, help="values per digest message")
+    parser.add_argument('--digest-format', default='json', choices=['json', 'binary'])
+    parser.add_argument('--latency', type=float, default=0.005, help="simulated SQS round trip, in seconds")
+    parser.add_argument('--no-zstd', action='store_true', help="skip zstd (needs the zstandard package)")
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    data = np.random.default_rng(0).lognormal(3, 1, args.values)
+    selected_modes = [mode for mode in MODES if not (args.no_zstd and mode[2] == 'zstd')]
+    all_results = run(data.tolist(), 'stream', args.stream_chunk, args.latency, modes=selected_modes)
+    all_results += run(data, 'digest', args.digest_batch, args.latency, args.digest_format, selected_modes)
+    for result in all_results:
+        print(f"{result['workload']:6s} {result['mode']:22s}: {result['messages']:4d} messages in "
+              f"{result['sqs_calls']:4d} calls, {result['messages_per_second']:8.0f} messages/s, "
+              f"{result['bytes_on_wire']:9d} bytes on the wire, {result['values_received']} values received")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(all_results, file, indent=2)
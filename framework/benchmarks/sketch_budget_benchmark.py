@@ -0,0 +1,116 @@
+"""
+KS error of the sudden drift accuracy experiment for edge clients with a "max_sketch_bytes" budget: every test set is
+sent by a budgeted EdgeClient in messages of --batch-size values (T-DIGEST-MERGE d=20k), and the server side merges
+the decoded messages and tests them against the reference artifact the way it does by default ('reference_points').
+"""
+import argparse
+import json
+import os
+import tempfile
+import numpy as np
+from edge_client.client import EdgeClient
+from queue_consumer_server.reference_artifact import ReferenceArtifact
+from sketches.codec import decode_body
+from sketches.ks import grid_ks, sample_ks
+from sketches.merge import merge_digests
+from benchmarks.ks_grid_benchmark import read_column
+from transport.local_queue import LocalSQS
+
+
+def client_config_file(work_dir, max_bytes, batch_size, digest_format):
+    configs = EdgeClient.read_config('client_configs.json')
+    configs.update(queue_url='local', sketch_type='tdigest', digest_format=digest_format, max_sketch_bytes=max_bytes,
+                   flush_item_count=batch_size, auto_flush=False)
+    file_path = os.path.join(work_dir, f'client_configs_{max_bytes}.json')
+    with open(file_path, 'w') as file:
+        json.dump(configs, file)
+    return file_path
+
+
+def send_test_set(test_data, config_file, batch_size):
+    """
+    Send a test set with a new client, one message per batch_size values.
+    :return: (the merge of the decoded messages, {'messages', 'body_bytes', 'centroids', 'memory_bytes'} of the
+             client, the last two the largest before a send)
+    """
+    sqs = LocalSQS()
+    client = EdgeClient(config_file, sqs_client=sqs)
+    centroids = memory_bytes = 0
+    for i in range(0, len(test_data), batch_size):
+        client.update_digest_with_vals(test_data[i:i + batch_size])
+        report = client.sketch_footprint()
+        centroids, memory_bytes = max(centroids, report['centroids']), max(memory_bytes, report['memory_bytes'])
+        client.send_t_digest()
+    bodies = [body for _, body, _ in sqs.visible]
+    return merge_digests([decode_body(body) for body in bodies]), {
+        'messages': len(bodies), 'body_bytes': max(len(body) for body in bodies), 'centroids': centroids,
+        'memory_bytes': memory_bytes, 'delta': client.budget.delta if client.budget is not None else 0.01}
+
+
+def run(ref_data, train_data, drift_data, budgets, percentages, iterations, batch_size=20000, digest_format='binary',
+        seed=0):
+    """
+    The sudden drift accuracy experiment (see ks_grid_benchmark.run) for every budget, 0 being unbounded.
+    """
+    reference = ReferenceArtifact.from_data(ref_data)
+    chunk_size = len(ref_data)
+    summary = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for max_bytes in budgets:
+            config_file = client_config_file(work_dir, max_bytes, batch_size, digest_format)
+            rng = np.random.default_rng(seed)
+            errors, stats = [], []
+            for new_percentage in percentages:
+                num_drifted = int(chunk_size * new_percentage / 100)
+                for _ in range(iterations):
+                    test_data = np.concatenate((rng.choice(train_data, chunk_size - num_drifted, replace=False),
+                                                rng.choice(drift_data, num_drifted)))
+                    true_ks, _ = sample_ks(ref_data, test_data)
+                    test, message_stats = send_test_set(test_data, config_file, batch_size)
+                    digest_ks, _ = grid_ks(reference.means, reference.counts, test['means'], test['counts'],
+                                           'reference_points', ref_points=reference.grid)
+                    errors.append(abs(digest_ks - true_ks))
+                    stats.append(message_stats)
+            errors = np.array(errors)
+            summary.append({'max_bytes': max_bytes, 'delta': stats[0]['delta'],
+                            'max_centroids': max(stat['centroids'] for stat in stats),
+                            'max_body_bytes': max(stat['body_bytes'] for stat in stats),
+                            'max_memory_bytes': max(stat['memory_bytes'] for stat in stats),
+                            'tests': len(errors), 'mean_abs_error': float(errors.mean()),
+                            'max_abs_error': float(errors.max())})
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="KS error of the sudden drift experiment per client sketch budget.")
+    parser.add_argument('--train-csv', default=None, help="csv of the training data, synthetic data when not given")
+    parser.add_argument('--drift-csv', default=None, help="csv of the drifted data")
+    parser.add_argument('--train-column', default='amt')
+    parser.add_argument('--drift-column', default='amount')
+    parser.add_argument('--chunk-size', type=int, default=100000, help="size of the reference and of the test sets")
+    parser.add_argument('--budgets', type=int, nargs='+', default=[0, 65536, 16384, 4096, 2048, 1024],
+                        help="max_sketch_bytes levels, 0 is unbounded")
+    parser.add_argument('--batch-size', type=int, default=20000, help="values per message")
+    parser.add_argument('--digest-format', default='binary', choices=['binary', 'json'])
+    parser.add_argument('--percentages', type=int, nargs='+', default=[0, 5, 10, 20, 50])
+    parser.add_argument('--iterations', type=int, default=3, help="test sets per percentage")
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    if args.train_csv:
+        train = read_column(args.train_csv, args.train_column)
+        drift = read_column(args.drift_csv, args.drift_column)
+    else:
+        data_rng = np.random.default_rng(1)
+        train = data_rng.lognormal(3, 1, 3 * args.chunk_size)
+        drift = data_rng.lognormal(4, 1.5, args.chunk_size)
+    results = run(train[:args.chunk_size], train[args.chunk_size:], drift, args.budgets, args.percentages,
+                  args.iterations, args.batch_size, args.digest_format)
+    for result in results:
+        print(f"max_sketch_bytes {result['max_bytes']:6d}: delta {result['delta']:.4f}, {result['max_centroids']:4d} "
+              f"centroids, body {result['max_body_bytes']:6d}B, memory {result['max_memory_bytes']:7d}B, "
+              f"mean |error| {result['mean_abs_error']:.5f}, max |error| {result['max_abs_error']:.5f}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
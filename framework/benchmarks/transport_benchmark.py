@@ -0,0 +1,139 @@
+"""
+End to end message rate of edge clients and the SQSServer on one machine, without localstack: every client thread sends
+--messages-per-client digests of --values-per-message values through the "local" transport or a SocketBroker (TCP or
+Unix socket), and the server polls, decodes and merges them into fakeredis until all of them were consumed. The
+serialization, the broker round trips and the merges are real, only the SQS service is local.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import fakeredis
+import numpy as np
+from edge_client.client import EdgeClient
+from queue_consumer_server.sqs_server import SQSServer
+from transport.local_queue import LocalBroker
+from transport.socket_broker import SocketBroker, SocketSQS
+
+# 'local': LocalBroker in the process, 'tcp' and 'unix': a SocketBroker in the process or in its own (--broker-process)
+TRANSPORT_MODES = ('local', 'tcp', 'unix')
+
+
+@contextlib.contextmanager
+def transport(mode, work_dir, broker_process=False):
+    """
+    :return: a function creating the queue clients of the clients and of the server
+    """
+    if mode == 'local':
+        broker = LocalBroker()
+        yield lambda: broker
+        return
+    address = f'unix://{os.path.join(work_dir, "broker.sock")}' if mode == 'unix' else 'tcp://127.0.0.1:9324'
+    if broker_process:
+        process = subprocess.Popen([sys.executable, '-m', 'transport.socket_broker', '--address', address],
+                                   stdout=subprocess.DEVNULL)
+        wait_for_broker(address)
+        try:
+            yield lambda: SocketSQS(address)
+        finally:
+            process.terminate()
+            process.wait()
+    else:
+        broker = SocketBroker(address if mode == 'unix' else 'tcp://127.0.0.1:0').start()
+        try:
+            yield lambda: SocketSQS(broker.address)
+        finally:
+            broker.stop()
+
+
+def wait_for_broker(address, timeout=10):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            SocketSQS(address).receive_message(QueueUrl='local')
+            return
+        except Exception:
+            if time.time() > deadline:
+                raise Exception(f"The broker at {address} did not start.")
+            time.sleep(0.05)
+
+
+def run_clients(new_sqs, batches, digest_format, send_coalescing):
+    """
+    Send the value batches of every client from its own thread, one digest message per batch.
+    """
+    def send(client_batches):
+        client = EdgeClient(sqs_client=new_sqs())
+        client.configs = dict(client.configs, queue_url='local', digest_format=digest_format,
+                              send_coalescing=send_coalescing)
+        for batch in client_batches:
+            client.update_digest_with_vals(batch)
+            client.send_t_digest()
+        client.flush_sends()
+
+    threads = [threading.Thread(target=send, args=(client_batches,)) for client_batches in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run(mode, num_clients, messages_per_client, values_per_message, digest_format='binary', send_coalescing=False,
+        broker_process=False, seed=0):
+    rng = np.random.default_rng(seed)
+    batches = [[rng.lognormal(3, 1, values_per_message) for _ in range(messages_per_client)]
+               for _ in range(num_clients)]
+    num_messages = num_clients * messages_per_client
+    with tempfile.TemporaryDirectory() as work_dir, transport(mode, work_dir, broker_process) as new_sqs:
+        server = SQSServer(sqs_client=new_sqs(), redis_client=fakeredis.FakeRedis(), aggregation_size=float('inf'))
+        server.configs = dict(server.configs, queue_url='local', wait_time_seconds=1)
+        consumed = []
+        process_messages = server.process_messages
+        server.process_messages = lambda messages: (consumed.append(len(messages)), process_messages(messages))
+
+        start_time = time.perf_counter()
+        # the server prints the aggregation count of every message.
+        with contextlib.redirect_stdout(io.StringIO()):
+            clients = threading.Thread(target=run_clients, args=(new_sqs, batches, digest_format, send_coalescing))
+            clients.start()
+            while sum(consumed) < num_messages:
+                server.poll_messages()
+            clients.join()
+        seconds = time.perf_counter() - start_time
+    return {'transport': mode, 'broker_process': broker_process, 'clients': num_clients, 'messages': num_messages,
+            'values_per_message': values_per_message, 'send_coalescing': send_coalescing, 'seconds': seconds,
+            'messages_per_second': num_messages / seconds,
+            'values_per_second': num_messages * values_per_message / seconds,
+            'values_merged': float(server.redis_handler.get_t_digest().n)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End to end message rate of the clients and the server per transport.")
+    parser.add_argument('--transports', nargs='+', default=list(TRANSPORT_MODES), choices=TRANSPORT_MODES)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--messages-per-client', type=int, default=250)
+    parser.add_argument('--values-per-message', type=int, default=1000)
+    parser.add_argument('--digest-format', default='binary', choices=['binary', 'json'])
+    parser.add_argument('--send-coalescing', action='store_true', help="send_message_batch calls of 10 messages")
+    parser.add_argument('--broker-process', action='store_true', help="run the socket broker in its own process")
+    parser.add_argument('--output', default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    all_results = []
+    for transport_mode in args.transports:
+        result = run(transport_mode, args.clients, args.messages_per_client, args.values_per_message,
+                     args.digest_format, args.send_coalescing, args.broker_process and transport_mode != 'local')
+        all_results.append(result)
+        print(f"{result['transport']:5s}: {result['messages']} messages in {result['seconds']:.3f}s, "
+              f"{result['messages_per_second']:8.0f} messages/s, {result['values_per_second']:10.0f} values/s, "
+              f"{result['values_merged']:.0f} values merged")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(all_results, file, indent=2)
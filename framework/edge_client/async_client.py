@@ -0,0 +1,147 @@
+import asyncio
+import contextlib
+import json
+import time
+from botocore.exceptions import BotoCoreError, ClientError
+from edge_client.client import EdgeClient
+from sketches.codec import item_count_attributes
+
+
+class AsyncEdgeClient(EdgeClient):
+    """
+    asyncio variant of EdgeClient for applications that already run an event loop.
+    Ingestion is the same (update_digest_with_vals is CPU only and stays synchronous, call it from the loop thread),
+    sending is a coroutine and the auto flush runs as a task on the loop instead of a thread.
+    The SQS client is an aiobotocore client, created when the client is opened:
+
+        async with AsyncEdgeClient() as client:
+            client.update_digest_with_vals(values)
+            await client.send_t_digest()
+
+    Leaving the context (or close()) stops the auto flush and sends whatever is still pending.
+    Bodies are compressed with "body_compression" as in EdgeClient, "send_coalescing" does not apply: every digest
+    is one send_message call.
+    """
+
+    def __init__(self, config_file='client_configs.json', sqs_client=None):
+        """
+        sqs_client can be given to use an existing async client (anything with awaitable SQS calls).
+        """
+        self.exit_stack = None
+        self.auto_flush_requested = False
+        super().__init__(config_file, sqs_client)
+        self.flush_event = asyncio.Event()
+
+    def create_sqs_client(self):
+        # aiobotocore clients are async context managers, the client is created in open().
+        return None
+
+    async def open(self):
+        if self.sqs is None:
+            from aiobotocore.session import get_session
+            self.exit_stack = contextlib.AsyncExitStack()
+            self.sqs = await self.exit_stack.enter_async_context(
+                get_session().create_client('sqs', endpoint_url=self.configs["endpoint_url"]))
+        if self.auto_flush_requested:
+            self.start_auto_flush()
+        return self
+
+    async def close(self):
+        """
+        Stop the auto flush, send the pending digest and close the SQS client if this client created it.
+        """
+        await self.stop_auto_flush()
+        if self.exit_stack is not None:
+            await self.exit_stack.aclose()
+            self.exit_stack = None
+            self.sqs = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def send_t_digest(self):
+        """
+        Sends the T-Digest to the SQS queue without blocking the event loop.
+        """
+        digest, item_count = self.swap_digest()
+        self.last_flush_time = time.time()
+        try:
+            return await self.sqs.send_message(
+                QueueUrl=self.configs['queue_url'],
+                MessageBody=self.compress_message_body(self.message_body(digest)),
+                MessageAttributes=item_count_attributes(item_count)
+            )
+
+        except (ClientError, BotoCoreError) as e:
+            with self.shards_lock:
+                self.unsent.append((digest, item_count))
+            raise Exception(f"An error occurred: {e}")
+
+    def start_auto_flush(self, flush_item_count=None, flush_interval_seconds=None, flush_max_bytes=None):
+        """
+        Same policies as EdgeClient.start_auto_flush, the flusher is a task on the running loop. Without a running
+        loop (e.g. "auto_flush" in the configuration) it starts when the client is opened.
+        """
+        if flush_item_count is not None:
+            self.flush_item_count = flush_item_count
+        if flush_interval_seconds is not None:
+            self.flush_interval_seconds = flush_interval_seconds
+        if flush_max_bytes is not None:
+            self.flush_max_bytes = flush_max_bytes
+        if self.flusher is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.auto_flush_requested = True
+            return
+        self.flush_stop_event.clear()
+        self.flusher = loop.create_task(self._auto_flush_loop())
+
+    async def stop_auto_flush(self, flush=True):
+        """
+        Stop the flusher task, sending whatever is still pending unless flush is False.
+        """
+        if self.flusher is not None:
+            self.flush_stop_event.set()
+            self.flush_event.set()
+            await self.flusher
+            self.flusher = None
+        if flush and self.pending_item_count():
+            await self.send_t_digest()
+
+    async def _auto_flush_loop(self):
+        while not self.flush_stop_event.is_set():
+            timeout = self.flush_check_seconds
+            if self.flush_interval_seconds:
+                timeout = min(timeout, max(0., self.last_flush_time + self.flush_interval_seconds - time.time()))
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.flush_event.wait(), timeout)
+            self.flush_event.clear()
+            if self.flush_stop_event.is_set() or not self.should_flush():
+                continue
+            try:
+                await self.send_t_digest()
+            except Exception as e:
+                # the digest is kept and goes out with the next flush.
+                print(f"auto flush failed: {e}")
+
+    async def send_any_object(self, item_to_send):
+        """
+        Sends any given object to the SQS queue.
+        :param item_to_send: the item to be sent, has to be JSON serializable
+        """
+        try:
+            return await self.sqs.send_message(
+                QueueUrl=self.configs['queue_url'],
+                MessageBody=self.compress_message_body(json.dumps(item_to_send))
+            )
+
+        except (ClientError, BotoCoreError) as e:
+            raise Exception(f"An error occurred: {e}")
+
+    async def clear_queue_from_all_messages(self):
+        await self.sqs.purge_queue(QueueUrl=self.configs['queue_url'])
@@ -1,11 +1,36 @@
 import json
-import boto3
-from botocore.exceptions import ClientError
-from tdigest import TDigest
+from botocore.exceptions import BotoCoreError, ClientError
 import threading
+import numpy as np
 import os
 import random
 import time
+from sketches.codec import (MULTI_ENTRY_SIZE, compress_body, encode_body, encode_multi_body, estimated_body_size,
+                            item_count_attributes)
+from sketches.budget import SketchBudget, footprint
+from sketches.histogram import HistogramSketch
+from sketches.ingest import IngestBuffer
+from sketches.merge import merge_digests, merge_sketches, values_digest
+from sketches.merging_digest import MergingDigest
+from edge_client.send_queue import SendQueue
+from queue_consumer_server.reference_artifact import load_reference_artifact
+from transport.clients import create_sqs_client
+
+
+class _Shard:
+    """
+    One producer thread's sketch. Its lock is only ever contended by the flush swapping the sketch out (and by the
+    threads sharing the shard once a sketch budget has no share left for a new one).
+    """
+
+    def __init__(self, sketch, thread):
+        self.sketch = sketch
+        # the producer threads, the shard is dropped once they have exited and its content was sent.
+        self.threads = [thread]
+        self.item_count = 0
+        self.lock = threading.Lock()
+        # values not folded into the sketch yet, created by the first update_digest_with_vals.
+        self.buffer = None
 
 
 class EdgeClient:
@@ -16,14 +41,47 @@ class EdgeClient:
     Configuration is read from a file named 'configs'.
     """
 
-    def __init__(self, config_file='client_configs.json'):
+    def __init__(self, config_file='client_configs.json', sqs_client=None):
         """
         Initialize the SQS client with configurations from the provided file.
+        sqs_client can be given to use an existing (or local stand-in) client, else the "transport" of the configs
+        picks one (see transport/clients.py).
         """
         self.configs = self.read_config(config_file)
-        self.sqs = boto3.client('sqs', endpoint_url=self.configs["endpoint_url"])
-        self.digest = TDigest()
-        self.lock = threading.Lock()
+        self.sqs = sqs_client if sqs_client is not None else self.create_sqs_client()
+
+        # every producer thread updates its own shard, the shards are merged only when sending.
+        self.shards = []
+        self.shards_lock = threading.Lock()
+        self.local = threading.local()
+        # sketches whose send failed, they are merged into the next send.
+        self.unsent = []
+
+        # background flushing, see start_auto_flush.
+        self.flush_item_count = self.configs.get('flush_item_count', 0)
+        self.flush_interval_seconds = self.configs.get('flush_interval_seconds', 0)
+        self.flush_max_bytes = self.configs.get('flush_max_bytes', 0)
+        self.flush_check_seconds = self.configs.get('flush_check_seconds', 0.5)
+        self.flush_event = threading.Event()
+        self.flush_stop_event = threading.Event()
+        self.flusher = None
+        self.last_flush_time = time.time()
+        # values per shard collected before they are folded into its sketch, 0 folds every batch right away.
+        self.ingest_buffer_size = self.configs.get('ingest_buffer_size', 20000)
+        # memory and payload budget of the t-digests, see sketches/budget.py. 0 leaves them unbounded.
+        self.budget = None
+        if self.configs.get('max_sketch_bytes', 0) and self.configs.get('sketch_type', 'tdigest') != 'histogram':
+            self.budget = SketchBudget(self.configs['max_sketch_bytes'], self.configs.get('digest_format', 'json'),
+                                       self.configs.get('digest_precision', 'float64'),
+                                       self.flush_item_count or 20000, self.configs.get('delta', 0.01))
+            self.ingest_buffer_size = min(self.ingest_buffer_size, self.budget.buffer_size)
+        # outbound messages coalesced into send_message_batch calls, created by the first send ("send_coalescing").
+        self.send_queue = None
+        if self.configs.get('auto_flush', False):
+            self.start_auto_flush()
+
+    def create_sqs_client(self):
+        return create_sqs_client(self.configs)
 
     @staticmethod
     def read_config(file_path):
@@ -41,28 +99,312 @@ class EdgeClient:
         except json.JSONDecodeError:
             raise Exception("Error parsing the configuration file.")
 
+    def new_sketch(self):
+        """
+        An empty sketch of the configured type: a MergingDigest (see sketches/merging_digest.py), or a HistogramSketch
+        with the edges of the reference range (see histogram_range, histogram_bins has to match the server's).
+        """
+        if self.configs.get('sketch_type', 'tdigest') == 'histogram':
+            return HistogramSketch(*self.histogram_range(self.configs), self.configs.get('histogram_bins', 1000))
+        if self.budget is not None:
+            return MergingDigest(self.budget.delta, self.configs.get('K', 25))
+        return MergingDigest(self.configs.get('delta', 0.01), self.configs.get('K', 25))
+
+    @staticmethod
+    def histogram_range(configs):
+        """
+        The edges of the histograms of a configuration (the client's, or a feature's): histogram_min and histogram_max
+        when both are set, else the range of its "reference_artifact", the same file the server reads, so the bins are
+        the server's. The server drops histograms with other edges.
+        """
+        if configs.get('histogram_min') is not None and configs.get('histogram_max') is not None:
+            return configs['histogram_min'], configs['histogram_max']
+        artifact_path = None
+        if configs.get('reference_artifact'):
+            artifact_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), configs['reference_artifact'])
+        if artifact_path is None or not os.path.isfile(artifact_path):
+            raise Exception("Histogram sketches need histogram_min and histogram_max or a reference_artifact"
+                            + (f", {artifact_path} was not found." if artifact_path else "."))
+        reference = load_reference_artifact(artifact_path)
+        return float(reference.grid[0]), float(reference.grid[-1])
+
+    def _shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            with self.shards_lock:
+                if self.budget is not None and len(self.shards) >= self.budget.max_shards:
+                    # no share of the budget left, the thread joins the least shared shard.
+                    shard = min(self.shards, key=lambda candidate: len(candidate.threads))
+                    shard.threads.append(threading.current_thread())
+                else:
+                    shard = _Shard(self.new_sketch(), threading.current_thread())
+                    self.shards.append(shard)
+            self.local.shard = shard
+            self.rebalance_shards()
+        return shard
+
+    def shard_buffer_size(self):
+        if self.budget is not None:
+            return min(self.ingest_buffer_size, self.budget.shard_buffer_size)
+        return self.ingest_buffer_size
+
+    def rebalance_shards(self):
+        """
+        Split the sketch budget between the current shards: the ingest buffers are resized to their share (folding
+        what they hold) and the sketches compacted to theirs.
+        """
+        if self.budget is None:
+            return
+        # the shard locks are only ever taken after the shards lock, never the other way around.
+        with self.shards_lock:
+            self.budget.split(len(self.shards))
+            buffer_size = self.shard_buffer_size()
+            for shard in self.shards:
+                with shard.lock:
+                    if shard.buffer is not None and shard.buffer.capacity != buffer_size:
+                        shard.buffer.fold(shard.sketch)
+                        shard.buffer = IngestBuffer(buffer_size)
+                    self.budget.enforce(shard.sketch)
+
     def update_digest_with_vals(self, new_values: list):
-        with self.lock:
-            self.digest.batch_update(new_values)
+        """
+        :param new_values: a list, a NumPy array or a pandas Series (float64 arrays and Series are not copied)
+        """
+        shard = self._shard()
+        with shard.lock:
+            if self.ingest_buffer_size:
+                if shard.buffer is None:
+                    shard.buffer = IngestBuffer(self.shard_buffer_size())
+                shard.item_count += shard.buffer.add(shard.sketch, new_values)
+            else:
+                shard.sketch.batch_update(new_values)
+                shard.item_count += len(new_values)
+            if self.budget is not None:
+                self.budget.enforce(shard.sketch)
+        if self.flusher is not None and self.flush_item_count and \
+                self.pending_item_count() >= self.flush_item_count:
+            self.flush_event.set()
+
+    def pending_item_count(self):
+        """
+        Number of values ingested since the last send (read without locking, so it can lag behind a concurrent update).
+        """
+        return sum(shard.item_count for shard in self.shards) + sum(count for _, count in self.unsent)
+
+    def pending_body_size(self):
+        """
+        Upper estimate of the size of the next message body: the merged digest is never larger than its parts.
+        Values still in the ingest buffers are not counted.
+        """
+        sketches = [sketch for sketch, _ in self.unsent]
+        sketches.extend(shard.sketch for shard in self.shards if shard.item_count)
+        return self.combined_body_size(sketches)
+
+    def combined_body_size(self, sketches):
+        """
+        Upper estimate of the body size of the merge of sketches.
+        """
+        sizes = [estimated_body_size(sketch, self.configs.get('digest_format', 'json'),
+                                     self.configs.get('digest_precision', 'float64')) for sketch in sketches]
+        if self.configs.get('sketch_type', 'tdigest') == 'histogram':
+            return max(sizes, default=0)
+        return sum(sizes)
+
+    def swap_digest(self):
+        """
+        Atomically take the current content of every shard, leaving empty sketches behind.
+        :return: (merged sketch, number of items it summarizes)
+        """
+        with self.shards_lock:
+            shards = list(self.shards)
+            sketches, self.unsent = self.unsent, []
+
+        item_count = 0
+        for shard in shards:
+            if shard.item_count == 0:
+                continue
+            new_sketch = self.new_sketch()
+            with shard.lock:
+                if shard.buffer is not None:
+                    shard.buffer.fold(shard.sketch)
+                sketch, shard.sketch = shard.sketch, new_sketch
+                shard_count, shard.item_count = shard.item_count, 0
+            sketches.append((sketch, shard_count))
+            item_count += shard_count
+        self.prune_shards()
+
+        if not sketches:
+            return self.new_sketch(), 0
+        if len(sketches) == 1:
+            return sketches[0][0], sketches[0][1]
+        return self.merge_pending([sketch for sketch, _ in sketches]), sum(count for _, count in sketches)
+
+    def prune_shards(self):
+        """
+        Drop the empty shards of the producer threads that have exited, so thread churn does not grow the client, and
+        give their share of the sketch budget to the others.
+        """
+        with self.shards_lock:
+            for shard in self.shards:
+                shard.threads = [thread for thread in shard.threads if thread.is_alive()]
+            shards_count = len(self.shards)
+            self.shards = [shard for shard in self.shards if shard.threads or shard.item_count]
+            pruned = len(self.shards) < shards_count
+        if pruned:
+            self.rebalance_shards()
+
+    def merge_pending(self, sketches):
+        if self.budget is not None:
+            # the shards are compacted to their share of the budget, their merge gets the delta of the whole budget.
+            return merge_digests(sketches, self.budget.delta)
+        return merge_sketches(sketches)
+
+    def sketch_parts(self, sketch):
+        """
+        The sketches a shard sketch is made of.
+        """
+        return [sketch]
+
+    def sketch_footprint(self):
+        """
+        The centroid count, in memory bytes and serialized size of the pending sketches and their ingest buffers (read
+        without locking), see sketches.budget.footprint.
+        """
+        with self.shards_lock:
+            shards = list(self.shards)
+            sketches = [sketch for sketch, _ in self.unsent]
+        sketches.extend(shard.sketch for shard in shards)
+        report = footprint([part for sketch in sketches for part in self.sketch_parts(sketch)],
+                           [shard.buffer for shard in shards if shard.buffer is not None],
+                           self.configs.get('digest_format', 'json'), self.configs.get('digest_precision', 'float64'))
+        report['max_bytes'] = self.budget.max_bytes if self.budget is not None else 0
+        return report
+
+    def message_body(self, digest):
+        if self.budget is not None:
+            digest = self.budget.fit(digest)
+        return encode_body(digest, self.configs.get('digest_format', 'json'),
+                           self.configs.get('digest_precision', 'float64'))
 
     def send_t_digest(self):
         """
         Sends the T-Digest to the SQS queue.
+        The shards are swapped out first and the network call runs without holding any lock, so producer threads keep
+        updating while the digest is in flight.
         """
+        # after sending the digest, we reset it - the swap leaves empty shards behind.
+        digest, item_count = self.swap_digest()
+        self.last_flush_time = time.time()
         try:
-            with self.lock:
-                response = self.sqs.send_message(
-                    QueueUrl=self.configs['queue_url'],
-                    MessageBody=json.dumps(self.digest.to_dict())
-                )
+            return self.send_body(self.message_body(digest), item_count_attributes(item_count))
 
-                # after sending the digest, we reset it.
-                self.digest = TDigest()
+        except (ClientError, BotoCoreError) as e:
+            with self.shards_lock:
+                self.unsent.append((digest, item_count))
+            raise Exception(f"An error occurred: {e}")
+
+    def compress_message_body(self, body):
+        """
+        Compress the body with the "body_compression" configuration ("zlib" or "zstd") when it is at least
+        "compression_min_bytes" long, the server decompresses it transparently (see sketches.codec.compress_body).
+        """
+        if not self.configs.get('body_compression'):
+            return body
+        return compress_body(body, self.configs['body_compression'], self.configs.get('compression_min_bytes', 1024))
 
-                return response
+    def send_body(self, body, attributes=None):
+        """
+        Send a message body, or queue it in the send queue with "send_coalescing" (see flush_sends). A queued body is
+        sent by a later call even when sending its batch fails, so nothing is raised for it.
+        """
+        body = self.compress_message_body(body)
+        if self.configs.get('send_coalescing', False):
+            with self.shards_lock:
+                if self.send_queue is None:
+                    self.send_queue = SendQueue(self.sqs, self.configs['queue_url'])
+            return self.send_queue.put(body, attributes)
+        if attributes:
+            return self.sqs.send_message(QueueUrl=self.configs['queue_url'], MessageBody=body,
+                                         MessageAttributes=attributes)
+        return self.sqs.send_message(QueueUrl=self.configs['queue_url'], MessageBody=body)
 
-        except ClientError as e:
-            raise Exception(f"An error occurred: {e}")
+    def flush_sends(self):
+        """
+        Send the messages waiting in the send queue. The auto flush sends them once the oldest waited
+        "send_max_delay_seconds", without it call this after the last send.
+        :raises send_queue.SendPending: when some are still queued after a failed call, call it again to send them
+        """
+        if self.send_queue is not None:
+            self.send_queue.flush()
+
+    def should_flush(self):
+        """
+        Whether one of the auto flush policies is due. Nothing is sent while no values were ingested.
+        """
+        pending_items = self.pending_item_count()
+        if pending_items == 0:
+            return False
+        if self.flush_item_count and pending_items >= self.flush_item_count:
+            return True
+        if self.flush_interval_seconds and time.time() - self.last_flush_time >= self.flush_interval_seconds:
+            return True
+        return bool(self.flush_max_bytes) and self.pending_body_size() >= self.flush_max_bytes
+
+    def start_auto_flush(self, flush_item_count=None, flush_interval_seconds=None, flush_max_bytes=None):
+        """
+        Send the digest from a background thread whenever one of the policies is due, so the application does not
+        have to call send_t_digest itself. Every policy defaults to the configuration, 0 disables it.
+        :param flush_item_count: send once this many values were ingested
+        :param flush_interval_seconds: send at least this often (only when something was ingested)
+        :param flush_max_bytes: send once the encoded digest would reach this size (SQS accepts up to 256KB)
+        """
+        if flush_item_count is not None:
+            self.flush_item_count = flush_item_count
+        if flush_interval_seconds is not None:
+            self.flush_interval_seconds = flush_interval_seconds
+        if flush_max_bytes is not None:
+            self.flush_max_bytes = flush_max_bytes
+        if self.flusher is not None:
+            return
+        self.flush_stop_event.clear()
+        self.flusher = threading.Thread(target=self._auto_flush_loop, daemon=True)
+        self.flusher.start()
+
+    def stop_auto_flush(self, flush=True):
+        """
+        Stop the background thread, sending whatever is still pending unless flush is False.
+        """
+        if self.flusher is None:
+            return
+        self.flush_stop_event.set()
+        self.flush_event.set()
+        self.flusher.join()
+        self.flusher = None
+        if flush and self.pending_item_count():
+            self.send_t_digest()
+        if flush:
+            self.flush_sends()
+
+    def _auto_flush_loop(self):
+        while not self.flush_stop_event.is_set():
+            timeout = self.flush_check_seconds
+            if self.flush_interval_seconds:
+                timeout = min(timeout, max(0., self.last_flush_time + self.flush_interval_seconds - time.time()))
+            self.flush_event.wait(timeout)
+            self.flush_event.clear()
+            if self.send_queue is not None and \
+                    self.send_queue.oldest_age() >= self.configs.get('send_max_delay_seconds', 1.):
+                try:
+                    self.flush_sends()
+                except Exception as e:
+                    print(f"sending the queued messages failed: {e}")
+            if self.flush_stop_event.is_set() or not self.should_flush():
+                continue
+            try:
+                self.send_t_digest()
+            except Exception as e:
+                # the digest is kept and goes out with the next flush.
+                print(f"auto flush failed: {e}")
 
     def send_any_object(self, item_to_send):
         """
@@ -70,21 +412,127 @@ class EdgeClient:
         :param item_to_send: the item to be sent, has to be JSON serializable
         """
         try:
-            with self.lock:
-                response = self.sqs.send_message(
-                    QueueUrl=self.configs['queue_url'],
-                    MessageBody=json.dumps(item_to_send)
-                )
-
-                return response
+            return self.send_body(json.dumps(item_to_send))
 
-        except ClientError as e:
+        except (ClientError, BotoCoreError) as e:
             raise Exception(f"An error occurred: {e}")
 
     def clear_queue_from_all_messages(self):
         self.sqs.purge_queue(QueueUrl=self.configs['queue_url'])
 
 
+class MultiFeatureEdgeClient(EdgeClient):
+    """
+    EdgeClient for model inputs with many numeric columns: every batch of rows updates one sketch per column, and all
+    the column sketches go out together in one multi digest message (see sketches.codec.encode_multi_body) that the
+    server routes to the monitor of each feature.
+    The schema is the "features" configuration, a list of column names, or of {"name", "histogram_min",
+    "histogram_max"} or {"name", "reference_artifact"} objects when the sketch type is histogram.
+    """
+
+    def __init__(self, config_file='client_configs.json', sqs_client=None, features=None):
+        """
+        :param features: the feature schema, defaults to the "features" configuration
+        """
+        super().__init__(config_file, sqs_client)
+        # "max_sketch_bytes" bounds the single digest of EdgeClient, the column sketches are not budgeted.
+        self.budget = None
+        features = features if features is not None else self.configs.get('features', [])
+        self.features = [feature if isinstance(feature, dict) else {'name': feature} for feature in features]
+        self.feature_names = [feature['name'] for feature in self.features]
+        if not self.features:
+            raise Exception("MultiFeatureEdgeClient needs a features schema.")
+
+    def new_sketch(self):
+        # (feature, segment) -> [column sketch, item count], filled by update_batch.
+        return {}
+
+    def column_sketch(self, feature, column):
+        """
+        A sketch of one column: a HistogramSketch, or an array digest dictionary built with one vectorized merge.
+        """
+        if self.configs.get('sketch_type', 'tdigest') == 'histogram':
+            histogram = HistogramSketch(*self.histogram_range(feature),
+                                        feature.get('histogram_bins', self.configs.get('histogram_bins', 1000)))
+            histogram.batch_update(column)
+            return histogram
+        return merge_digests([values_digest(column, self.configs.get('delta', 0.01), self.configs.get('K', 25))])
+
+    @staticmethod
+    def update_column_sketch(sketch, column):
+        if isinstance(sketch, HistogramSketch):
+            sketch.batch_update(column)
+            return sketch
+        return merge_digests([sketch, values_digest(column, sketch['delta'], sketch['K'])])
+
+    def batch_columns(self, batch):
+        """
+        The batch as a (rows, features) float64 array in schema order.
+        :param batch: a 2-D NumPy array with the columns in schema order, or a pandas DataFrame with the schema columns
+        """
+        if hasattr(batch, 'columns'):
+            batch = batch[self.feature_names].to_numpy(dtype=np.float64)
+        values = np.asarray(batch, dtype=np.float64)
+        if values.ndim != 2 or values.shape[1] != len(self.features):
+            raise Exception(f"Expected a batch with {len(self.features)} columns, got shape {values.shape}")
+        return values
+
+    def update_batch(self, batch, segment=None):
+        """
+        Update the sketch of every column with a batch of rows, one vectorized update per column.
+        Missing values (NaN) are skipped.
+        :param segment: the segment (user group) the rows belong to, None for no segment
+        """
+        values = self.batch_columns(batch)
+        shard = self._shard()
+        with shard.lock:
+            for index, feature in enumerate(self.features):
+                column = values[:, index]
+                column = column[~np.isnan(column)]
+                key = (feature['name'], segment)
+                if key in shard.sketch:
+                    entry = shard.sketch[key]
+                    entry[0] = self.update_column_sketch(entry[0], column)
+                    entry[1] += len(column)
+                else:
+                    shard.sketch[key] = [self.column_sketch(feature, column), len(column)]
+            shard.item_count += len(values)
+        if self.flusher is not None and self.flush_item_count and \
+                self.pending_item_count() >= self.flush_item_count:
+            self.flush_event.set()
+
+    def update_digest_with_vals(self, new_values: list):
+        raise Exception("MultiFeatureEdgeClient takes batches of rows, use update_batch.")
+
+    def sketch_parts(self, sketch):
+        return [column_sketch for column_sketch, _ in sketch.values()]
+
+    def merge_pending(self, sketches):
+        merged = {}
+        for column_sketches in sketches:
+            for key, (sketch, item_count) in column_sketches.items():
+                merged.setdefault(key, ([], []))
+                merged[key][0].append(sketch)
+                merged[key][1].append(item_count)
+        return {key: [merge_sketches(column_sketches), sum(counts)]
+                for key, (column_sketches, counts) in merged.items()}
+
+    def combined_body_size(self, sketches):
+        size = 0
+        for feature, segment in {key for column_sketches in sketches for key in column_sketches}:
+            size += super().combined_body_size([column_sketches[(feature, segment)][0] for column_sketches in sketches
+                                                if (feature, segment) in column_sketches])
+            # the entry header, feature name and segment of the multi digest layout.
+            size += 4 * -(-(MULTI_ENTRY_SIZE + len(feature) + len(segment or '')) // 3)
+        return size
+
+    def message_body(self, digest):
+        return encode_multi_body(((feature, segment, sketch, item_count)
+                                  for (feature, segment), (sketch, item_count) in digest.items()),
+                                 self.configs.get('digest_format', 'json'),
+                                 self.configs.get('digest_precision', 'float64'))
+
+
 class MockEdgeClient:
     """
     A mock class for EdgeClient - Only use for integrations - just a mock for integration with no dependencies.
@@ -96,7 +544,7 @@ class MockEdgeClient:
         Initialize the mock client with configurations from the provided file.
         """
         self.configs = self.read_config(config_file)
-        self.digest = TDigest()
+        self.digest = MergingDigest()
         self.lock = threading.Lock()
 
     @staticmethod
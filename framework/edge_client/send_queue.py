@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import deque
+from botocore.exceptions import BotoCoreError, ClientError
+from sketches.codec import MAX_MESSAGE_BYTES
+
+# send_message_batch takes at most 10 entries.
+MAX_BATCH_ENTRIES = 10
+
+
+def message_size(body, attributes=None):
+    """
+    The size SQS counts for a message: the body, and the name, type and value of every attribute.
+    """
+    size = len(body.encode('utf-8'))
+    for name, attribute in (attributes or {}).items():
+        size += len(name) + len(attribute['DataType']) + len(attribute.get('StringValue', ''))
+    return size
+
+
+class SendPending(Exception):
+    """
+    A send_message_batch call failed and its messages are still queued: they go out with a later call (the next put or
+    flush), so the caller must not send them again.
+    """
+
+
+class SendQueue:
+    """
+    Outbound queue of an edge client: the messages are coalesced into send_message_batch calls of up to 10 entries and
+    MAX_MESSAGE_BYTES, sent as soon as a call is full or on flush(). The entries of a failed call stay queued and go
+    out with the next one: put() does not raise for them, flush() raises SendPending.
+    """
+
+    def __init__(self, sqs, queue_url, max_entries=MAX_BATCH_ENTRIES, max_bytes=MAX_MESSAGE_BYTES):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # (body, attributes, size, time it was queued)
+        self.pending = deque()
+        self.pending_bytes = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def put(self, body, attributes=None):
+        """
+        Queue a message, sending the full calls. Once queued the message is not lost: when sending fails it stays queued
+        and nothing is raised.
+        """
+        size = message_size(body, attributes)
+        if size > self.max_bytes:
+            raise Exception(f"A message of {size} bytes is over the SQS limit of {self.max_bytes} bytes.")
+        with self.lock:
+            self.pending.append((body, attributes, size, time.time()))
+            self.pending_bytes += size
+        try:
+            while self.full() and self.send_batch():
+                pass
+        except SendPending as e:
+            print(f"{e}, retrying with the next call")
+
+    def full(self):
+        # the pending messages do not fit one call anymore.
+        return len(self.pending) >= self.max_entries or self.pending_bytes > self.max_bytes
+
+    def oldest_age(self):
+        """
+        Seconds the oldest pending message has waited, 0 when none is pending.
+        """
+        with self.lock:
+            return time.time() - self.pending[0][3] if self.pending else 0.
+
+    def flush(self):
+        """
+        Send every pending message.
+        :raises SendPending: when messages are left queued after a failed call, flush again later to send them
+        """
+        while self.pending and self.send_batch():
+            pass
+        if self.pending:
+            raise SendPending(f"{len(self.pending)} messages are still queued")
+
+    def take_batch(self):
+        with self.lock:
+            batch, size = [], 0
+            while self.pending and len(batch) < self.max_entries and size + self.pending[0][2] <= self.max_bytes:
+                entry = self.pending.popleft()
+                batch.append(entry)
+                size += entry[2]
+            self.pending_bytes -= size
+            return batch
+
+    def requeue(self, entries):
+        with self.lock:
+            self.pending.extendleft(reversed(entries))
+            self.pending_bytes += sum(entry[2] for entry in entries)
+
+    def send_batch(self):
+        """
+        Send the oldest pending messages in one send_message_batch call.
+        :return: the number of messages sent, the messages that failed are queued again
+        :raises SendPending: when the call itself failed, its messages are queued again
+        """
+        batch = self.take_batch()
+        if not batch:
+            return 0
+        entries = []
+        for index, (body, attributes, _, _) in enumerate(batch):
+            entry = {'Id': str(index), 'MessageBody': body}
+            if attributes:
+                entry['MessageAttributes'] = attributes
+            entries.append(entry)
+        try:
+            response = self.sqs.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+        except (ClientError, BotoCoreError) as e:
+            self.requeue(batch)
+            raise SendPending(f"Sending {len(batch)} messages failed: {e}")
+        failed = response.get('Failed', [])
+        if failed:
+            self.requeue([batch[int(entry['Id'])] for entry in failed])
+            print(f"failed sending messages: {failed}")
+        return len(batch) - len(failed)
@@ -0,0 +1,306 @@
+import asyncio
+import contextlib
+import json
+import numpy as np
+from botocore.exceptions import ClientError
+from sketches.ks import centroid_arrays
+from sketches.histogram import as_histogram
+from sketches.codec import ITEM_COUNT_ATTRIBUTE
+from sketches.merging_digest import COMPRESSION_FACTOR, MergingDigest
+from queue_consumer_server.redis_scripts import MERGE_DIGEST_SCRIPT
+from queue_consumer_server.sqs_server import AtomicRedisHandler, SQSServer
+
+
+class AsyncRedisHandler:
+    """
+    RedisHandler on a redis.asyncio client. The digest is only reset by restart_digest(), which the server awaits
+    when it is opened.
+    """
+
+    def __init__(self, digest_name="default_digest", restart_digest=True, batch_size=5000, redis_client=None):
+        self.redis_client = redis_client
+        self.digest_name = digest_name
+        self.restart_on_open = restart_digest
+        self.batch_size = batch_size
+
+    async def update_digest(self, new_digest_dict, digest_name="default_digest"):
+        curr_digest_raw = await self.redis_client.get(digest_name)
+        curr_digest = MergingDigest()
+        if curr_digest_raw is not None:
+            curr_digest.update_from_dict(json.loads(curr_digest_raw))
+        curr_digest.update_from_dict(new_digest_dict)
+        await self.redis_client.set(digest_name, json.dumps(curr_digest.to_dict()))
+
+    async def queue_update(self, pipeline, new_digest, digest_name="default_digest"):
+        await self.update_digest(new_digest, digest_name)
+
+    async def get_t_digest_dict(self, digest_name="default_digest"):
+        return json.loads(await self.redis_client.get(digest_name))
+
+    async def get_centroid_arrays(self, digest_name="default_digest"):
+        return centroid_arrays(await self.get_t_digest_dict(digest_name))
+
+    async def restart_digest(self, digest_name="default_digest"):
+        await self.redis_client.set(digest_name, json.dumps(MergingDigest().to_dict()))
+
+
+class AsyncAtomicRedisHandler(AsyncRedisHandler):
+    """
+    AtomicRedisHandler on a redis.asyncio client, the merge is the same Lua script.
+    """
+
+    def __init__(self, digest_name="default_digest", restart_digest=True, batch_size=5000, redis_client=None):
+        super().__init__(digest_name, restart_digest, batch_size, redis_client)
+        self.merge_script = self.redis_client.register_script(MERGE_DIGEST_SCRIPT)
+
+    async def update_digest(self, new_digest_dict, digest_name="default_digest"):
+        await self.merge_script(keys=[digest_name],
+                                args=[AtomicRedisHandler.to_compact(new_digest_dict), COMPRESSION_FACTOR])
+
+    async def queue_update(self, pipeline, new_digest, digest_name="default_digest"):
+        await self.merge_script(keys=[digest_name],
+                                args=[AtomicRedisHandler.to_compact(new_digest), COMPRESSION_FACTOR], client=pipeline)
+
+    async def get_t_digest_dict(self, digest_name="default_digest"):
+        compact = json.loads(await self.redis_client.get(digest_name))
+        return {'n': compact['n'], 'delta': compact['delta'], 'K': compact['K'],
+                'centroids': [{'m': m, 'c': c} for m, c in zip(compact['m'], compact['c'])]}
+
+    async def get_centroid_arrays(self, digest_name="default_digest"):
+        compact = json.loads(await self.redis_client.get(digest_name))
+        return np.asarray(compact['m'], dtype=np.float64), np.asarray(compact['c'], dtype=np.float64)
+
+    async def restart_digest(self, digest_name="default_digest"):
+        await self.redis_client.set(digest_name, AtomicRedisHandler.to_compact(MergingDigest().to_dict()))
+
+
+class AsyncHistogramRedisHandler(AsyncRedisHandler):
+    """
+    HistogramRedisHandler on a redis.asyncio client.
+    """
+
+    async def update_digest(self, new_histogram, digest_name="default_digest"):
+        async with self.redis_client.pipeline(transaction=True) as pipeline:
+            await self.queue_update(pipeline, new_histogram, digest_name)
+            await pipeline.execute()
+
+    async def queue_update(self, pipeline, new_histogram, digest_name="default_digest"):
+        histogram = as_histogram(new_histogram)
+        for index in np.flatnonzero(histogram.counts):
+            pipeline.hincrby(digest_name, int(index), int(histogram.counts[index]))
+
+    async def get_histogram(self, template, digest_name="default_digest"):
+        histogram = template.empty_copy()
+        for index, count in (await self.redis_client.hgetall(digest_name)).items():
+            histogram.counts[int(index)] = int(count)
+        return histogram
+
+    async def get_t_digest_dict(self, digest_name="default_digest"):
+        raise Exception("The aggregated sketch is a histogram, use get_histogram.")
+
+    async def restart_digest(self, digest_name="default_digest"):
+        await self.redis_client.delete(digest_name)
+
+
+class AsyncSQSServer(SQSServer):
+    """
+    asyncio variant of SQSServer: aiobotocore for SQS and redis.asyncio for Redis, so one event loop long-polls
+    several queues concurrently (the "queue_urls" configuration, default the single "queue_url") while merges are in
+    flight.
+
+        async with AsyncSQSServer() as server:
+            await server.run(stop_event)
+
+    Setting stop_event stops receiving, the batches already received are still processed and deleted before run()
+    returns. Messages whose long poll was cancelled stay in the queue.
+    """
+
+    def __init__(self, config_file='server_configs.json', aggregation_size=500000, alerting_threshold=0.05,
+                 sqs_client=None, redis_client=None):
+        """
+        sqs_client and redis_client can be given to use existing async clients (e.g. fakeredis.aioredis.FakeRedis).
+        """
+        self.exit_stack = None
+        super().__init__(config_file, aggregation_size, alerting_threshold, sqs_client, redis_client)
+        if self.window is not None:
+            raise Exception("Time bucketed windows are not supported by AsyncSQSServer, use SQSServer.")
+        self.lock = asyncio.Lock()
+        self.queue_urls = self.configs.get('queue_urls') or [self.configs['queue_url']]
+
+    def create_sqs_client(self):
+        # aiobotocore clients are async context managers, the client is created in open().
+        return None
+
+    def create_redis_client(self):
+        import redis.asyncio
+        # update redis credentials here...
+        return redis.asyncio.Redis(host='localhost', port=32768, password='redispw', db=0)
+
+    def redis_handler_class(self, sketch_type=None):
+        if (sketch_type or self.sketch_type) == "histogram":
+            return AsyncHistogramRedisHandler
+        if self.configs.get("atomic_redis_merge"):
+            return AsyncAtomicRedisHandler
+        return AsyncRedisHandler
+
+    async def open(self):
+        if self.sqs is None:
+            from aiobotocore.session import get_session
+            self.exit_stack = contextlib.AsyncExitStack()
+            self.sqs = await self.exit_stack.enter_async_context(
+                get_session().create_client('sqs', endpoint_url=self.configs["endpoint_url"]))
+        if self.redis_handler.restart_on_open:
+            await self.redis_handler.restart_digest()
+        return self
+
+    async def close(self):
+        if self.exit_stack is not None:
+            await self.exit_stack.aclose()
+            self.exit_stack = None
+            self.sqs = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def run(self, stop_event=None):
+        """
+        Long-poll every configured queue concurrently until stop_event is set (forever without one).
+        """
+        stop_event = stop_event or asyncio.Event()
+        await asyncio.gather(*(self.poll_queue(queue_url, stop_event) for queue_url in self.queue_urls))
+
+    async def poll_queue(self, queue_url, stop_event):
+        stop_wait = asyncio.ensure_future(stop_event.wait())
+        try:
+            while not stop_event.is_set():
+                receive = asyncio.ensure_future(self.receive_messages(queue_url))
+                await asyncio.wait([receive, stop_wait], return_when=asyncio.FIRST_COMPLETED)
+                if not receive.done():
+                    # stopping during a long poll, nothing was received yet.
+                    receive.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await receive
+                    break
+                await self.handle_messages(receive.result(), queue_url)
+        finally:
+            stop_wait.cancel()
+
+    async def poll_messages(self):
+        """
+        Receive and process one batch from each configured queue.
+        """
+        async def poll_once(queue_url):
+            await self.handle_messages(await self.receive_messages(queue_url), queue_url)
+
+        await asyncio.gather(*(poll_once(queue_url) for queue_url in self.queue_urls))
+
+    async def receive_messages(self, queue_url):
+        try:
+            return (await self.sqs.receive_message(
+                QueueUrl=queue_url,
+                MaxNumberOfMessages=self.configs.get('max_number_of_messages', 10),
+                WaitTimeSeconds=self.configs.get('wait_time_seconds', 20),
+                MessageAttributeNames=[ITEM_COUNT_ATTRIBUTE]
+            )).get('Messages', [])
+        except ClientError as e:
+            raise Exception(f"An error occurred: {e}")
+
+    async def handle_messages(self, messages, queue_url):
+        if messages:
+            await self.process_messages(messages)
+            await self.delete_messages([message['ReceiptHandle'] for message in messages], queue_url)
+
+    async def process_message(self, message):
+        await self.process_messages([message])
+
+    async def process_messages(self, messages):
+        default_digest, default_count, routed = self.route_messages(messages)
+        if default_digest is not None:
+            await self.process_digest(default_digest, default_count)
+        if routed:
+            await self.process_monitor_digests(routed)
+
+    async def process_digest(self, digest, item_count):
+        """
+        Same as SQSServer.process_digest, the lock only orders the coroutines of this server.
+        """
+        async with self.lock:
+            await self.redis_handler.update_digest(digest)
+
+            new_count = await self.redis_client.incr("default_digest_counter", item_count)
+            print(f"server current aggregation count: {new_count}")
+            self.track_running_ks(digest, new_count)
+            if new_count >= self.aggregation_size:
+                # end of the window, full test on the aggregated digest.
+                max_cdf, max_location = await self.compute_ks()
+
+                if self.drift_test.is_drift(max_cdf, self.reference.n, new_count):
+                    # TODO: add preferred alerting method here...
+                    print(f"DATA DRIFT DETECTED... {self.drift_test.describe(max_cdf, self.reference.n, new_count)} "
+                          f"at: {max_location}")
+
+                await self.redis_handler.restart_digest()
+                await self.redis_client.set("default_digest_counter", 0)
+                self.reset_running_ks()
+
+    async def process_monitor_digests(self, routed):
+        """
+        Same as SQSServer.process_monitor_digests.
+        """
+        async with self.lock:
+            async with self.redis_client.pipeline(transaction=False) as pipeline:
+                counter_positions = []
+                for (monitor, segment), (digest, item_count) in routed.items():
+                    await self.monitor_handler(monitor).queue_update(pipeline, digest, monitor.digest_key(segment))
+                    counter_positions.append(len(pipeline))
+                    pipeline.incrby(monitor.counter_key(segment), item_count)
+                results = await pipeline.execute()
+
+            for (monitor, segment), position in zip(routed, counter_positions):
+                new_count = results[position]
+                if new_count < monitor.aggregation_size:
+                    continue
+                max_cdf, max_location = await self.compute_monitor_ks(monitor, segment)
+                if monitor.drift_test.is_drift(max_cdf, monitor.reference.n, new_count):
+                    # TODO: add preferred alerting method here...
+                    print(f"DATA DRIFT DETECTED... monitor: {monitor.name} segment: {segment} "
+                          f"{monitor.drift_test.describe(max_cdf, monitor.reference.n, new_count)} at: {max_location}")
+
+                await self.monitor_handler(monitor).restart_digest(monitor.digest_key(segment))
+                await self.redis_client.set(monitor.counter_key(segment), 0)
+
+    async def compute_monitor_ks(self, monitor, segment):
+        handler = self.monitor_handler(monitor)
+        if monitor.sketch_type == "histogram":
+            histogram = await handler.get_histogram(monitor.ref_histogram, monitor.digest_key(segment))
+            return histogram.ks_from_cdf(monitor.ref_histogram_cdf)
+
+        test_means, test_counts = await handler.get_centroid_arrays(monitor.digest_key(segment))
+        return monitor.reference_ks(test_means, test_counts)
+
+    async def compute_ks(self):
+        if self.sketch_type == "histogram":
+            histogram = await self.redis_handler.get_histogram(self.ref_histogram)
+            return histogram.ks_from_cdf(self.ref_histogram_cdf)
+
+        test_means, test_counts = await self.redis_handler.get_centroid_arrays()
+        return self.reference_ks(test_means, test_counts)
+
+    async def delete_messages(self, receipt_handles, queue_url=None):
+        """
+        Delete processed messages with delete_message_batch, 10 per call (the SQS limit).
+        """
+        for i in range(0, len(receipt_handles), 10):
+            response = await self.sqs.delete_message_batch(
+                QueueUrl=queue_url or self.configs['queue_url'],
+                Entries=[{'Id': str(j), 'ReceiptHandle': handle}
+                         for j, handle in enumerate(receipt_handles[i:i + 10])]
+            )
+            if response.get('Failed'):
+                print(f"failed deleting messages: {response['Failed']}")
+
+    def print_combined_digest_dict(self):
+        print(self.combined_digest.to_dict())
@@ -0,0 +1,130 @@
+import os
+from sketches.ks import digest_cdf, grid_ks
+from sketches.histogram import HistogramSketch
+from sketches.pvalue import DriftTest
+from queue_consumer_server.reference_artifact import load_reference_artifact
+
+# monitor segment matching every segment, each segment still gets its own Redis keys.
+ANY_SEGMENT = '*'
+
+
+class Monitor:
+    """
+    A named drift monitor: the reference distribution of one feature, its alerting threshold and aggregation size.
+    Monitors are matched to incoming digests by feature and segment (user group); the aggregated sketch and counter
+    of every segment live under their own Redis keys.
+    """
+
+    def __init__(self, name, feature, reference, segment=ANY_SEGMENT, alerting_threshold=0.05,
+                 aggregation_size=500000, sketch_type='tdigest', histogram_bins=1000, grid_strategy='reference_points',
+                 grid_size=1000, significance=None, digest_error=0.):
+        """
+        :param name: unique monitor name, used as the prefix of its Redis keys
+        :param feature: feature name the clients send the digests under
+        :param reference: the ReferenceArtifact of the feature
+        :param segment: the segment this monitor watches, ANY_SEGMENT for all of them
+        :param alerting_threshold: KS statistic above which drift is reported
+        :param aggregation_size: number of items aggregated before the KS test runs
+        :param sketch_type: 'tdigest' or 'histogram', has to match what the clients send
+        :param grid_strategy: evaluation grid of the t-digest KS test, one of sketches.ks.GRID_STRATEGIES, where
+                              'reference_points' is the grid of the reference artifact
+        :param significance: when set, drift is reported by p-value instead of alerting_threshold (see DriftTest)
+        :param digest_error: bound on the sketch error of the KS statistic used by the p-value
+        """
+        self.name = name
+        self.feature = feature
+        self.segment = segment
+        self.reference = reference
+        self.alerting_threshold = alerting_threshold
+        self.aggregation_size = aggregation_size
+        self.drift_test = DriftTest(alerting_threshold, significance, digest_error)
+        self.sketch_type = sketch_type
+        self.grid_strategy = grid_strategy
+        self.grid_size = grid_size
+        if sketch_type == 'histogram':
+            self.ref_histogram = HistogramSketch(reference.grid[0], reference.grid[-1], histogram_bins)
+            self.ref_histogram_cdf = digest_cdf(reference.means, reference.counts, self.ref_histogram.upper_edges())
+
+    @classmethod
+    def from_config(cls, monitor_config, base_dir):
+        """
+        :param monitor_config: one entry of the server "monitors" configuration
+        :param base_dir: directory the reference_artifact path is relative to
+        """
+        if not monitor_config.get('reference_artifact'):
+            raise Exception(f"Monitor {monitor_config['name']} has no reference_artifact.")
+        reference = load_reference_artifact(os.path.join(base_dir, monitor_config['reference_artifact']))
+        return cls(monitor_config['name'], monitor_config['feature'], reference,
+                   segment=monitor_config.get('segment', ANY_SEGMENT),
+                   alerting_threshold=monitor_config.get('alerting_threshold', 0.05),
+                   aggregation_size=monitor_config.get('aggregation_size', 500000),
+                   sketch_type=monitor_config.get('sketch_type', 'tdigest'),
+                   histogram_bins=monitor_config.get('histogram_bins', 1000),
+                   grid_strategy=monitor_config.get('ks_grid_strategy', 'reference_points'),
+                   grid_size=monitor_config.get('ks_grid_size', 1000),
+                   significance=monitor_config.get('alerting_significance'),
+                   digest_error=monitor_config.get('digest_error_bound', 0.))
+
+    def digest_key(self, segment=None):
+        return f"{self.name}:{segment or ''}:digest"
+
+    def counter_key(self, segment=None):
+        return f"{self.name}:{segment or ''}:counter"
+
+    def compute_ks(self, redis_handler, segment=None):
+        """
+        KS statistic of the aggregated sketch of a segment against the reference.
+        :param redis_handler: a handler for the sketch type of this monitor
+        :return: (KS statistic, the point where it is attained)
+        """
+        if self.sketch_type == 'histogram':
+            histogram = redis_handler.get_histogram(self.ref_histogram, self.digest_key(segment))
+            return histogram.ks_from_cdf(self.ref_histogram_cdf)
+
+        test_means, test_counts = redis_handler.get_centroid_arrays(self.digest_key(segment))
+        return self.reference_ks(test_means, test_counts)
+
+    def reference_ks(self, test_means, test_counts):
+        """
+        KS statistic of an aggregated t-digest against the reference, on the evaluation grid of grid_strategy.
+        """
+        return grid_ks(self.reference.means, self.reference.counts, test_means, test_counts, self.grid_strategy,
+                       ref_points=self.reference.grid, grid_size=self.grid_size)
+
+
+class MonitorRegistry:
+    """
+    The monitors of a server, looked up by (feature, segment). A monitor of a specific segment takes precedence over
+    an ANY_SEGMENT monitor of the same feature.
+    """
+
+    def __init__(self, monitors=()):
+        self.monitors = {}
+        self.by_feature = {}
+        for monitor in monitors:
+            self.add(monitor)
+
+    @classmethod
+    def from_configs(cls, monitor_configs, base_dir):
+        return cls(Monitor.from_config(monitor_config, base_dir) for monitor_config in monitor_configs)
+
+    def add(self, monitor):
+        if monitor.name in self.monitors:
+            raise Exception(f"Duplicate monitor name: {monitor.name}")
+        self.monitors[monitor.name] = monitor
+        self.by_feature[(monitor.feature, monitor.segment)] = monitor
+
+    def find(self, feature, segment=None):
+        """
+        :return: the monitor of the feature and segment, None when no monitor watches it
+        """
+        monitor = self.by_feature.get((feature, segment))
+        if monitor is None:
+            monitor = self.by_feature.get((feature, ANY_SEGMENT))
+        return monitor
+
+    def __len__(self):
+        return len(self.monitors)
+
+    def __iter__(self):
+        return iter(self.monitors.values())
@@ -0,0 +1,71 @@
+# Lua scripts executed inside Redis. Redis runs a script atomically, so every consumer (threads, servers or
+# lambdas) can merge into the same key without a lock and without losing updates.
+#
+# Digests are stored in a compact layout: {"n": .., "delta": .., "K": .., "m": [means...], "c": [counts...]}
+# with the means sorted. Numbers are written with %.17g so doubles round trip exactly.
+# ARGV[2] scales the delta the merge compresses at (merge.COMPRESSION_FACTOR), so the atomic merge compresses
+# exactly like the MergingDigest merges of the other handlers.
+
+MERGE_DIGEST_SCRIPT = """
+local function fmt(x)
+    return string.format('%.17g', x)
+end
+
+local incoming = cjson.decode(ARGV[1])
+local stored_raw = redis.call('GET', KEYS[1])
+local stored
+if stored_raw then
+    stored = cjson.decode(stored_raw)
+else
+    stored = {n = 0, delta = incoming.delta, K = incoming.K, m = {}, c = {}}
+end
+
+-- merge the two sorted centroid arrays by mean.
+local a_m, a_c, b_m, b_c = stored.m, stored.c, incoming.m, incoming.c
+local m, c = {}, {}
+local i, j = 1, 1
+while i <= #a_m or j <= #b_m do
+    if j > #b_m or (i <= #a_m and a_m[i] <= b_m[j]) then
+        m[#m + 1] = a_m[i]
+        c[#c + 1] = a_c[i]
+        i = i + 1
+    else
+        m[#m + 1] = b_m[j]
+        c[#c + 1] = b_c[j]
+        j = j + 1
+    end
+end
+
+local total = 0
+for k = 1, #c do
+    total = total + c[k]
+end
+
+-- compress in one pass, as sketches.merge.compress_centroids: the centroids whose quantile midpoints fall in the same
+-- unit interval of the scale function k(q) = log(q / (1 - q)) / (4 * delta) are combined.
+local delta = stored.delta
+local compression_delta = delta * (tonumber(ARGV[2]) or 1)
+local out_m, out_c = {}, {}
+local before, bucket, weighted_sum, weight = 0, nil, 0, 0
+for k = 1, #m do
+    local q = (before + c[k] / 2) / total
+    before = before + c[k]
+    local k_bucket = math.floor(math.log(q / (1 - q)) / (4 * compression_delta))
+    if bucket ~= nil and k_bucket ~= bucket then
+        out_m[#out_m + 1] = fmt(weighted_sum / weight)
+        out_c[#out_c + 1] = fmt(weight)
+        weighted_sum, weight = 0, 0
+    end
+    bucket = k_bucket
+    weighted_sum = weighted_sum + m[k] * c[k]
+    weight = weight + c[k]
+end
+if bucket ~= nil then
+    out_m[#out_m + 1] = fmt(weighted_sum / weight)
+    out_c[#out_c + 1] = fmt(weight)
+end
+
+redis.call('SET', KEYS[1], '{"n":' .. fmt(total) .. ',"delta":' .. fmt(delta) .. ',"K":' .. fmt(stored.K) ..
+        ',"m":[' .. table.concat(out_m, ',') .. '],"c":[' .. table.concat(out_c, ',') .. ']}')
+return #out_m
+"""
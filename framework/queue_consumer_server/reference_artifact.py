@@ -0,0 +1,142 @@
+import argparse
+import hashlib
+import os
+import struct
+import numpy as np
+from sketches.ks import centroid_arrays, digest_cdf
+from sketches.merging_digest import MergingDigest
+
+# header: magic, version, centroids count, grid size, n, delta, K, sha256 of the payload. padded to HEADER_SIZE.
+HEADER_FORMAT = '<8sIIQQddd32s'
+HEADER_SIZE = 128
+MAGIC = b'KSREF\x00\x00\x00'
+VERSION = 1
+
+# artifacts loaded by this process - kept at module level so warm Lambda invocations reuse the mapping.
+_loaded_artifacts = {}
+
+
+class ReferenceArtifact:
+    """
+    The precompiled reference distribution used by the server for the KS test.
+    Holds the sorted centroid means and weights of the reference digest, their cumulative weights,
+    the evaluation grid and the reference CDF on that grid, so nothing has to be refitted on startup.
+    """
+
+    def __init__(self, means, counts, cum_counts, grid, grid_cdf, n, delta, K, content_hash=None):
+        self.means = means
+        self.counts = counts
+        self.cum_counts = cum_counts
+        self.grid = grid
+        self.grid_cdf = grid_cdf
+        self.n = n
+        self.delta = delta
+        self.K = K
+        self.content_hash = content_hash if content_hash is not None else self.compute_hash()
+
+    @classmethod
+    def from_data(cls, ref_data, grid_size=None, delta=0.01, K=25):
+        """
+        Fit the reference digest and precompute everything the server needs.
+        :param ref_data: the reference dataset (any iterable of numbers)
+        :param grid_size: number of quantile points in the evaluation grid, None keeps every distinct reference value
+        """
+        ref_data = np.asarray(ref_data, dtype=np.float64)
+        ref_digest = MergingDigest(delta, K)
+        ref_digest.batch_update(ref_data)
+        means, counts = centroid_arrays(ref_digest)
+
+        grid = np.unique(ref_data)
+        if grid_size is not None and grid_size < len(grid):
+            grid = np.unique(np.quantile(ref_data, np.linspace(0, 1, grid_size)))
+
+        return cls(means, counts, np.cumsum(counts), grid, digest_cdf(means, counts, grid),
+                   float(ref_digest.n), delta, K)
+
+    def compute_hash(self):
+        sha = hashlib.sha256()
+        for array in (self.means, self.counts, self.cum_counts, self.grid, self.grid_cdf):
+            sha.update(np.ascontiguousarray(array, dtype='<f8').tobytes())
+        sha.update(struct.pack('<ddd', self.n, self.delta, self.K))
+        return sha.digest()
+
+    def to_digest_dict(self):
+        """
+        The reference digest in the TDigest.to_dict() format.
+        """
+        return {'n': self.n, 'delta': self.delta, 'K': self.K,
+                'centroids': [{'m': float(m), 'c': float(c)} for m, c in zip(self.means, self.counts)]}
+
+    def save(self, file_path):
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, 0, len(self.means), len(self.grid),
+                             self.n, self.delta, self.K, self.content_hash)
+        with open(file_path, 'wb') as file:
+            file.write(header.ljust(HEADER_SIZE, b'\x00'))
+            for array in (self.means, self.counts, self.cum_counts, self.grid, self.grid_cdf):
+                file.write(np.ascontiguousarray(array, dtype='<f8').tobytes())
+
+    @classmethod
+    def load(cls, file_path, verify=False):
+        """
+        Memory-map an artifact file. The arrays are read-only views on the file, so this does not depend on the
+        reference size unless verify is set, in which case the content hash is recomputed.
+        """
+        with open(file_path, 'rb') as file:
+            header = file.read(struct.calcsize(HEADER_FORMAT))
+        magic, version, _, k, grid_size, n, delta, K, content_hash = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC:
+            raise Exception(f"{file_path} is not a reference artifact.")
+        if version != VERSION:
+            raise Exception(f"Unsupported reference artifact version: {version}")
+
+        sizes = [k, k, k, grid_size, grid_size]
+        arrays = []
+        offset = HEADER_SIZE
+        for size in sizes:
+            if size == 0:
+                arrays.append(np.empty(0, dtype='<f8'))
+            else:
+                arrays.append(np.memmap(file_path, dtype='<f8', mode='r', offset=offset, shape=(size,)))
+            offset += size * 8
+
+        artifact = cls(*arrays, n, delta, K, content_hash)
+        if verify and artifact.compute_hash() != content_hash:
+            raise Exception(f"Reference artifact {file_path} is corrupted, content hash mismatch.")
+        return artifact
+
+
+def load_reference_artifact(file_path, verify=False):
+    """
+    Load the artifact once per process and return the cached mapping on later calls.
+    """
+    abs_file_path = os.path.abspath(file_path)
+    if abs_file_path not in _loaded_artifacts:
+        _loaded_artifacts[abs_file_path] = ReferenceArtifact.load(abs_file_path, verify)
+    return _loaded_artifacts[abs_file_path]
+
+
+def read_reference_data(file_path, column=None):
+    """
+    Read a reference dataset from a .npy file, a csv (optionally a single column of it) or a text file of numbers.
+    """
+    if file_path.endswith('.npy'):
+        return np.load(file_path)
+    if file_path.endswith('.csv'):
+        import pandas as pd
+        df = pd.read_csv(file_path)
+        return df[column].to_numpy() if column else df.iloc[:, 0].to_numpy()
+    return np.loadtxt(file_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build a reference artifact for the SQS server.")
+    parser.add_argument('reference_data', help="path to the reference dataset (.npy, .csv or a text file)")
+    parser.add_argument('output', help="path of the artifact file to write")
+    parser.add_argument('--column', default=None, help="the csv column holding the monitored feature")
+    parser.add_argument('--grid-size', type=int, default=None, help="quantile grid size, default all distinct values")
+    args = parser.parse_args()
+
+    artifact = ReferenceArtifact.from_data(read_reference_data(args.reference_data, args.column), args.grid_size)
+    artifact.save(args.output)
+    print(f"wrote {args.output}: {len(artifact.means)} centroids, {len(artifact.grid)} grid points, "
+          f"sha256 {artifact.content_hash.hex()}")
@@ -0,0 +1,181 @@
+import queue
+import threading
+import time
+from sketches.codec import ITEM_COUNT_ATTRIBUTE
+
+# seconds the receiver waits after a failed receive_message call.
+RETRY_SECONDS = 1
+
+
+class SQSPipeline:
+    """
+    Pipelined consumer around an SQSServer, for long running servers (a Lambda gets its batch handed to it and
+    should keep using SQSServer.process_messages).
+    A receiver thread long-polls the queue into a bounded buffer, a processing thread merges everything buffered into
+    one digest before touching Redis, and an acknowledgement thread deletes processed messages in batches.
+    Receiving stops while the buffer is full (backpressure), and messages still in flight close to their visibility
+    timeout get it extended so they are not redelivered to another consumer.
+    """
+
+    def __init__(self, server, max_pending_batches=None, max_merge_messages=None, visibility_timeout=None,
+                 visibility_extension_margin=None):
+        """
+        Every parameter defaults to the server configuration (pipeline_* keys and visibility_timeout).
+        :param server: the SQSServer that processes the messages
+        :param max_pending_batches: received batches buffered before the receiver blocks
+        :param max_merge_messages: maximum number of messages merged into one Redis update
+        :param visibility_timeout: visibility timeout requested for received messages, in seconds
+        :param visibility_extension_margin: extend the visibility of messages this many seconds before it expires
+        """
+        configs = server.configs
+        self.server = server
+        self.queue_url = configs['queue_url']
+        self.max_number_of_messages = configs.get('max_number_of_messages', 10)
+        self.wait_time_seconds = configs.get('wait_time_seconds', 20)
+        self.max_pending_batches = max_pending_batches or configs.get('pipeline_max_pending_batches', 8)
+        self.max_merge_messages = max_merge_messages or configs.get('pipeline_max_merge_messages', 100)
+        self.visibility_timeout = visibility_timeout or configs.get('visibility_timeout', 30)
+        self.visibility_extension_margin = visibility_extension_margin or configs.get('visibility_extension_margin', 5)
+
+        self.received = queue.Queue(maxsize=self.max_pending_batches)
+        self.acks = queue.Queue()
+        # receipt handle -> time its visibility timeout was last set
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.processed_messages = 0
+        self.threads = []
+
+    def start(self):
+        self.stop_event.clear()
+        self.threads = [threading.Thread(target=target, daemon=True)
+                        for target in (self._receive_loop, self._process_loop, self._ack_loop, self._visibility_loop)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stop receiving, process and acknowledge everything already received, then return.
+        """
+        self.stop_event.set()
+        receiver, processor, acknowledger, visibility = self.threads
+        receiver.join()
+        processor.join()
+        self.acks.put(None)
+        acknowledger.join()
+        visibility.join()
+
+    def _receive_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                messages = self.server.sqs.receive_message(
+                    QueueUrl=self.queue_url,
+                    MaxNumberOfMessages=self.max_number_of_messages,
+                    WaitTimeSeconds=self.wait_time_seconds,
+                    VisibilityTimeout=self.visibility_timeout,
+                    MessageAttributeNames=[ITEM_COUNT_ATTRIBUTE]
+                ).get('Messages', [])
+            except Exception as e:
+                print(f"failed receiving messages: {e}")
+                self.stop_event.wait(RETRY_SECONDS)
+                continue
+            if not messages:
+                continue
+
+            now = time.time()
+            with self.in_flight_lock:
+                for message in messages:
+                    self.in_flight[message['ReceiptHandle']] = now
+            # blocks while the processing stage is behind.
+            self.received.put(messages)
+
+    def _process_loop(self):
+        while not self.stop_event.is_set() or not self.received.empty():
+            try:
+                messages = list(self.received.get(timeout=0.1))
+            except queue.Empty:
+                continue
+            while len(messages) < self.max_merge_messages:
+                try:
+                    messages.extend(self.received.get_nowait())
+                except queue.Empty:
+                    break
+
+            routed, messages = self._route(messages)
+            if not messages:
+                continue
+            try:
+                self.server.process_routed(*routed)
+            except Exception as e:
+                # not acknowledged - the messages become visible again once their visibility timeout expires.
+                print(f"failed processing {len(messages)} messages: {e}")
+                self._forget([message['ReceiptHandle'] for message in messages])
+                continue
+            self.processed_messages += len(messages)
+            self.acks.put([message['ReceiptHandle'] for message in messages])
+
+    def _route(self, messages):
+        """
+        Decode and merge the digests of a batch (SQSServer.route_messages). When that fails, the messages are routed
+        one by one and the ones that fail are left out of the batch, unacknowledged, so they alone are redelivered.
+        :return: (the route_messages result, the messages it covers)
+        """
+        try:
+            return self.server.route_messages(messages), messages
+        except Exception as e:
+            print(f"failed routing {len(messages)} messages: {e}, routing them one by one")
+        valid = []
+        for message in messages:
+            try:
+                self.server.route_messages([message])
+            except Exception as e:
+                print(f"failed processing message {message.get('MessageId')}: {e}")
+                self._forget([message['ReceiptHandle']])
+                continue
+            valid.append(message)
+        return (self.server.route_messages(valid) if valid else None), valid
+
+    def _ack_loop(self):
+        while True:
+            receipt_handles = self.acks.get()
+            if receipt_handles is None:
+                return
+            try:
+                self.server.delete_messages(receipt_handles)
+            except Exception as e:
+                # the messages are redelivered once their visibility timeout expires.
+                print(f"failed deleting {len(receipt_handles)} messages: {e}")
+            self._forget(receipt_handles)
+
+    def _visibility_loop(self):
+        while not self.stop_event.wait(self.visibility_extension_margin / 2):
+            deadline = time.time() - (self.visibility_timeout - self.visibility_extension_margin)
+            with self.in_flight_lock:
+                expiring = [handle for handle, last_set in self.in_flight.items() if last_set <= deadline]
+            extended = []
+            for i in range(0, len(expiring), 10):
+                handles = expiring[i:i + 10]
+                try:
+                    response = self.server.sqs.change_message_visibility_batch(
+                        QueueUrl=self.queue_url,
+                        Entries=[{'Id': str(j), 'ReceiptHandle': handle, 'VisibilityTimeout': self.visibility_timeout}
+                                 for j, handle in enumerate(handles)]
+                    )
+                except Exception as e:
+                    # e.g. a message deleted in the meantime, the next round retries the ones still in flight.
+                    print(f"failed extending the visibility of {len(handles)} messages: {e}")
+                    continue
+                failed = {int(entry['Id']) for entry in response.get('Failed', [])}
+                if failed:
+                    print(f"failed extending the visibility of messages: {response['Failed']}")
+                extended += [handle for j, handle in enumerate(handles) if j not in failed]
+            now = time.time()
+            with self.in_flight_lock:
+                for handle in extended:
+                    if handle in self.in_flight:
+                        self.in_flight[handle] = now
+
+    def _forget(self, receipt_handles):
+        with self.in_flight_lock:
+            for handle in receipt_handles:
+                self.in_flight.pop(handle, None)
@@ -1,10 +1,20 @@
 import json
-import boto3
 from botocore.exceptions import ClientError
-from tdigest import TDigest
 import threading
 import os
 import redis
+import numpy as np
+from sketches.ks import IncrementalKS, centroid_arrays, digest_cdf, grid_ks
+from sketches.pvalue import DriftTest
+from sketches.histogram import HistogramSketch, as_histogram, is_histogram
+from queue_consumer_server.reference_artifact import ReferenceArtifact, load_reference_artifact
+from queue_consumer_server.redis_scripts import MERGE_DIGEST_SCRIPT
+from queue_consumer_server.monitors import MonitorRegistry
+from queue_consumer_server.windows import BucketWindow
+from sketches.codec import DEFAULT_FEATURE, DIGEST_FORMATS, ITEM_COUNT_ATTRIBUTE, decode_message_digests
+from sketches.merge import merge_digests, merge_sketches, values_digest
+from sketches.merging_digest import COMPRESSION_FACTOR, MergingDigest
+from transport.clients import create_sqs_client
 
 
 class SQSServer:
@@ -14,25 +24,85 @@ class SQSServer:
     The logic in this class should be deployed to a Lambda subscribed tot the SQS if you want the serverless architecture.
     """
 
-    def __init__(self, config_file='server_configs.json', aggregation_size=500000, alerting_threshold=0.05):
+    def __init__(self, config_file='server_configs.json', aggregation_size=500000, alerting_threshold=0.05,
+                 sqs_client=None, redis_client=None):
         """
         Initialize the SQS server with configurations from the provided file.
+        sqs_client and redis_client can be given to use existing (or local stand-in) clients, else the "transport" of
+        the configs picks the queue client (see transport/clients.py).
         """
         self.configs = self.read_config(config_file)
-        self.sqs = boto3.client('sqs', endpoint_url=self.configs["endpoint_url"])
-        self.redis_client = redis.Redis(host='localhost', port=32768, password='redispw', db=0)
+        self.sqs = sqs_client if sqs_client is not None else self.create_sqs_client()
+        self.redis_client = redis_client if redis_client is not None else self.create_redis_client()
         self.aggregation_size = aggregation_size
-        self.combined_digest = TDigest()
+        self.combined_digest = MergingDigest()
 
-        # todo read ref data from a file uploaded with the lambda
-        self.ref_data = [1, 2, 3]
-        self.ref_digest = TDigest()
-        self.ref_digest.batch_update(self.ref_data)
+        # the reference artifact is built offline (see reference_artifact.py) and uploaded with the lambda.
+        # it is memory mapped once per process, so warm invocations reuse it.
+        if self.configs.get("reference_artifact"):
+            self.reference = load_reference_artifact(
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), self.configs["reference_artifact"]))
+        else:
+            self.reference = ReferenceArtifact.from_data([1, 2, 3])
+        self.ref_means, self.ref_counts = self.reference.means, self.reference.counts
+        self.ref_eval_points = self.reference.grid
+        # evaluation grid of the full t-digest KS test (see GRID_STRATEGIES in sketches/ks.py), 'reference_points'
+        # evaluates at the grid of the reference artifact.
+        self.ks_grid_strategy = self.configs.get("ks_grid_strategy", "reference_points")
+        self.ks_grid_size = self.configs.get("ks_grid_size", 1000)
+
+        # clients send either t-digests or histograms with edges fixed from the reference range (histogram_bins bins).
+        self.sketch_type = self.configs.get("sketch_type", "tdigest")
+        if self.sketch_type == "histogram":
+            self.ref_histogram = HistogramSketch(self.ref_eval_points[0], self.ref_eval_points[-1],
+                                                 self.configs.get("histogram_bins", 1000))
+            self.ref_histogram_cdf = digest_cdf(self.ref_means, self.ref_counts, self.ref_histogram.upper_edges())
+            self.ks_tracker = IncrementalKS(self.ref_histogram.upper_edges(), self.ref_histogram_cdf)
+        else:
+            self.ks_tracker = IncrementalKS(self.ref_eval_points, self.reference.grid_cdf)
+        # the running KS statistic is reported once per aggregation window.
+        self.running_drift_reported = False
 
         # the default users group with a batch size (d=20000)
-        self.redis_handler = RedisHandler(digest_name="default_digest", restart_digest=True, batch_size=20000)
+        self.redis_handler = self.redis_handler_class()(digest_name="default_digest", restart_digest=True,
+                                                        batch_size=20000, redis_client=self.redis_client)
         self.lock = threading.Lock()
         self.alerting_KS_threshold = alerting_threshold
+        # alerting by KS threshold, or by p-value when "alerting_significance" is configured (see sketches/pvalue.py).
+        self.drift_test = DriftTest.from_config(self.configs, alerting_threshold)
+        # the digest formats the clients may send, see sketches/codec.py.
+        self.accepted_digest_formats = self.configs.get("accepted_digest_formats", DIGEST_FORMATS)
+
+        # named monitors for the digests clients send per feature and segment, the default digest keeps the keys above.
+        self.monitors = MonitorRegistry.from_configs(self.configs.get("monitors", []),
+                                                     os.path.dirname(os.path.abspath(__file__)))
+        self.monitor_handlers = {}
+
+        # time bucketed windows instead of the aggregation_size counters, see windows.py.
+        self.window = BucketWindow.from_config(self.configs.get("window"))
+
+    def create_sqs_client(self):
+        return create_sqs_client(self.configs)
+
+    def create_redis_client(self):
+        # update redis credentials here...
+        return redis.Redis(host='localhost', port=32768, password='redispw', db=0)
+
+    def redis_handler_class(self, sketch_type=None):
+        if (sketch_type or self.sketch_type) == "histogram":
+            return HistogramRedisHandler
+        if self.configs.get("atomic_redis_merge"):
+            return AtomicRedisHandler
+        return RedisHandler
+
+    def monitor_handler(self, monitor):
+        """
+        The handlers of the monitors take the key per call, so one handler per sketch type serves all of them.
+        """
+        if monitor.sketch_type not in self.monitor_handlers:
+            self.monitor_handlers[monitor.sketch_type] = self.redis_handler_class(monitor.sketch_type)(
+                restart_digest=False, redis_client=self.redis_client)
+        return self.monitor_handlers[monitor.sketch_type]
 
     @staticmethod
     def read_config(file_path):
@@ -57,13 +127,14 @@ class SQSServer:
         try:
             messages = self.sqs.receive_message(
                 QueueUrl=self.configs['queue_url'],
-                MaxNumberOfMessages=10,
-                WaitTimeSeconds=20
+                MaxNumberOfMessages=self.configs.get('max_number_of_messages', 10),
+                WaitTimeSeconds=self.configs.get('wait_time_seconds', 20),
+                MessageAttributeNames=[ITEM_COUNT_ATTRIBUTE]
             ).get('Messages', [])
 
-            for message in messages:
-                self.process_message(message)
-                self.delete_message(message['ReceiptHandle'])
+            if messages:
+                self.process_messages(messages)
+                self.delete_messages([message['ReceiptHandle'] for message in messages])
 
         except KeyboardInterrupt:
             print("Stopping the SQS server.")
@@ -74,32 +145,287 @@ class SQSServer:
         """
         Process a single message from the queue.
         """
+        self.process_messages([message])
+
+    def process_messages(self, messages):
+        """
+        Process a batch of messages: the digests are merged locally first, so Redis is updated once per batch for the
+        default digest and once per batch (in one pipeline) for all the monitors.
+        Every digest of the batch is decoded and validated before the first write, so a malformed part raises without
+        the other parts of its message having been merged (the batch stays in the queue).
+        """
+        self.process_routed(*self.route_messages(messages))
+
+    def process_routed(self, default_digest, default_count, routed):
+        """
+        Write the digests of a batch of messages as returned by route_messages.
+        """
+        if default_digest is not None:
+            self.process_digest(default_digest, default_count)
+        if routed:
+            self.process_monitor_digests(routed)
+
+    def route_messages(self, messages):
+        """
+        Split the digests of a batch of messages between the default digest and the monitors, merging the digests of
+        the same monitor and segment. Nothing is written to Redis: a malformed digest or item count raises, and the
+        handlers of the monitors are created here so writing the result does not fail half way on one.
+        :return: (merged default digest or None, its item count, {(monitor, segment): (merged digest, item count)})
+        """
+        default_digests, default_count = [], 0
+        grouped = {}
+        for message in messages:
+            for feature, segment, digest, item_count in decode_message_digests(message, self.accepted_digest_formats):
+                self.validate_sketch(digest, item_count)
+                if feature == DEFAULT_FEATURE:
+                    mismatch = self.sketch_mismatch(digest, self.sketch_type, getattr(self, 'ref_histogram', None))
+                    if mismatch:
+                        print(f"default digest dropped: {mismatch}")
+                        continue
+                    default_digests.append(digest)
+                    default_count += item_count
+                    continue
+                monitor = self.monitors.find(feature, segment)
+                if monitor is None:
+                    print(f"no monitor for feature {feature} segment {segment}, digest dropped")
+                    continue
+                mismatch = self.sketch_mismatch(digest, monitor.sketch_type, getattr(monitor, 'ref_histogram', None))
+                if mismatch:
+                    print(f"digest of monitor {monitor.name} segment {segment} dropped: {mismatch}")
+                    continue
+                digests, counts = grouped.setdefault((monitor, segment), ([], []))
+                digests.append(digest)
+                counts.append(item_count)
+
+        routed = {key: (digests[0] if len(digests) == 1 else merge_sketches(digests), sum(counts))
+                  for key, (digests, counts) in grouped.items()}
+        for monitor, _ in routed:
+            self.monitor_handler(monitor)
+        default_digest = None
+        if default_digests:
+            default_digest = default_digests[0] if len(default_digests) == 1 else merge_sketches(default_digests)
+        return default_digest, default_count, routed
+
+    @staticmethod
+    def validate_sketch(sketch, item_count):
+        """
+        Raise when a decoded sketch or its item count cannot be merged: a t-digest needs matching, finite centroid
+        means and positive counts, a histogram one count per bin (the two outer bins included).
+        """
+        if isinstance(item_count, bool) or not isinstance(item_count, (int, np.integer)) or item_count < 0:
+            raise Exception(f"Invalid item count: {item_count!r}")
+        if is_histogram(sketch):
+            histogram = as_histogram(sketch)
+            if histogram.counts.shape != (histogram.num_bins + 2,) or (histogram.counts < 0).any():
+                raise Exception(f"Invalid histogram counts for {histogram.num_bins} bins")
+            return
+        try:
+            means, counts = centroid_arrays(sketch)
+        except Exception as e:
+            raise Exception(f"Malformed t-digest: {e!r}")
+        valid_counts = np.isfinite(counts) & (counts > 0)
+        if means.shape != counts.shape or not np.isfinite(means).all() or not valid_counts.all():
+            raise Exception("Malformed t-digest: centroid means and counts must be finite and the counts positive")
+
+    @staticmethod
+    def sketch_mismatch(sketch, sketch_type, ref_histogram=None):
+        """
+        Why a decoded sketch cannot be merged into an aggregate of sketch_type, None when it can. Histogram bins are
+        added up by index, so a histogram has to have the bin edges of the reference histogram.
+        """
+        if sketch_type != "histogram":
+            return "a histogram sent to a t-digest aggregate" if is_histogram(sketch) else None
+        if not is_histogram(sketch):
+            return "a t-digest sent to a histogram aggregate"
+        histogram = as_histogram(sketch)
+        if not ref_histogram.compatible(histogram):
+            return (f"histogram edges [{histogram.min_val}, {histogram.max_val}] with {histogram.num_bins} bins do not "
+                    f"match the reference [{ref_histogram.min_val}, {ref_histogram.max_val}] with "
+                    f"{ref_histogram.num_bins} bins")
+        return None
+
+    def process_monitor_digests(self, routed):
+        """
+        Merge the digests of the monitors and add their item counts in one Redis pipeline, then run the KS test of
+        every monitor segment that reached its aggregation size.
+        :param routed: {(monitor, segment): (digest, item count)} as returned by route_messages
+        """
+        with self.lock:
+            if self.window is not None:
+                bucket = self.window.bucket_id()
+                pipeline = self.redis_client.pipeline(transaction=False)
+                for (monitor, segment), (digest, _) in routed.items():
+                    self.queue_bucket_update(pipeline, self.monitor_handler(monitor), digest,
+                                             monitor.digest_key(segment), bucket)
+                pipeline.execute()
+                for monitor, segment in routed:
+                    self.check_window(monitor.digest_key(segment), bucket, monitor, segment)
+                return
+
+            pipeline = self.redis_client.pipeline(transaction=False)
+            counter_positions = []
+            for (monitor, segment), (digest, item_count) in routed.items():
+                self.monitor_handler(monitor).queue_update(pipeline, digest, monitor.digest_key(segment))
+                counter_positions.append(len(pipeline))
+                pipeline.incrby(monitor.counter_key(segment), item_count)
+            results = pipeline.execute()
+
+            for (monitor, segment), position in zip(routed, counter_positions):
+                new_count = results[position]
+                if new_count < monitor.aggregation_size:
+                    continue
+                handler = self.monitor_handler(monitor)
+                max_cdf, max_location = monitor.compute_ks(handler, segment)
+                if monitor.drift_test.is_drift(max_cdf, monitor.reference.n, new_count):
+                    # TODO: add preferred alerting method here...
+                    print(f"DATA DRIFT DETECTED... monitor: {monitor.name} segment: {segment} "
+                          f"{monitor.drift_test.describe(max_cdf, monitor.reference.n, new_count)} at: {max_location}")
+
+                handler.restart_digest(monitor.digest_key(segment))
+                self.redis_client.set(monitor.counter_key(segment), 0)
+
+    def process_digest(self, digest, item_count):
+        """
+        Merge a digest summarizing item_count items into the aggregated digest and run the KS test.
+        """
         # here it is possible to add logic for different monitors and conditions...
         with self.lock:
+            if self.window is not None:
+                bucket = self.window.bucket_id()
+                pipeline = self.redis_client.pipeline(transaction=False)
+                self.queue_bucket_update(pipeline, self.redis_handler, digest, "default_digest", bucket)
+                pipeline.execute()
+                # windows are closed by time, the item count of a window is the n of its merged buckets.
+                print(f"server merged {item_count} items into bucket {bucket}")
+                self.check_window("default_digest", bucket)
+                return
+
             # merge the T-Digests
-            self.redis_handler.update_digest(json.loads(message['Body']))
+            self.redis_handler.update_digest(digest)
 
             # add the counter by d.
-            new_count = self.redis_client.incr("default_digest_counter", 20000)
+            new_count = self.redis_client.incr("default_digest_counter", item_count)
             print(f"server current aggregation count: {new_count}")
-            if new_count >= self.aggregation_size or True:
-                test_digest = self.redis_handler.get_t_digest()
-
-                max_cdf = 0
-                for item in self.ref_data:
-                    curr = abs(self.ref_digest.cdf(item) - test_digest.cdf(item))
-                    if curr > max_cdf:
-                        max_cdf = curr
+            self.track_running_ks(digest, new_count)
+            if new_count >= self.aggregation_size:
+                # end of the window, full test on the aggregated digest.
+                max_cdf, max_location = self.compute_ks()
 
-                if max_cdf > self.alerting_KS_threshold:
+                if self.drift_test.is_drift(max_cdf, self.reference.n, new_count):
                     # TODO: add preferred alerting method here...
-                    print(f"DATA DRIFT DETECTED... KS value: {max_cdf}")
+                    print(f"DATA DRIFT DETECTED... {self.drift_test.describe(max_cdf, self.reference.n, new_count)} "
+                          f"at: {max_location}")
 
                 self.redis_handler.restart_digest()
                 self.redis_client.set("default_digest_counter", 0)
+                self.reset_running_ks()
 
             # extract the dictionary that was sent and use it to update the digest.
-            # self.combined_digest.update_from_dict(json.loads(message['Body']))
+            # self.combined_digest.update_from_dict(to_tdigest_dict(digest))
+
+    def queue_bucket_update(self, pipeline, handler, digest, digest_name, bucket):
+        """
+        Add the merge of a digest into its time bucket, and the refresh of the bucket expiry, to a pipeline.
+        """
+        bucket_key = self.window.bucket_key(digest_name, bucket)
+        handler.queue_update(pipeline, digest, bucket_key)
+        pipeline.expire(bucket_key, self.window.ttl_seconds)
+
+    def check_window(self, digest_name, bucket, monitor=None, segment=None):
+        """
+        Run the KS test of the last window that ended before bucket, unless a consumer already did.
+        Windows are checked when the first digest of a later bucket arrives.
+        """
+        end_bucket = (bucket // self.window.hop_buckets) * self.window.hop_buckets - 1
+        if not self.redis_client.set(self.window.checked_key(digest_name, end_bucket), 1, nx=True,
+                                     ex=self.window.ttl_seconds):
+            return
+        sketch = self.get_window_sketch(end_bucket, monitor=monitor, segment=segment)
+        if sketch is None:
+            return
+        max_cdf, max_location = self.window_sketch_ks(sketch, monitor)
+        drift_test, n_ref = (self.drift_test, self.reference.n) if monitor is None else (monitor.drift_test,
+                                                                                          monitor.reference.n)
+        n_test = sketch.n if is_histogram(sketch) else sketch['n']
+        if drift_test.is_drift(max_cdf, n_ref, n_test):
+            # TODO: add preferred alerting method here...
+            name = "default" if monitor is None else f"{monitor.name} segment: {segment}"
+            print(f"DATA DRIFT DETECTED... monitor: {name} window ending at bucket {end_bucket} "
+                  f"{drift_test.describe(max_cdf, n_ref, n_test)} at: {max_location}")
+
+    def compute_window_ks(self, window_buckets=None, end_bucket=None, monitor=None, segment=None):
+        """
+        KS statistic of the merge of the last window_buckets buckets against the reference, e.g. "the last N minutes".
+        Only the buckets are read and merged, so the cost does not depend on the number of items.
+        :param window_buckets: number of buckets, defaults to the configured window
+        :param end_bucket: last bucket of the window (included), defaults to the current bucket
+        :param monitor: the monitor to check, None for the default digest
+        :return: (KS statistic, the point where it is attained), None when the window is empty
+        """
+        if end_bucket is None:
+            end_bucket = self.window.bucket_id()
+        sketch = self.get_window_sketch(end_bucket, window_buckets, monitor, segment)
+        if sketch is None:
+            return None
+        return self.window_sketch_ks(sketch, monitor)
+
+    def get_window_sketch(self, end_bucket, window_buckets=None, monitor=None, segment=None):
+        """
+        The merge of the buckets of a window, None when the window is empty.
+        """
+        if monitor is None:
+            handler, digest_name = self.redis_handler, "default_digest"
+            template = getattr(self, 'ref_histogram', None)
+        else:
+            handler, digest_name = self.monitor_handler(monitor), monitor.digest_key(segment)
+            template = getattr(monitor, 'ref_histogram', None)
+        return handler.get_window_sketch(self.window.window_keys(digest_name, end_bucket, window_buckets), template)
+
+    def window_sketch_ks(self, sketch, monitor=None):
+        if is_histogram(sketch):
+            return sketch.ks_from_cdf(self.ref_histogram_cdf if monitor is None else monitor.ref_histogram_cdf)
+        if monitor is None:
+            return self.reference_ks(sketch['means'], sketch['counts'])
+        return monitor.reference_ks(sketch['means'], sketch['counts'])
+
+    def track_running_ks(self, digest, new_count):
+        """
+        Add a merged digest to the running KS statistic, O(grid size) per call instead of reading the aggregate back.
+        The tracker only sees the digests of this consumer, the full test at the end of the window sees all of them.
+        """
+        if self.sketch_type == "histogram":
+            self.ks_tracker.add_histogram(as_histogram(digest))
+        else:
+            self.ks_tracker.add_digest(digest)
+        running_ks, running_location = self.ks_tracker.statistic()
+        n_ref, n_test = self.reference.n, self.ks_tracker.n
+        if self.drift_test.is_drift(running_ks, n_ref, n_test) and not self.running_drift_reported:
+            # TODO: add preferred alerting method here...
+            print(f"DATA DRIFT DETECTED... running {self.drift_test.describe(running_ks, n_ref, n_test)} "
+                  f"at: {running_location} after {new_count} items")
+            self.running_drift_reported = True
+
+    def reset_running_ks(self):
+        self.ks_tracker.reset()
+        self.running_drift_reported = False
+
+    def compute_ks(self):
+        """
+        KS statistic of the aggregated sketch against the reference.
+        :return: (KS statistic, the point where it is attained)
+        """
+        if self.sketch_type == "histogram":
+            return self.redis_handler.get_histogram(self.ref_histogram).ks_from_cdf(self.ref_histogram_cdf)
+
+        test_means, test_counts = self.redis_handler.get_centroid_arrays()
+        return self.reference_ks(test_means, test_counts)
+
+    def reference_ks(self, test_means, test_counts):
+        """
+        KS statistic of an aggregated t-digest against the reference, on the configured evaluation grid.
+        """
+        return grid_ks(self.ref_means, self.ref_counts, test_means, test_counts, self.ks_grid_strategy,
+                       ref_points=self.ref_eval_points, grid_size=self.ks_grid_size)
 
     def delete_message(self, receipt_handle):
         """
@@ -110,6 +436,19 @@ class SQSServer:
             ReceiptHandle=receipt_handle
         )
 
+    def delete_messages(self, receipt_handles):
+        """
+        Delete processed messages from the queue with delete_message_batch, 10 per call (the SQS limit).
+        """
+        for i in range(0, len(receipt_handles), 10):
+            response = self.sqs.delete_message_batch(
+                QueueUrl=self.configs['queue_url'],
+                Entries=[{'Id': str(j), 'ReceiptHandle': handle}
+                         for j, handle in enumerate(receipt_handles[i:i + 10])]
+            )
+            if response.get('Failed'):
+                print(f"failed deleting messages: {response['Failed']}")
+
     def print_combined_digest_dict(self):
         with self.lock:
             print(self.combined_digest.to_dict())
@@ -117,48 +456,220 @@ class SQSServer:
 
 class RedisHandler:
 
-    def __init__(self, digest_name="default_digest", restart_digest=True, batch_size=5000):
+    def __init__(self, digest_name="default_digest", restart_digest=True, batch_size=5000, redis_client=None):
         # update redis credentials here...
-        self.redis_client = redis.Redis(host='localhost', port=32768, password='redispw', db=0)
+        if redis_client is None:
+            redis_client = redis.Redis(host='localhost', port=32768, password='redispw', db=0)
+        self.redis_client = redis_client
         if restart_digest:
             self.restart_digest(digest_name)
         self.batch_size = batch_size
 
     def update_digest(self, new_digest_dict, digest_name="default_digest"):
-        curr_digest_dict = json.loads(self.redis_client.get(digest_name))
-        curr_digest = TDigest()
-        curr_digest.update_from_dict(curr_digest_dict)
+        curr_digest_raw = self.redis_client.get(digest_name)
+        curr_digest = MergingDigest()
+        if curr_digest_raw is not None:
+            curr_digest.update_from_dict(json.loads(curr_digest_raw))
         curr_digest.update_from_dict(new_digest_dict)
         self.redis_client.set(digest_name, json.dumps(curr_digest.to_dict()))
 
+    def queue_update(self, pipeline, new_digest, digest_name="default_digest"):
+        """
+        Add the merge of new_digest to a pipeline. The GET/merge/SET of this handler cannot be pipelined, so the
+        merge runs right away; the other handlers queue it.
+        """
+        self.update_digest(new_digest, digest_name)
+
     def update_digest_w_value(self, value, digest_name="default_digest"):
         curr_digest_dict = json.loads(self.redis_client.get(digest_name))
-        curr_digest = TDigest()
+        curr_digest = MergingDigest()
         curr_digest.update_from_dict(curr_digest_dict)
         curr_digest.update(value)
         self.redis_client.set(digest_name, json.dumps(curr_digest.to_dict()))
 
+    @staticmethod
+    def batching_key(digest_name="default_digest"):
+        """
+        The list of raw values waiting to be merged into a digest, one per digest (and so per monitor segment).
+        """
+        return f"{digest_name}:batching_list"
+
+    def update_digest_w_values_using_batching(self, values, digest_name="default_digest"):
+        """
+        Stream raw values into a digest in batches of batch_size (T-Digest-Stream). The values of a call are pushed as
+        one packed float64 array and counted in the same MULTI round trip; the call that fills the batch merges it.
+        :return: the number of values merged into the digest, 0 while the batch is not full
+        """
+        values = np.asarray(values, dtype='<f8')
+        if values.size == 0:
+            return 0
+        key = self.batching_key(digest_name)
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.rpush(key, values.tobytes())
+        pipeline.incrby(f"{key}:count", len(values))
+        batch_len = pipeline.execute()[-1]
+        if batch_len < self.batch_size:
+            return 0
+        return self.flush_batching_list(digest_name)
+
+    def flush_batching_list(self, digest_name="default_digest"):
+        """
+        Take every pending value of a digest in one MULTI (so concurrent consumers never merge a value twice) and merge
+        them into the digest.
+        :return: the number of values merged
+        """
+        key = self.batching_key(digest_name)
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.lrange(key, 0, -1)
+        pipeline.delete(key, f"{key}:count")
+        chunks = pipeline.execute()[0]
+        if not chunks:
+            return 0
+        batch = np.frombuffer(b''.join(chunks), dtype='<f8')
+        self.update_digest(merge_digests([values_digest(batch)]), digest_name)
+        return len(batch)
+
     def update_digest_w_value_using_batching(self, value, reset_batch=False, digest_name="default_digest"):
+        """
+        Single value version of update_digest_w_values_using_batching.
+        :return: the aggregated MergingDigest when the value completed a batch, None otherwise
+        """
         if reset_batch:
-            self.redis_client.delete("batching_list")
-        self.redis_client.lpush("batching_list", value)
-        batch_len = self.redis_client.llen("batching_list")
-        # batch size
-        if batch_len == self.batch_size:
-            batch = self.redis_client.lrange("batching_list", 0, -1)
-            batch = [float(item) for item in batch]
-            self.redis_client.delete("batching_list")
-            curr_digest_dict = json.loads(self.redis_client.get(digest_name))
-            curr_digest = TDigest()
-            curr_digest.update_from_dict(curr_digest_dict)
-            curr_digest.batch_update(batch)
-            self.redis_client.set(digest_name, json.dumps(curr_digest.to_dict()))
-            return curr_digest
+            key = self.batching_key(digest_name)
+            self.redis_client.delete(key, f"{key}:count")
+        if self.update_digest_w_values_using_batching([value], digest_name):
+            return self.get_t_digest(digest_name)
         return None
 
     def get_t_digest(self, digest_name="default_digest"):
-        return TDigest(json.loads(self.redis_client.get(digest_name)))
+        return MergingDigest().update_from_dict(self.get_t_digest_dict(digest_name))
+
+    def get_t_digest_dict(self, digest_name="default_digest"):
+        return json.loads(self.redis_client.get(digest_name))
+
+    def get_centroid_arrays(self, digest_name="default_digest"):
+        return centroid_arrays(self.get_t_digest_dict(digest_name))
+
+    def get_window_sketch(self, digest_names, template=None):
+        """
+        Read several digests in one MGET and merge them.
+        :return: an array digest dictionary, None when none of the keys exists
+        """
+        digests = [self.parse_digest(raw) for raw in self.redis_client.mget(digest_names) if raw is not None]
+        return merge_digests(digests) if digests else None
+
+    @staticmethod
+    def parse_digest(raw):
+        return json.loads(raw)
 
     def restart_digest(self, digest_name="default_digest"):
-        init_digest = TDigest()
+        init_digest = MergingDigest()
         self.redis_client.set(digest_name, json.dumps(init_digest.to_dict()))
+
+
+class AtomicRedisHandler(RedisHandler):
+    """
+    RedisHandler that merges digests inside Redis with a Lua script (see redis_scripts.py) instead of GET/merge/SET.
+    The merge is a single atomic round trip, so several servers or lambdas can consume the same queue safely.
+    The digest is stored as compact sorted centroid arrays rather than the TDigest.to_dict() format.
+    """
+
+    def __init__(self, digest_name="default_digest", restart_digest=True, batch_size=5000, redis_client=None):
+        super().__init__(digest_name, restart_digest, batch_size, redis_client)
+        self.merge_script = self.redis_client.register_script(MERGE_DIGEST_SCRIPT)
+
+    @staticmethod
+    def to_compact(digest_dict):
+        """
+        Convert a TDigest.to_dict() dictionary to the compact layout used by the merge script.
+        """
+        means, counts = centroid_arrays(digest_dict)
+        return json.dumps({'n': float(counts.sum()), 'delta': digest_dict.get('delta', 0.01),
+                           'K': digest_dict.get('K', 25), 'm': means.tolist(), 'c': counts.tolist()})
+
+    def update_digest(self, new_digest_dict, digest_name="default_digest"):
+        self.merge_script(keys=[digest_name], args=[self.to_compact(new_digest_dict), COMPRESSION_FACTOR])
+
+    def queue_update(self, pipeline, new_digest, digest_name="default_digest"):
+        self.merge_script(keys=[digest_name], args=[self.to_compact(new_digest), COMPRESSION_FACTOR], client=pipeline)
+
+    def update_digest_w_value(self, value, digest_name="default_digest"):
+        self.update_digest({'centroids': [{'m': float(value), 'c': 1.0}]}, digest_name)
+
+    def get_t_digest_dict(self, digest_name="default_digest"):
+        compact = json.loads(self.redis_client.get(digest_name))
+        return {'n': compact['n'], 'delta': compact['delta'], 'K': compact['K'],
+                'centroids': [{'m': m, 'c': c} for m, c in zip(compact['m'], compact['c'])]}
+
+    def get_centroid_arrays(self, digest_name="default_digest"):
+        compact = json.loads(self.redis_client.get(digest_name))
+        return np.asarray(compact['m'], dtype=np.float64), np.asarray(compact['c'], dtype=np.float64)
+
+    @staticmethod
+    def parse_digest(raw):
+        compact = json.loads(raw)
+        return {'n': compact['n'], 'delta': compact['delta'], 'K': compact['K'],
+                'means': np.asarray(compact['m'], dtype=np.float64),
+                'counts': np.asarray(compact['c'], dtype=np.float64)}
+
+    def restart_digest(self, digest_name="default_digest"):
+        self.redis_client.set(digest_name, self.to_compact(MergingDigest().to_dict()))
+
+
+class HistogramRedisHandler(RedisHandler):
+    """
+    RedisHandler for histogram sketches. The aggregated histogram is a Redis hash of bin index -> count, merging is
+    a HINCRBY per non empty bin in one MULTI pipeline, so it is atomic across consumers without any script.
+    """
+
+    def update_digest(self, new_histogram, digest_name="default_digest"):
+        pipeline = self.redis_client.pipeline(transaction=True)
+        self.queue_update(pipeline, new_histogram, digest_name)
+        pipeline.execute()
+
+    def queue_update(self, pipeline, new_histogram, digest_name="default_digest"):
+        histogram = as_histogram(new_histogram)
+        for index in np.flatnonzero(histogram.counts):
+            pipeline.hincrby(digest_name, int(index), int(histogram.counts[index]))
+
+    def update_digest_w_value(self, value, digest_name="default_digest"):
+        raise Exception("Histograms need their bin edges, use update_digest with a HistogramSketch.")
+
+    def update_digest_w_value_using_batching(self, value, reset_batch=False, digest_name="default_digest"):
+        raise Exception("Histograms need their bin edges, use update_digest with a HistogramSketch.")
+
+    def update_digest_w_values_using_batching(self, values, digest_name="default_digest"):
+        raise Exception("Histograms need their bin edges, use update_digest with a HistogramSketch.")
+
+    def get_histogram(self, template, digest_name="default_digest"):
+        """
+        :param template: a HistogramSketch with the bin edges of the aggregated histogram
+        """
+        histogram = template.empty_copy()
+        for index, count in self.redis_client.hgetall(digest_name).items():
+            histogram.counts[int(index)] = int(count)
+        return histogram
+
+    def get_window_sketch(self, digest_names, template=None):
+        """
+        Read several histograms in one pipeline and add them up.
+        :param template: a HistogramSketch with the bin edges of the aggregated histograms
+        :return: a HistogramSketch, None when none of the keys exists
+        """
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for digest_name in digest_names:
+            pipeline.hgetall(digest_name)
+        buckets = [bucket for bucket in pipeline.execute() if bucket]
+        if not buckets:
+            return None
+        histogram = template.empty_copy()
+        for bucket in buckets:
+            for index, count in bucket.items():
+                histogram.counts[int(index)] += int(count)
+        return histogram
+
+    def get_t_digest_dict(self, digest_name="default_digest"):
+        raise Exception("The aggregated sketch is a histogram, use get_histogram.")
+
+    def restart_digest(self, digest_name="default_digest"):
+        self.redis_client.delete(digest_name)
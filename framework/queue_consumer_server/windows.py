@@ -0,0 +1,68 @@
+import time
+
+WINDOW_MODES = ('tumbling', 'sliding', 'hopping')
+
+
+class BucketWindow:
+    """
+    Time bucketed aggregation: digests are merged into one Redis key per bucket (e.g. per minute) that expires on its
+    own, and the KS test runs on the merge of the last window_buckets buckets. The cost of a check depends on the
+    number of buckets only, and no history is thrown away between checks.
+    A window is checked every hop_buckets buckets: hop_buckets == window_buckets is a tumbling window, 1 a sliding
+    window and anything in between a hopping window.
+    """
+
+    def __init__(self, bucket_seconds=60, window_buckets=5, hop_buckets=None, ttl_seconds=None, clock=time.time):
+        """
+        :param bucket_seconds: length of a bucket
+        :param window_buckets: number of buckets in a window
+        :param hop_buckets: buckets between two checks, defaults to window_buckets (tumbling)
+        :param ttl_seconds: expiry of a bucket key, defaults to twice the time a bucket can still be part of a window
+        :param clock: returns the current time in seconds, used to pick the bucket of incoming digests
+        """
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = window_buckets
+        self.hop_buckets = hop_buckets or window_buckets
+        if self.hop_buckets > self.window_buckets:
+            raise Exception("hop_buckets cannot be larger than window_buckets, buckets would never be checked.")
+        self.ttl_seconds = ttl_seconds or int(2 * bucket_seconds * (window_buckets + 1))
+        self.clock = clock
+
+    @classmethod
+    def from_config(cls, window_config):
+        """
+        :param window_config: the server "window" configuration: bucket_seconds, window_buckets, mode (one of
+                              WINDOW_MODES), hop_buckets for hopping windows and optionally ttl_seconds
+        :return: a BucketWindow, or None when the configuration is empty (count based aggregation)
+        """
+        if not window_config:
+            return None
+        mode = window_config.get('mode', 'tumbling')
+        if mode not in WINDOW_MODES:
+            raise Exception(f"Unsupported window mode: {mode}")
+        window_buckets = window_config.get('window_buckets', 5)
+        hop_buckets = {'tumbling': window_buckets, 'sliding': 1}.get(mode, window_config.get('hop_buckets'))
+        return cls(window_config.get('bucket_seconds', 60), window_buckets, hop_buckets,
+                   window_config.get('ttl_seconds'))
+
+    def bucket_id(self, timestamp=None):
+        return int((self.clock() if timestamp is None else timestamp) // self.bucket_seconds)
+
+    @staticmethod
+    def bucket_key(digest_name, bucket_id):
+        return f"{digest_name}:bucket:{bucket_id}"
+
+    def window_keys(self, digest_name, end_bucket, window_buckets=None):
+        """
+        The bucket keys of the window ending with end_bucket (included).
+        """
+        window_buckets = window_buckets or self.window_buckets
+        return [self.bucket_key(digest_name, bucket) for bucket in range(end_bucket - window_buckets + 1,
+                                                                          end_bucket + 1)]
+
+    @staticmethod
+    def checked_key(digest_name, end_bucket):
+        """
+        Claimed with SET NX by the consumer that checks the window, so a window is checked once across consumers.
+        """
+        return f"{digest_name}:checked:{end_bucket}"
@@ -0,0 +1,143 @@
+import json
+import os
+import time
+from botocore.exceptions import ClientError
+from sketches.codec import (DEFAULT_FEATURE, ITEM_COUNT_ATTRIBUTE, decode_message_digests, encode_body,
+                            encode_multi_body, item_count_attributes)
+from sketches.merge import merge_sketches
+from transport.clients import create_sqs_client
+
+
+class RegionalAggregator:
+    """
+    Optional pre-aggregation tier between the edge clients and the SQSServer.
+    Consumes client digests from a regional queue, merges them in memory (t-digest merges are associative) and forwards
+    one combined digest upstream, in the same message format, every flush_message_count messages or
+    flush_interval_seconds. The upstream queue can be the server queue or the input queue of another aggregator, so
+    tiers can be stacked with their own fan-in. Multi digest messages are merged per feature and segment.
+    Input messages are deleted only after the combined digest was forwarded, so flush_interval_seconds has to stay
+    below the queue visibility timeout.
+    """
+
+    def __init__(self, config_file='aggregator_configs.json', sqs_client=None):
+        """
+        Initialize the aggregator with configurations from the provided file.
+        """
+        self.configs = self.read_config(config_file)
+        if sqs_client is None:
+            sqs_client = create_sqs_client(self.configs)
+        self.sqs = sqs_client
+        self.flush_message_count = self.configs.get('flush_message_count', 100)
+        self.flush_interval_seconds = self.configs.get('flush_interval_seconds', 10)
+
+        # (feature, segment) -> [merged digest, item count]
+        self.pending_digests = {}
+        self.pending_receipt_handles = []
+        self.last_flush_time = time.time()
+        self.forwarded_messages = 0
+
+    @staticmethod
+    def read_config(file_path):
+        """
+        Read configuration from a file.
+        """
+        try:
+            dir_path = os.path.dirname(os.path.abspath(__file__))
+            abs_file_path = os.path.join(dir_path, file_path)
+
+            with open(abs_file_path, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            raise Exception("Configuration file not found.")
+        except json.JSONDecodeError:
+            raise Exception("Error parsing the configuration file.")
+
+    def poll_messages(self):
+        """
+        Receive one batch from the regional queue, merge it and forward when a flush threshold is reached.
+        """
+        try:
+            messages = self.sqs.receive_message(
+                QueueUrl=self.configs['input_queue_url'],
+                MaxNumberOfMessages=self.configs.get('max_number_of_messages', 10),
+                WaitTimeSeconds=self.configs.get('wait_time_seconds', 5),
+                MessageAttributeNames=[ITEM_COUNT_ATTRIBUTE]
+            ).get('Messages', [])
+
+            if messages:
+                self.add_messages(messages)
+            if self.should_flush():
+                self.flush()
+
+        except ClientError as e:
+            raise Exception(f"An error occurred: {e}")
+
+    def add_messages(self, messages):
+        grouped = {}
+        for message in messages:
+            for feature, segment, digest, item_count in decode_message_digests(
+                    message, default_item_count=self.configs.get('default_item_count', 20000)):
+                digests, counts = grouped.setdefault((feature, segment), ([], []))
+                digests.append(digest)
+                counts.append(item_count)
+
+        for key, (digests, counts) in grouped.items():
+            if key in self.pending_digests:
+                pending_digest, pending_count = self.pending_digests[key]
+                digests.append(pending_digest)
+                counts.append(pending_count)
+            self.pending_digests[key] = [merge_sketches(digests), sum(counts)]
+        self.pending_receipt_handles.extend(message['ReceiptHandle'] for message in messages)
+
+    def should_flush(self):
+        if not self.pending_receipt_handles:
+            return False
+        return len(self.pending_receipt_handles) >= self.flush_message_count or \
+            time.time() - self.last_flush_time >= self.flush_interval_seconds
+
+    def flush(self):
+        """
+        Forward the combined digest upstream, then acknowledge the messages it was built from.
+        """
+        digest_format = self.configs.get('digest_format', 'binary')
+        precision = self.configs.get('digest_precision', 'float64')
+        if list(self.pending_digests) == [(DEFAULT_FEATURE, None)]:
+            # only default digests, forwarded in the single digest format.
+            digest, item_count = self.pending_digests[(DEFAULT_FEATURE, None)]
+            self.sqs.send_message(
+                QueueUrl=self.configs['output_queue_url'],
+                MessageBody=encode_body(digest, digest_format, precision),
+                MessageAttributes=item_count_attributes(item_count)
+            )
+            self.forwarded_messages += 1
+        elif self.pending_digests:
+            self.sqs.send_message(
+                QueueUrl=self.configs['output_queue_url'],
+                MessageBody=encode_multi_body(((feature, segment, digest, item_count) for (feature, segment),
+                                               (digest, item_count) in self.pending_digests.items()),
+                                              digest_format, precision)
+            )
+            self.forwarded_messages += 1
+
+        for i in range(0, len(self.pending_receipt_handles), 10):
+            self.sqs.delete_message_batch(
+                QueueUrl=self.configs['input_queue_url'],
+                Entries=[{'Id': str(j), 'ReceiptHandle': handle}
+                         for j, handle in enumerate(self.pending_receipt_handles[i:i + 10])]
+            )
+
+        self.pending_digests = {}
+        self.pending_receipt_handles = []
+        self.last_flush_time = time.time()
+
+    def run(self, stop_event=None):
+        """
+        Poll until stop_event is set (forever without one), then forward whatever is still pending.
+        """
+        try:
+            while stop_event is None or not stop_event.is_set():
+                self.poll_messages()
+        except KeyboardInterrupt:
+            print("Stopping the regional aggregator.")
+        finally:
+            self.flush()
@@ -0,0 +1,119 @@
+import numpy as np
+from sketches.codec import HEADER_SIZE, estimated_body_size
+from sketches.histogram import HistogramSketch
+from sketches.merging_digest import MergingDigest
+
+# a float64 mean and weight per centroid in memory, a float64 per buffered value.
+CENTROID_BYTES = 16
+VALUE_BYTES = 8
+# a digest over its centroid budget is compacted to this fraction of it, so it does not recompress on every merge.
+COMPACT_RATIO = 0.8
+# the smallest share of the centroid budget a producer shard gets, more producer threads share the shards.
+MIN_SHARD_CENTROIDS = 64
+
+
+def payload_centroids(max_bytes, digest_format='binary', precision='float64'):
+    """
+    The most centroids a digest can have for its message body (see codec.estimated_body_size) to fit max_bytes.
+    """
+    if digest_format == 'binary':
+        itemsize = 4 if precision == 'float32' else 8
+        return max(0, (max_bytes // 4 * 3 - HEADER_SIZE) // (2 * itemsize))
+    return max(0, (max_bytes - 60) // 48)
+
+
+def budget_delta(max_centroids, item_count, delta=0.01):
+    """
+    The delta of a digest of item_count values with at most max_centroids centroids: a merging digest has fewer than
+    log(n) / delta centroids, so this is delta or the smallest larger one that bounds it.
+    """
+    return max(delta, float(np.log(max(item_count, 2))) / max_centroids)
+
+
+class SketchBudget:
+    """
+    Memory and payload budget of an edge client's digests (the "max_sketch_bytes" client configuration).
+    Half of max_bytes goes to the ingest buffers, the centroids get the other half and have to fit max_bytes once
+    encoded. The delta is picked so a digest of item_count values stays within the centroid budget, and a digest that
+    goes over it anyway (more values, or shards merged) is compacted.
+    The in memory half is split evenly between the producer shards of the client (see split), at most max_shards of
+    them, so the budget bounds the client whatever its number of threads.
+    """
+
+    def __init__(self, max_bytes, digest_format='binary', precision='float64', item_count=20000, delta=0.01):
+        """
+        :param item_count: the expected number of values per message (e.g. the flush_item_count)
+        """
+        self.max_bytes = max_bytes
+        self.max_centroids = min(payload_centroids(max_bytes, digest_format, precision),
+                                 max_bytes // 2 // CENTROID_BYTES)
+        if self.max_centroids < 2:
+            raise Exception(f"max_sketch_bytes={max_bytes} is too small for a digest.")
+        self.buffer_size = max_bytes // 2 // VALUE_BYTES
+        self.delta = budget_delta(self.max_centroids, item_count, delta)
+        self.max_shards = max(1, self.max_centroids // MIN_SHARD_CENTROIDS)
+        # the share of every shard, see split.
+        self.shard_centroids = self.max_centroids
+        self.shard_buffer_size = self.buffer_size
+
+    def split(self, shards):
+        """
+        Share the centroids and the ingest buffer evenly between shards producer shards (at most max_shards).
+        """
+        shards = min(max(shards, 1), self.max_shards)
+        self.shard_centroids = max(2, self.max_centroids // shards)
+        self.shard_buffer_size = self.buffer_size // shards
+
+    def enforce(self, digest):
+        """
+        Compact the MergingDigest of a shard that is over its share of the centroid budget.
+        """
+        if len(digest) > self.shard_centroids:
+            digest.compact(max(2, int(self.shard_centroids * COMPACT_RATIO)))
+
+    def fit(self, digest):
+        """
+        The digest to send: as is when it is within the budget, else a compacted MergingDigest.
+        :param digest: a MergingDigest or an array digest dictionary (the merge of several shards)
+        """
+        k = len(digest['means']) if isinstance(digest, dict) else len(digest)
+        if k <= self.max_centroids:
+            return digest
+        return MergingDigest.from_dict(digest).compact(self.max_centroids)
+
+
+def sketch_nbytes(sketch):
+    """
+    In memory size of the arrays of a sketch.
+    """
+    if isinstance(sketch, HistogramSketch):
+        return sketch.counts.nbytes
+    if isinstance(sketch, dict):
+        return sketch['means'].nbytes + sketch['counts'].nbytes
+    return sketch.nbytes
+
+
+def sketch_size(sketch):
+    """
+    The centroids of a digest, the bins of a histogram.
+    """
+    if isinstance(sketch, HistogramSketch):
+        return len(sketch.counts)
+    return len(sketch['means']) if isinstance(sketch, dict) else len(sketch)
+
+
+def footprint(sketches, buffers=(), digest_format='binary', precision='float64'):
+    """
+    Current footprint of an edge client's sketches.
+    :param sketches: the sketches of the client shards
+    :param buffers: their IngestBuffers
+    :return: {'centroids', 'buffered_values', 'memory_bytes', 'serialized_bytes'}, serialized_bytes being the body size
+             of every sketch sent on its own (exact for binary bodies, see codec.estimated_body_size) without the values
+             still buffered
+    """
+    sketches, buffers = list(sketches), list(buffers)
+    return {'centroids': sum(sketch_size(sketch) for sketch in sketches),
+            'buffered_values': sum(buffer.size for buffer in buffers),
+            'memory_bytes': sum(sketch_nbytes(sketch) for sketch in sketches) +
+                            sum(buffer.values.nbytes for buffer in buffers),
+            'serialized_bytes': sum(estimated_body_size(sketch, digest_format, precision) for sketch in sketches)}
@@ -0,0 +1,322 @@
+import base64
+import json
+import struct
+import zlib
+import numpy as np
+from sketches.ks import centroid_arrays
+from sketches.histogram import HistogramSketch, as_histogram, is_histogram
+
+# binary digest layout (little endian), base64 encoded so it is a valid SQS message body:
+#   header: magic 'TD', version, flags, centroids count, delta, K, n, min, max
+#   body:   centroid means followed by centroid weights, float64 or float32 (flags bit 0)
+HEADER_FORMAT = '<2sBBIddddd'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'TD'
+VERSION = 1
+FLAG_FLOAT32 = 1
+
+# binary histogram layout: header magic 'HG', version, flags, num_bins, min, max, then num_bins + 2 int64 counts.
+HISTOGRAM_HEADER_FORMAT = '<2sBBIdd'
+HISTOGRAM_HEADER_SIZE = struct.calcsize(HISTOGRAM_HEADER_FORMAT)
+HISTOGRAM_MAGIC = b'HG'
+
+# binary multi digest layout: header magic 'MD', version, flags, entries count, then for every entry
+#   entry header: feature name length, segment length, payload length, item count
+#   feature name and segment (utf-8), then the raw binary digest or histogram payload (without base64).
+MULTI_HEADER_FORMAT = '<2sBBI'
+MULTI_HEADER_SIZE = struct.calcsize(MULTI_HEADER_FORMAT)
+MULTI_ENTRY_FORMAT = '<HHIQ'
+MULTI_ENTRY_SIZE = struct.calcsize(MULTI_ENTRY_FORMAT)
+MULTI_MAGIC = b'MD'
+
+# feature name of digests that are not routed to a named monitor (the server default digest).
+DEFAULT_FEATURE = ''
+
+DIGEST_FORMATS = ('json', 'binary')
+
+# SQS message attribute with the number of raw items a message summarizes.
+ITEM_COUNT_ATTRIBUTE = 'item_count'
+
+# compressed bodies: '!', the compression name, ':' and the base64 of the compressed utf-8 body. '!' is neither '{' nor
+# a base64 character, so they are told apart from the other bodies by their first character.
+COMPRESSED_PREFIX = '!'
+BODY_COMPRESSIONS = ('zlib', 'zstd')
+# the largest SQS message, and the largest send_message_batch request.
+MAX_MESSAGE_BYTES = 262144
+
+
+def encode_digest(digest, precision='float64'):
+    """
+    Encode a digest with the binary codec.
+    :param digest: a TDigest, a TDigest.to_dict() dictionary or an array digest dictionary (see decode_digest)
+    :param precision: 'float64' or 'float32' for the centroid arrays. float32 halves the payload, but weights above
+                      2^24 are no longer exact.
+    :return: base64 string
+    """
+    return base64.b64encode(_digest_payload(digest, precision)).decode('ascii')
+
+
+def _digest_payload(digest, precision='float64'):
+    if isinstance(digest, dict):
+        digest_dict = digest
+    else:
+        digest_dict = {'delta': digest.delta, 'K': digest.K}
+    means, counts = centroid_arrays(digest)
+
+    if precision == 'float64':
+        dtype, flags = '<f8', 0
+    elif precision == 'float32':
+        dtype, flags = '<f4', FLAG_FLOAT32
+    else:
+        raise Exception(f"Unsupported precision: {precision}")
+
+    min_val = digest_dict.get('min', means[0] if len(means) else 0.)
+    max_val = digest_dict.get('max', means[-1] if len(means) else 0.)
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, flags, len(means), digest_dict.get('delta', 0.01),
+                         digest_dict.get('K', 25), float(counts.sum()), min_val, max_val)
+    return header + means.astype(dtype).tobytes() + counts.astype(dtype).tobytes()
+
+
+def decode_digest(body):
+    """
+    Decode a binary digest body.
+    :return: an array digest dictionary: {'n', 'delta', 'K', 'min', 'max', 'means', 'counts'} where means and counts
+             are float64 NumPy arrays sorted by mean. centroid_arrays() and the Redis handlers accept it directly.
+    """
+    return _decode_digest_payload(base64.b64decode(body))
+
+
+def _decode_digest_payload(payload):
+    magic, version, flags, k, delta, K, n, min_val, max_val = struct.unpack_from(HEADER_FORMAT, payload)
+    if magic != MAGIC:
+        raise Exception("Not a binary digest payload.")
+    if version != VERSION:
+        raise Exception(f"Unsupported digest codec version: {version}")
+
+    dtype = '<f4' if flags & FLAG_FLOAT32 else '<f8'
+    arrays = np.frombuffer(payload, dtype=dtype, count=2 * k, offset=HEADER_SIZE).astype(np.float64)
+    return {'n': n, 'delta': delta, 'K': K, 'min': min_val, 'max': max_val,
+            'means': arrays[:k], 'counts': arrays[k:]}
+
+
+def encode_histogram(histogram):
+    """
+    Encode a HistogramSketch with the binary codec.
+    :return: base64 string
+    """
+    return base64.b64encode(_histogram_payload(histogram)).decode('ascii')
+
+
+def _histogram_payload(histogram):
+    header = struct.pack(HISTOGRAM_HEADER_FORMAT, HISTOGRAM_MAGIC, VERSION, 0, histogram.num_bins,
+                         histogram.min_val, histogram.max_val)
+    return header + histogram.counts.astype('<i8').tobytes()
+
+
+def _decode_histogram_payload(payload):
+    magic, version, _, num_bins, min_val, max_val = struct.unpack_from(HISTOGRAM_HEADER_FORMAT, payload)
+    if version != VERSION:
+        raise Exception(f"Unsupported histogram codec version: {version}")
+    counts = np.frombuffer(payload, dtype='<i8', count=num_bins + 2, offset=HISTOGRAM_HEADER_SIZE)
+    return HistogramSketch(min_val, max_val, num_bins, counts.copy())
+
+
+def decode_binary(body):
+    """
+    Decode a binary body of any sketch type.
+    :return: an array digest dictionary (see decode_digest) or a HistogramSketch
+    """
+    return _decode_payload(base64.b64decode(body))
+
+
+def _decode_payload(payload):
+    if payload[:2] == HISTOGRAM_MAGIC:
+        return _decode_histogram_payload(payload)
+    return _decode_digest_payload(payload)
+
+
+def compress_body(body, compression='zlib', min_size=0):
+    """
+    Compress a message body (see COMPRESSED_PREFIX). zstd needs the zstandard package.
+    :param min_size: bodies shorter than this are not compressed
+    :return: the compressed body, or the body as is when it is short or compressing does not make it smaller
+    """
+    if len(body) < min_size:
+        return body
+    data = body.encode('utf-8')
+    if compression == 'zlib':
+        compressed = zlib.compress(data)
+    elif compression == 'zstd':
+        import zstandard
+        compressed = zstandard.ZstdCompressor().compress(data)
+    else:
+        raise Exception(f"Unsupported body compression: {compression}")
+    compressed_body = f"{COMPRESSED_PREFIX}{compression}:{base64.b64encode(compressed).decode('ascii')}"
+    return compressed_body if len(compressed_body) < len(body) else body
+
+
+def decompress_body(body):
+    """
+    The original body of a compress_body() body, other bodies are returned as is.
+    """
+    if not body.startswith(COMPRESSED_PREFIX):
+        return body
+    compression, _, data = body[len(COMPRESSED_PREFIX):].partition(':')
+    data = base64.b64decode(data)
+    if compression == 'zlib':
+        return zlib.decompress(data).decode('utf-8')
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    raise Exception(f"Unsupported body compression: {compression}")
+
+
+def body_format(body):
+    """
+    JSON digests are objects and always start with '{', which is not a base64 character.
+    """
+    return 'json' if body.lstrip()[:1] == '{' else 'binary'
+
+
+def encode_body(digest, digest_format='json', precision='float64'):
+    """
+    Encode a digest (or a HistogramSketch) as a message body in the configured format.
+    """
+    if is_histogram(digest):
+        histogram = digest if isinstance(digest, HistogramSketch) else HistogramSketch.from_dict(digest)
+        if digest_format == 'binary':
+            return encode_histogram(histogram)
+        if digest_format == 'json':
+            return json.dumps(histogram.to_dict())
+    elif digest_format == 'binary':
+        return encode_digest(digest, precision)
+    elif digest_format == 'json':
+        return json.dumps(to_tdigest_dict(digest) if isinstance(digest, dict) else digest.to_dict())
+    raise Exception(f"Unsupported digest format: {digest_format}")
+
+
+def decode_body(body, accepted_formats=DIGEST_FORMATS):
+    """
+    Decode a message body of any of the accepted formats.
+    :return: a TDigest.to_dict() dictionary for JSON bodies, an array digest dictionary for binary ones and a
+             HistogramSketch for histograms of either format.
+    """
+    body = decompress_body(body)
+    digest_format = body_format(body)
+    if digest_format not in accepted_formats:
+        raise Exception(f"Received a {digest_format} digest, accepted formats are: {accepted_formats}")
+    if digest_format == 'binary':
+        return decode_binary(body)
+    decoded = json.loads(body)
+    return HistogramSketch.from_dict(decoded) if is_histogram(decoded) else decoded
+
+
+def encode_multi_body(entries, digest_format='json', precision='float64'):
+    """
+    Encode several digests in one message body, each routed by the server to the monitor of its feature and segment.
+    :param entries: iterable of (feature, segment, sketch, item count). segment can be None.
+    """
+    entries = list(entries)
+    if digest_format == 'json':
+        return json.dumps({'digests': [
+            {'feature': feature, 'segment': segment, 'item_count': int(item_count),
+             'digest': json.loads(encode_body(sketch, 'json'))}
+            for feature, segment, sketch, item_count in entries]})
+    if digest_format != 'binary':
+        raise Exception(f"Unsupported digest format: {digest_format}")
+
+    parts = [struct.pack(MULTI_HEADER_FORMAT, MULTI_MAGIC, VERSION, 0, len(entries))]
+    for feature, segment, sketch, item_count in entries:
+        payload = _histogram_payload(as_histogram(sketch)) if is_histogram(sketch) else \
+            _digest_payload(sketch, precision)
+        feature, segment = feature.encode('utf-8'), (segment or '').encode('utf-8')
+        parts.append(struct.pack(MULTI_ENTRY_FORMAT, len(feature), len(segment), len(payload), int(item_count)))
+        parts.extend((feature, segment, payload))
+    return base64.b64encode(b''.join(parts)).decode('ascii')
+
+
+def _decode_multi_payload(payload):
+    magic, version, _, count = struct.unpack_from(MULTI_HEADER_FORMAT, payload)
+    if version != VERSION:
+        raise Exception(f"Unsupported multi digest codec version: {version}")
+    entries = []
+    offset = MULTI_HEADER_SIZE
+    for _ in range(count):
+        feature_len, segment_len, payload_len, item_count = struct.unpack_from(MULTI_ENTRY_FORMAT, payload, offset)
+        offset += MULTI_ENTRY_SIZE
+        feature = payload[offset:offset + feature_len].decode('utf-8')
+        offset += feature_len
+        segment = payload[offset:offset + segment_len].decode('utf-8') or None
+        offset += segment_len
+        entries.append((feature, segment, _decode_payload(payload[offset:offset + payload_len]), item_count))
+        offset += payload_len
+    return entries
+
+
+def decode_message_digests(message, accepted_formats=DIGEST_FORMATS, default_item_count=20000):
+    """
+    Every digest carried by a received message, single digest bodies included.
+    :return: list of (feature, segment, sketch, item count). Single digest bodies give one entry with the
+             DEFAULT_FEATURE and the item count of the message attribute (default_item_count without it).
+    """
+    body = decompress_body(message['Body'])
+    digest_format = body_format(body)
+    if digest_format not in accepted_formats:
+        raise Exception(f"Received a {digest_format} digest, accepted formats are: {accepted_formats}")
+
+    if digest_format == 'binary':
+        payload = base64.b64decode(body)
+        if payload[:2] == MULTI_MAGIC:
+            return _decode_multi_payload(payload)
+        return [(DEFAULT_FEATURE, None, _decode_payload(payload), message_item_count(message, default_item_count))]
+
+    decoded = json.loads(body)
+    if 'digests' in decoded:
+        return [(entry['feature'], entry.get('segment'),
+                 HistogramSketch.from_dict(entry['digest']) if is_histogram(entry['digest']) else entry['digest'],
+                 entry['item_count'])
+                for entry in decoded['digests']]
+    return [(DEFAULT_FEATURE, None, HistogramSketch.from_dict(decoded) if is_histogram(decoded) else decoded,
+             message_item_count(message, default_item_count))]
+
+
+def to_tdigest_dict(digest_dict):
+    """
+    Convert an array digest dictionary to the TDigest.to_dict() format, other dictionaries are returned as is.
+    """
+    if 'centroids' in digest_dict:
+        return digest_dict
+    return {'n': digest_dict['n'], 'delta': digest_dict['delta'], 'K': digest_dict['K'],
+            'centroids': [{'m': m, 'c': c} for m, c in zip(digest_dict['means'].tolist(),
+                                                          digest_dict['counts'].tolist())]}
+
+
+def estimated_body_size(sketch, digest_format='json', precision='float64'):
+    """
+    Size in bytes of the message body encode_body() would produce, without encoding it.
+    Exact for binary bodies, an upper estimate for JSON ones.
+    """
+    if isinstance(sketch, HistogramSketch):
+        if digest_format == 'binary':
+            return 4 * -(-(HISTOGRAM_HEADER_SIZE + 8 * (sketch.num_bins + 2)) // 3)
+        return 80 + 21 * (sketch.num_bins + 2)
+    k = len(sketch['means']) if isinstance(sketch, dict) else len(sketch)
+    if digest_format == 'binary':
+        itemsize = 4 if precision == 'float32' else 8
+        return 4 * -(-(HEADER_SIZE + 2 * itemsize * k) // 3)
+    return 60 + 48 * k
+
+
+def item_count_attributes(item_count):
+    """
+    SQS MessageAttributes carrying the number of items summarized by a message.
+    """
+    return {ITEM_COUNT_ATTRIBUTE: {'DataType': 'Number', 'StringValue': str(int(item_count))}}
+
+
+def message_item_count(message, default):
+    """
+    The number of items summarized by a received message, or default when the sender did not attach it.
+    """
+    attribute = message.get('MessageAttributes', {}).get(ITEM_COUNT_ATTRIBUTE)
+    return int(attribute['StringValue']) if attribute else default
@@ -0,0 +1,66 @@
+import numpy as np
+from sketches.histogram import HistogramSketch
+
+
+def as_values(values):
+    """
+    The values as a 1-D float64 array. NumPy float64 arrays and pandas Series of floats are used as they are (no copy),
+    lists are converted once.
+    """
+    return np.asarray(values, dtype=np.float64).ravel()
+
+
+def fold_values(sketch, values):
+    """
+    Fold a batch of values into a sketch in one merge: the batch is sorted once and its distinct values go in as
+    weighted centroids, so repeated values cost one centroid. Histograms take the values with batch_update.
+    :param sketch: a MergingDigest or a HistogramSketch
+    """
+    if isinstance(sketch, HistogramSketch):
+        sketch.batch_update(values)
+        return
+    values = np.sort(values)
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    counts = np.diff(np.append(starts, len(values))).astype(np.float64)
+    sketch.merge({'means': values[starts], 'counts': counts})
+
+
+class IngestBuffer:
+    """
+    Bounded ingestion stage in front of a sketch. Values are copied into a preallocated float64 array and folded into
+    the sketch (see fold_values) when it fills, so many small batches cost one sort and one merge per capacity values,
+    and the memory of the stage is capacity * 8 bytes whatever the batch sizes. Batches of at least capacity values
+    skip the copy and are folded directly.
+    """
+
+    def __init__(self, capacity=20000):
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    @property
+    def capacity(self):
+        return len(self.values)
+
+    def add(self, sketch, values):
+        """
+        :param sketch: the sketch the buffered values are folded into when the buffer fills
+        :param values: a list, a NumPy array or a pandas Series
+        :return: the number of values added
+        """
+        values = as_values(values)
+        if self.size + len(values) > self.capacity:
+            self.fold(sketch)
+        if len(values) >= self.capacity:
+            fold_values(sketch, values)
+        else:
+            self.values[self.size:self.size + len(values)] = values
+            self.size += len(values)
+        return len(values)
+
+    def fold(self, sketch):
+        """
+        Fold the buffered values into the sketch and empty the buffer.
+        """
+        if self.size:
+            fold_values(sketch, self.values[:self.size])
+            self.size = 0
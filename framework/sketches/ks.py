@@ -0,0 +1,295 @@
+import numpy as np
+
+
+def centroid_arrays(digest):
+    """
+    Extract the sorted centroid means and counts of a digest as NumPy arrays.
+    :param digest: a TDigest or MergingDigest object, the dictionary produced by TDigest.to_dict() or an array digest
+                   dictionary (see sketches.codec.decode_digest)
+    :return: (means, counts) float64 arrays sorted by mean
+    """
+    if isinstance(digest, dict) and 'means' in digest:
+        # array digests are already sorted.
+        return np.asarray(digest['means'], dtype=np.float64), np.asarray(digest['counts'], dtype=np.float64)
+    if hasattr(digest, 'means'):
+        # a MergingDigest (see sketches.merging_digest) keeps sorted arrays too.
+        return digest.means, digest.counts
+    if isinstance(digest, dict):
+        centroids = digest['centroids']
+    else:
+        centroids = digest.centroids_to_list()
+
+    means = np.fromiter((c['m'] for c in centroids), dtype=np.float64, count=len(centroids))
+    counts = np.fromiter((c['c'] for c in centroids), dtype=np.float64, count=len(centroids))
+
+    order = np.argsort(means, kind='stable')
+    return means[order], counts[order]
+
+
+def digest_cdf(means, counts, points):
+    """
+    Vectorized equivalent of TDigest.cdf evaluated at many points at once.
+    Each centroid owns the interval up to the midpoint with its successor, and the CDF is interpolated linearly
+    inside that interval, exactly as the tdigest package does it one value at a time.
+    :param means: sorted centroid means
+    :param counts: centroid counts aligned with means
+    :param points: the values to evaluate the CDF at
+    :return: array with the CDF value for each point
+    """
+    points = np.asarray(points, dtype=np.float64)
+    k = len(means)
+
+    # same conventions as TDigest.cdf for the degenerate digests.
+    if k == 0:
+        return np.ones_like(points)
+    if k == 1:
+        return (points >= means[0]).astype(np.float64)
+
+    gaps = np.diff(means)
+    half_widths = np.empty(k, dtype=np.float64)
+    half_widths[:-1] = gaps / 2.
+    half_widths[-1] = gaps[-1] / 2.
+    upper_bounds = means + half_widths
+
+    total = counts.sum()
+    cum_before = np.concatenate(([0.], np.cumsum(counts)[:-1]))
+
+    # index of the first centroid whose interval has not ended yet.
+    idx = np.searchsorted(upper_bounds, points, side='right')
+    beyond = idx == k
+    idx = np.minimum(idx, k - 1)
+
+    # duplicate means give zero half widths, only reached by points below the mean, where z is -1.
+    widths = half_widths[idx]
+    z = np.full(points.shape, -1.)
+    np.divide(points - means[idx], widths, out=z, where=widths > 0)
+    z = np.maximum(-1., z)
+    cdf = cum_before[idx] / total + counts[idx] / total * (z + 1) / 2
+    cdf[beyond] = 1.
+    return cdf
+
+
+def cdf_breakpoints(means):
+    """
+    The points where the piecewise linear digest CDF changes slope or jumps.
+    :param means: sorted centroid means
+    :return: sorted array of breakpoints
+    """
+    k = len(means)
+    if k < 2:
+        return np.asarray(means, dtype=np.float64)
+
+    gaps = np.diff(means)
+    half_widths = np.empty(k, dtype=np.float64)
+    half_widths[:-1] = gaps / 2.
+    half_widths[-1] = gaps[-1] / 2.
+    return np.unique(np.concatenate((means - half_widths, means + half_widths)))
+
+
+def ks_statistic(ref_means, ref_counts, test_means, test_counts, eval_points=None):
+    """
+    Compute the KS statistic between two digests in one batched pass over their centroid arrays.
+    :param ref_means: sorted centroid means of the reference digest
+    :param ref_counts: centroid counts of the reference digest
+    :param test_means: sorted centroid means of the tested digest
+    :param test_counts: centroid counts of the tested digest
+    :param eval_points: points to take the maximum over (e.g. the raw reference values, which gives the same value as
+                        looping over them with TDigest.cdf). If None, the exact supremum over the merged breakpoints
+                        of both CDFs is computed, including the left limits at every jump.
+    :return: (KS statistic, the point where it is attained)
+    """
+    if eval_points is None:
+        knots = np.union1d(cdf_breakpoints(ref_means), cdf_breakpoints(test_means))
+        eval_points = np.concatenate((knots, np.nextafter(knots, -np.inf)))
+    else:
+        eval_points = np.asarray(eval_points, dtype=np.float64)
+
+    if eval_points.size == 0:
+        return 0., None
+
+    diffs = np.abs(digest_cdf(ref_means, ref_counts, eval_points) - digest_cdf(test_means, test_counts, eval_points))
+    argmax = int(np.argmax(diffs))
+    return float(diffs[argmax]), float(eval_points[argmax])
+
+
+def digest_ks(ref_digest, test_digest, eval_points=None):
+    """
+    Drop in replacement for the `max(abs(ref_digest.cdf(x) - test_digest.cdf(x)) for x in ref_data)` loops.
+    :param ref_digest: reference TDigest (or its to_dict() dictionary)
+    :param test_digest: tested TDigest (or its to_dict() dictionary)
+    :param eval_points: see ks_statistic
+    :return: (KS statistic, the point where it is attained)
+    """
+    ref_means, ref_counts = centroid_arrays(ref_digest)
+    test_means, test_counts = centroid_arrays(test_digest)
+    return ks_statistic(ref_means, ref_counts, test_means, test_counts, eval_points)
+
+
+def _own_cdf(sorted_values):
+    """
+    The right-continuous empirical CDF of a sorted sample at its own values (ties take the rank of their last copy).
+    """
+    n = len(sorted_values)
+    group_ends = np.append(sorted_values[1:] != sorted_values[:-1], True)
+    ranks = np.where(group_ends, np.arange(1, n + 1), n)
+    return np.minimum.accumulate(ranks[::-1])[::-1] / n
+
+
+class SortedSample:
+    """
+    A raw sample sorted once, with its empirical CDF at its own values, to compute exact two-sample KS statistics
+    (the statistic of scipy.stats.ks_2samp, without the p-value) against many test samples.
+    Both empirical CDFs only jump at sample values, so each test sorts the test sample and finds the position of every
+    value in the other sample with one searchsorted per side.
+    """
+
+    def __init__(self, data):
+        self.values = np.sort(np.asarray(data, dtype=np.float64))
+        self.cdf = _own_cdf(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def ks(self, test_data):
+        """
+        :param test_data: the tested sample, in any order
+        :return: (KS statistic, the point where it is attained)
+        """
+        test = SortedSample(test_data)
+        if len(self) == 0 or len(test) == 0:
+            return 0., None
+        # at the reference values, then at the test values.
+        ref_diffs = np.abs(self.cdf - np.searchsorted(test.values, self.values, side='right') / len(test))
+        test_diffs = np.abs(np.searchsorted(self.values, test.values, side='right') / len(self) - test.cdf)
+        ref_argmax, test_argmax = int(np.argmax(ref_diffs)), int(np.argmax(test_diffs))
+        if ref_diffs[ref_argmax] >= test_diffs[test_argmax]:
+            return float(ref_diffs[ref_argmax]), float(self.values[ref_argmax])
+        return float(test_diffs[test_argmax]), float(test.values[test_argmax])
+
+
+def sample_ks(ref_data, test_data):
+    """
+    Exact two-sample KS statistic of raw samples, see SortedSample.
+    :return: (KS statistic, the point where it is attained)
+    """
+    return SortedSample(ref_data).ks(test_data)
+
+
+class IncrementalKS:
+    """
+    Running KS statistic of an aggregate that grows one digest at a time, on a fixed evaluation grid.
+    The CDF of merged digests is the count weighted mixture of their CDFs, so the tracker keeps the cumulative
+    weight at every grid point and adds each incoming digest's share in O(grid size + centroids), without reading
+    the aggregate back. Digest compression on merge moves the CDF slightly, so a full recompute on the aggregated
+    digest should still be done at window boundaries.
+    """
+
+    def __init__(self, grid, ref_cdf):
+        """
+        :param grid: sorted evaluation points
+        :param ref_cdf: the reference CDF at the grid points (e.g. ReferenceArtifact.grid_cdf)
+        """
+        self.grid = np.asarray(grid, dtype=np.float64)
+        self.ref_cdf = np.asarray(ref_cdf, dtype=np.float64)
+        self.cum_weights = np.zeros(len(self.grid))
+        self.n = 0.
+
+    def reset(self):
+        self.cum_weights[:] = 0.
+        self.n = 0.
+
+    def add_cumulative_weights(self, cum_weights, n):
+        """
+        :param cum_weights: weight at or below each grid point of the added sketch
+        :param n: total weight of the added sketch
+        """
+        self.cum_weights += cum_weights
+        self.n += n
+
+    def add_digest(self, digest):
+        means, counts = centroid_arrays(digest)
+        n = counts.sum()
+        if n > 0:
+            self.add_cumulative_weights(digest_cdf(means, counts, self.grid) * n, n)
+
+    def add_histogram(self, histogram):
+        """
+        Histograms have their cumulative counts exactly, the grid has to be the upper edges of their bins.
+        """
+        self.add_cumulative_weights(np.cumsum(histogram.counts), histogram.n)
+
+    def statistic(self):
+        """
+        :return: (KS statistic, the grid point where it is attained), (0, None) while nothing was added
+        """
+        if self.n == 0 or len(self.grid) == 0:
+            return 0., None
+        diffs = np.abs(self.ref_cdf - self.cum_weights / self.n)
+        argmax = int(np.argmax(diffs))
+        return float(diffs[argmax]), float(self.grid[argmax])
+
+
+# evaluation grids for the digest KS statistic, from the most to the least expensive on large references:
+#   reference_points     every raw reference value (the experiments' get_digest_ks)
+#   quantiles            grid_size reference quantiles
+#   reference_centroids  the reference centroid means (the playground DigestCalculator)
+#   union_centroids      the centroid means of both digests
+#   adaptive             a grid_size quantile grid, then every breakpoint around its argmax
+#   exact                every breakpoint of both CDFs (ks_statistic with eval_points=None)
+GRID_STRATEGIES = ('reference_points', 'quantiles', 'reference_centroids', 'union_centroids', 'adaptive', 'exact')
+
+
+def quantile_grid(means, counts, grid_size):
+    """
+    grid_size quantiles of a digest, interpolated between its centroids.
+    """
+    if len(means) == 0:
+        return np.empty(0)
+    mid_quantiles = (np.cumsum(counts) - counts / 2.) / counts.sum()
+    return np.unique(np.interp(np.linspace(0, 1, grid_size), mid_quantiles, means))
+
+
+def _with_left_limits(points):
+    return np.concatenate((points, np.nextafter(points, -np.inf)))
+
+
+def grid_ks(ref_means, ref_counts, test_means, test_counts, strategy='exact', ref_points=None, grid_size=1000):
+    """
+    KS statistic between two digests over the evaluation grid of a strategy (see GRID_STRATEGIES).
+    :param ref_points: the raw reference values, required by 'reference_points'
+    :param grid_size: number of points of the 'quantiles' grid and of the first 'adaptive' pass
+    :return: (KS statistic, the point where it is attained)
+    """
+    if strategy == 'reference_points':
+        if ref_points is None:
+            raise Exception("The reference_points strategy needs the reference values.")
+        return ks_statistic(ref_means, ref_counts, test_means, test_counts, ref_points)
+    if strategy == 'quantiles':
+        return ks_statistic(ref_means, ref_counts, test_means, test_counts,
+                            quantile_grid(ref_means, ref_counts, grid_size))
+    if strategy == 'reference_centroids':
+        return ks_statistic(ref_means, ref_counts, test_means, test_counts, ref_means)
+    if strategy == 'union_centroids':
+        return ks_statistic(ref_means, ref_counts, test_means, test_counts, np.union1d(ref_means, test_means))
+    if strategy == 'exact':
+        return ks_statistic(ref_means, ref_counts, test_means, test_counts)
+    if strategy != 'adaptive':
+        raise Exception(f"Unsupported grid strategy: {strategy}")
+
+    coarse = np.union1d(quantile_grid(ref_means, ref_counts, grid_size), quantile_grid(test_means, test_counts,
+                                                                                        grid_size))
+    if coarse.size == 0:
+        return 0., None
+    coarse_ks, coarse_location = ks_statistic(ref_means, ref_counts, test_means, test_counts, coarse)
+    # both CDFs are piecewise linear between their breakpoints, so the supremum inside the coarse cell around the
+    # argmax is attained at one of the breakpoints in it (or at its left limit).
+    index = int(np.searchsorted(coarse, coarse_location))
+    low, high = coarse[max(index - 1, 0)], coarse[min(index + 1, len(coarse) - 1)]
+    knots = np.union1d(cdf_breakpoints(ref_means), cdf_breakpoints(test_means))
+    knots = knots[(knots >= low) & (knots <= high)]
+    if knots.size == 0:
+        return coarse_ks, coarse_location
+    fine_ks, fine_location = ks_statistic(ref_means, ref_counts, test_means, test_counts, _with_left_limits(knots))
+    if fine_ks > coarse_ks:
+        return fine_ks, fine_location
+    return coarse_ks, coarse_location
@@ -0,0 +1,88 @@
+import numpy as np
+from sketches.ks import centroid_arrays
+from sketches.histogram import is_histogram, merge_histograms
+
+# the centroids of the tree digest (tdigest.TDigest) average about half their weight bound, compressing at
+# delta * COMPRESSION_FACTOR keeps as many centroids, and so the same accuracy. Every merge path (MergingDigest,
+# merge_digests and the Redis merge script) compresses at this scale.
+COMPRESSION_FACTOR = 0.5
+
+
+def compress_centroids(means, counts, delta=0.01):
+    """
+    Compress sorted centroids in one vectorized pass.
+    The tdigest bound on a centroid weight, 4 * n * delta * q * (1 - q), is a unit step of the scale function
+    k(q) = log(q / (1 - q)) / (4 * delta), so centroids whose quantile midpoints fall in the same unit k interval are
+    combined into one (weighted mean, summed weight).
+    :param means: sorted centroid means
+    :param counts: centroid counts aligned with means
+    :param delta: the digest compression parameter
+    :return: (means, counts) of the compressed digest
+    """
+    if len(means) < 2:
+        return means, counts
+
+    cum = np.cumsum(counts)
+    total = cum[-1]
+    q = (cum - counts / 2.) / total
+    k = np.floor(np.log(q / (1 - q)) / (4 * delta))
+
+    starts = np.flatnonzero(np.concatenate(([True], k[1:] != k[:-1])))
+    new_counts = np.add.reduceat(counts, starts)
+    new_means = np.add.reduceat(means * counts, starts) / new_counts
+    return new_means, new_counts
+
+
+def merge_digests(digests, delta=None, K=None):
+    """
+    Merge any number of digests into one array digest dictionary (see sketches.codec.decode_digest).
+    t-digest merges are associative, so this is equivalent to merging them into Redis one by one.
+    :param digests: TDigest objects, TDigest.to_dict() dictionaries or array digest dictionaries
+    :param delta: compression of the result, defaults to the first digest's
+    :param K: K of the result, defaults to the first digest's
+    """
+    digests = list(digests)
+    first = digests[0] if digests else {}
+    if delta is None:
+        delta = first.get('delta', 0.01) if isinstance(first, dict) else first.delta
+    if K is None:
+        K = first.get('K', 25) if isinstance(first, dict) else first.K
+
+    arrays = [centroid_arrays(digest) for digest in digests]
+    if arrays:
+        means = np.concatenate([m for m, _ in arrays])
+        counts = np.concatenate([c for _, c in arrays])
+    else:
+        means = counts = np.empty(0, dtype=np.float64)
+
+    order = np.argsort(means, kind='stable')
+    means, counts = means[order], counts[order]
+    min_val, max_val = (float(means[0]), float(means[-1])) if len(means) else (0., 0.)
+    # compressed digests keep their exact extremes, their first and last centroids are already averages.
+    for digest in digests:
+        if isinstance(digest, dict) and 'min' in digest and digest.get('n'):
+            min_val, max_val = min(min_val, digest['min']), max(max_val, digest['max'])
+    means, counts = compress_centroids(means, counts, delta * COMPRESSION_FACTOR)
+    return {'n': float(counts.sum()), 'delta': delta, 'K': K, 'min': min_val, 'max': max_val,
+            'means': means, 'counts': counts}
+
+
+def values_digest(values, delta=0.01, K=25):
+    """
+    The raw values as an uncompressed array digest dictionary (one unit weight centroid per value), so merge_digests
+    builds or updates a digest from a NumPy batch in one vectorized pass.
+    """
+    means = np.sort(np.asarray(values, dtype=np.float64))
+    min_val, max_val = (float(means[0]), float(means[-1])) if len(means) else (0., 0.)
+    return {'n': float(len(means)), 'delta': delta, 'K': K, 'min': min_val, 'max': max_val,
+            'means': means, 'counts': np.ones(len(means))}
+
+
+def merge_sketches(sketches):
+    """
+    Merge decoded message sketches of one type: histograms are added up, digests go through merge_digests.
+    """
+    sketches = list(sketches)
+    if sketches and is_histogram(sketches[0]):
+        return merge_histograms(sketches)
+    return merge_digests(sketches)
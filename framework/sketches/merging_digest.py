@@ -0,0 +1,167 @@
+import numpy as np
+from sketches.ks import centroid_arrays, digest_cdf
+from sketches.merge import COMPRESSION_FACTOR, compress_centroids
+
+
+class MergingDigest:
+    """
+    Merging t-digest with its centroids in sorted NumPy arrays, a replacement of tdigest.TDigest on the hot paths.
+    Values are ingested by sorting them together with the current centroids and compressing the result in one
+    vectorized pass (see sketches.merge.compress_centroids) instead of inserting them one at a time into a tree, and
+    cdf / percentile are evaluated for many points at once.
+    It reads and writes the TDigest.to_dict() format, so JSON messages and Redis digests stay compatible with TDigest.
+    """
+
+    def __init__(self, delta=0.01, K=25):
+        self.delta = delta
+        self.K = K
+        self._means = np.empty(0, dtype=np.float64)
+        self._counts = np.empty(0, dtype=np.float64)
+        # single values of update(), merged on the next compress.
+        self._buffer = []
+
+    @classmethod
+    def from_dict(cls, dict_values):
+        """
+        :param dict_values: a TDigest.to_dict() dictionary or an array digest dictionary (see sketches.codec)
+        """
+        return cls(dict_values.get('delta', 0.01), dict_values.get('K', 25)).update_from_dict(dict_values)
+
+    @property
+    def means(self):
+        self.compress()
+        return self._means
+
+    @property
+    def counts(self):
+        self.compress()
+        return self._counts
+
+    @property
+    def n(self):
+        return float(self._counts.sum()) + sum(w for _, w in self._buffer)
+
+    def __len__(self):
+        return len(self.means)
+
+    @property
+    def nbytes(self):
+        """
+        Memory of the centroid arrays and of the buffered values.
+        """
+        return self._means.nbytes + self._counts.nbytes + 16 * len(self._buffer)
+
+    def __repr__(self):
+        return f"<MergingDigest: n={self.n:.0f}, centroids={len(self)}>"
+
+    def _merge_arrays(self, means, counts):
+        means = np.concatenate((self._means, means))
+        counts = np.concatenate((self._counts, counts))
+        order = np.argsort(means, kind='stable')
+        self._means, self._counts = compress_centroids(means[order], counts[order],
+                                                       self.delta * COMPRESSION_FACTOR)
+
+    def compress(self):
+        if self._buffer:
+            buffer = np.asarray(self._buffer, dtype=np.float64)
+            self._buffer = []
+            self._merge_arrays(buffer[:, 0], buffer[:, 1])
+
+    def compact(self, max_centroids):
+        """
+        Raise delta until the digest has at most max_centroids centroids. The centroid count is about proportional to
+        1 / delta, so it takes one or two recompressions of the current centroids.
+        :return: self
+        """
+        if max_centroids < 2:
+            raise Exception(f"A digest needs at least 2 centroids, got max_centroids={max_centroids}")
+        self.compress()
+        while len(self._means) > max_centroids:
+            self.delta *= len(self._means) / max_centroids
+            self._means, self._counts = compress_centroids(self._means, self._counts, self.delta * COMPRESSION_FACTOR)
+        return self
+
+    def update(self, x, w=1):
+        """
+        Update the digest with value x and weight w. The value is buffered, K / delta values are merged at a time.
+        """
+        self._buffer.append((float(x), float(w)))
+        if len(self._buffer) >= self.K / self.delta:
+            self.compress()
+
+    def batch_update(self, values, w=1):
+        """
+        Update the digest with an array (or iterable) of values of the same weight w.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.compress()
+        if values.size:
+            self._merge_arrays(values, np.full(values.size, float(w)))
+
+    def merge(self, other):
+        """
+        Merge another digest into this one.
+        :param other: a MergingDigest, a TDigest, a TDigest.to_dict() dictionary or an array digest dictionary
+        :return: self
+        """
+        means, counts = centroid_arrays(other)
+        self.compress()
+        if len(means):
+            self._merge_arrays(means, counts)
+        return self
+
+    def __add__(self, other):
+        return MergingDigest(self.delta, self.K).merge(self).merge(other)
+
+    def update_from_dict(self, dict_values):
+        """
+        Merge the centroids of a dictionary into the digest, taking its delta and K when it has them (as
+        TDigest.update_from_dict does).
+        """
+        self.delta = dict_values.get('delta', self.delta)
+        self.K = dict_values.get('K', self.K)
+        return self.merge(dict_values)
+
+    def update_centroids_from_list(self, list_values):
+        return self.merge({'centroids': list_values})
+
+    def cdf(self, x):
+        """
+        The CDF at x, with the interpolation of TDigest.cdf.
+        :param x: a value or an array of values
+        :return: a float for a single value, an array otherwise
+        """
+        cdf = digest_cdf(self.means, self.counts, np.atleast_1d(np.asarray(x, dtype=np.float64)))
+        return float(cdf[0]) if np.ndim(x) == 0 else cdf
+
+    def quantile(self, q):
+        """
+        The inverse of the CDF at q in [0, 1]: interpolated between the centroid means at their cumulative midpoints
+        (as TDigest.percentile), clamped to the first and last means.
+        :param q: a quantile or an array of quantiles
+        :return: a float for a single quantile, an array otherwise
+        """
+        quantiles = np.asarray(q, dtype=np.float64)
+        if np.any((quantiles < 0) | (quantiles > 1)):
+            raise ValueError("q must be between 0 and 1, inclusive.")
+        means, counts = self.means, self.counts
+        if len(means) == 0:
+            raise ValueError("The digest is empty.")
+        midpoints = np.cumsum(counts) - counts / 2.
+        values = np.interp(quantiles * counts.sum(), midpoints, means)
+        return float(values) if np.ndim(q) == 0 else values
+
+    def percentile(self, p):
+        """
+        The quantile at p in [0, 100], see quantile.
+        """
+        return self.quantile(np.asarray(p, dtype=np.float64) / 100.)
+
+    def centroids_to_list(self):
+        return [{'m': m, 'c': c} for m, c in zip(self.means.tolist(), self.counts.tolist())]
+
+    def to_dict(self):
+        """
+        The digest in the TDigest.to_dict() format.
+        """
+        return {'n': self.n, 'delta': self.delta, 'K': self.K, 'centroids': self.centroids_to_list()}
@@ -0,0 +1,116 @@
+import numpy as np
+
+# lookup table of the Kolmogorov distribution survival function Q(lambda) = P(sqrt(n_e) * D > lambda) on a fine grid,
+# interpolated at check time. Q(TABLE_MAX_LAMBDA) is below 1e-10, larger lambdas get 0.
+TABLE_MAX_LAMBDA = 3.5
+TABLE_SIZE = 7001
+SERIES_TERMS = 100
+
+
+def kolmogorov_sf(lambdas):
+    """
+    The asymptotic Kolmogorov survival function Q(lambda), from its series expansions: the alternating series
+    converges fast for large lambda, the theta function form for small ones.
+    """
+    lambdas = np.atleast_1d(np.asarray(lambdas, dtype=np.float64))
+    sf = np.ones(len(lambdas))
+    k = np.arange(1, SERIES_TERMS + 1)[:, None]
+
+    large = lambdas >= 1.
+    if large.any():
+        lam = lambdas[large]
+        sf[large] = 2 * np.sum((-1.) ** (k - 1) * np.exp(-2 * k ** 2 * lam ** 2), axis=0)
+
+    small = (lambdas > 0) & ~large
+    if small.any():
+        lam = lambdas[small]
+        cdf = np.sqrt(2 * np.pi) / lam * np.sum(np.exp(-(2 * k - 1) ** 2 * np.pi ** 2 / (8 * lam ** 2)), axis=0)
+        sf[small] = 1 - cdf
+    return np.clip(sf, 0., 1.)
+
+
+TABLE_LAMBDAS = np.linspace(0, TABLE_MAX_LAMBDA, TABLE_SIZE)
+TABLE_SF = kolmogorov_sf(TABLE_LAMBDAS)
+
+
+def effective_size(n_ref, n_test):
+    """
+    Effective sample size of the two-sample test, n_ref * n_test / (n_ref + n_test).
+    """
+    if n_ref <= 0 or n_test <= 0:
+        return 0.
+    return n_ref * n_test / (n_ref + n_test)
+
+
+def _lambda_scale(n_ref, n_test):
+    # the small sample correction of Stephens (1970), lambda = (sqrt(n_e) + 0.12 + 0.11 / sqrt(n_e)) * D.
+    root_n = np.sqrt(effective_size(n_ref, n_test))
+    return root_n + 0.12 + 0.11 / root_n
+
+
+def ks_pvalue(statistic, n_ref, n_test, digest_error=0.):
+    """
+    Asymptotic p-value of a two-sample KS statistic, from the lookup table.
+    :param statistic: the KS statistic
+    :param n_ref: number of reference items
+    :param n_test: number of aggregated test items
+    :param digest_error: bound on the error of a statistic computed from sketches, subtracted before the lookup so
+                         the p-value is not smaller than the one of the exact statistic
+    :return: the p-value, 1 when either sample is empty
+    """
+    if effective_size(n_ref, n_test) == 0:
+        return 1.
+    lam = max(statistic - digest_error, 0.) * _lambda_scale(n_ref, n_test)
+    if lam >= TABLE_MAX_LAMBDA:
+        return 0.
+    return float(np.interp(lam, TABLE_LAMBDAS, TABLE_SF))
+
+
+def critical_value(significance, n_ref, n_test, digest_error=0.):
+    """
+    The KS statistic above which ks_pvalue(statistic, n_ref, n_test, digest_error) < significance.
+    :return: the critical value, infinity when either sample is empty
+    """
+    if effective_size(n_ref, n_test) == 0:
+        return np.inf
+    # TABLE_SF is decreasing, np.interp needs increasing x values.
+    lam = float(np.interp(significance, TABLE_SF[::-1], TABLE_LAMBDAS[::-1]))
+    return lam / _lambda_scale(n_ref, n_test) + digest_error
+
+
+class DriftTest:
+    """
+    Decides whether a KS statistic is drift: above a fixed KS threshold, or, when a significance level is set,
+    significant given the reference and test sizes (the aggregated count is known from the Redis counters).
+    """
+
+    def __init__(self, alerting_threshold=0.05, significance=None, digest_error=0.):
+        """
+        :param alerting_threshold: KS statistic above which drift is reported when no significance is set
+        :param significance: report drift when the p-value is below this level, e.g. 0.01
+        :param digest_error: bound on the sketch error of the KS statistic, see ks_pvalue
+        """
+        self.alerting_threshold = alerting_threshold
+        self.significance = significance
+        self.digest_error = digest_error
+
+    @classmethod
+    def from_config(cls, configs, alerting_threshold=0.05):
+        """
+        :param configs: server or monitor configuration with the optional alerting_significance and
+                        digest_error_bound entries
+        """
+        return cls(alerting_threshold, configs.get("alerting_significance"), configs.get("digest_error_bound", 0.))
+
+    def is_drift(self, statistic, n_ref, n_test):
+        if self.significance is None:
+            return statistic > self.alerting_threshold
+        return statistic > critical_value(self.significance, n_ref, n_test, self.digest_error)
+
+    def describe(self, statistic, n_ref, n_test):
+        """
+        Text for the drift report, the p-value when alerting by significance.
+        """
+        if self.significance is None:
+            return f"KS value: {statistic}"
+        return f"KS value: {statistic} p-value: {ks_pvalue(statistic, n_ref, n_test, self.digest_error)}"
@@ -0,0 +1,22 @@
+import boto3
+from transport.local_queue import LOCAL_BROKER
+from transport.socket_broker import DEFAULT_BROKER_ADDRESS, SocketSQS
+
+# "sqs": AWS SQS or localstack at endpoint_url, "local": the queues of this process (LOCAL_BROKER),
+# "socket": a SocketBroker at broker_address, shared by the processes of one machine.
+TRANSPORTS = ('sqs', 'local', 'socket')
+
+
+def create_sqs_client(configs):
+    """
+    The queue client of a client, aggregator or server configuration ("transport", "sqs" by default). Every transport
+    has the calls of the boto3 SQS client.
+    """
+    transport = configs.get('transport', 'sqs')
+    if transport == 'sqs':
+        return boto3.client('sqs', endpoint_url=configs['endpoint_url'])
+    if transport == 'local':
+        return LOCAL_BROKER
+    if transport == 'socket':
+        return SocketSQS(configs.get('broker_address', DEFAULT_BROKER_ADDRESS), configs.get('broker_timeout'))
+    raise Exception(f"Unknown transport: {transport}, expected one of {TRANSPORTS}.")
@@ -0,0 +1,225 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class LocalSQS:
+    """
+    In-process stand-in for the subset of the boto3 SQS client used by the clients and the server.
+    Supports long polling, visibility timeouts and the batch calls, and can add a fixed latency to every call to
+    approximate the network round trip of the real service.
+    A LocalSQS is a single queue and ignores the QueueUrl of the calls, see LocalBroker for several queues.
+    """
+
+    def __init__(self, latency=0.0, default_visibility_timeout=30):
+        self.latency = latency
+        self.default_visibility_timeout = default_visibility_timeout
+        self.visible = deque()
+        # receipt handle -> (message id, body, attributes, time it becomes visible again)
+        self.in_flight = {}
+        self.condition = threading.Condition()
+        self.ids = itertools.count()
+        self.calls = 0
+        self.bytes_sent = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _requeue_expired(self):
+        now = time.time()
+        expired = [handle for handle, (_, _, _, visible_at) in self.in_flight.items() if visible_at <= now]
+        for handle in expired:
+            message_id, body, attributes, _ = self.in_flight.pop(handle)
+            self.visible.append((message_id, body, attributes))
+
+    def send_message(self, QueueUrl, MessageBody, MessageAttributes=None, **kwargs):
+        self._call()
+        with self.condition:
+            message_id = str(next(self.ids))
+            self.visible.append((message_id, MessageBody, MessageAttributes))
+            self.bytes_sent += len(MessageBody)
+            self.condition.notify()
+        return {'MessageId': message_id}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self._call()
+        successful = []
+        with self.condition:
+            for entry in Entries:
+                message_id = str(next(self.ids))
+                self.visible.append((message_id, entry['MessageBody'], entry.get('MessageAttributes')))
+                self.bytes_sent += len(entry['MessageBody'])
+                successful.append({'Id': entry['Id'], 'MessageId': message_id})
+            self.condition.notify_all()
+        return {'Successful': successful, 'Failed': []}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, WaitTimeSeconds=0, VisibilityTimeout=None, **kwargs):
+        self._call()
+        visibility_timeout = self.default_visibility_timeout if VisibilityTimeout is None else VisibilityTimeout
+        deadline = time.time() + WaitTimeSeconds
+        with self.condition:
+            self._requeue_expired()
+            while not self.visible and time.time() < deadline:
+                self.condition.wait(min(deadline - time.time(), 0.1))
+                self._requeue_expired()
+
+            messages = []
+            while self.visible and len(messages) < MaxNumberOfMessages:
+                message_id, body, attributes = self.visible.popleft()
+                handle = f'{message_id}-{next(self.ids)}'
+                self.in_flight[handle] = (message_id, body, attributes, time.time() + visibility_timeout)
+                message = {'MessageId': message_id, 'ReceiptHandle': handle, 'Body': body}
+                if attributes:
+                    message['MessageAttributes'] = attributes
+                messages.append(message)
+        return {'Messages': messages} if messages else {}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self._call()
+        with self.condition:
+            self.in_flight.pop(ReceiptHandle, None)
+        return {}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        self._call()
+        with self.condition:
+            for entry in Entries:
+                self.in_flight.pop(entry['ReceiptHandle'], None)
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'Failed': []}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        self._call()
+        with self.condition:
+            for entry in Entries:
+                if entry['ReceiptHandle'] in self.in_flight:
+                    message_id, body, attributes, _ = self.in_flight[entry['ReceiptHandle']]
+                    self.in_flight[entry['ReceiptHandle']] = (message_id, body, attributes,
+                                                              time.time() + entry['VisibilityTimeout'])
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'Failed': []}
+
+    def purge_queue(self, QueueUrl):
+        self._call()
+        with self.condition:
+            self.visible.clear()
+            self.in_flight.clear()
+        return {}
+
+    def pending(self):
+        with self.condition:
+            return len(self.visible) + len(self.in_flight)
+
+
+class AsyncLocalSQS(LocalSQS):
+    """
+    LocalSQS with awaitable calls, the stand-in for an aiobotocore SQS client. The latency and the long polls wait on
+    the event loop instead of blocking it.
+    """
+
+    def _call(self):
+        # counted and delayed by _async_call before the synchronous implementation runs.
+        pass
+
+    async def _async_call(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send_message(self, QueueUrl, MessageBody, MessageAttributes=None, **kwargs):
+        await self._async_call()
+        return super().send_message(QueueUrl, MessageBody, MessageAttributes)
+
+    async def send_message_batch(self, QueueUrl, Entries):
+        await self._async_call()
+        return super().send_message_batch(QueueUrl, Entries)
+
+    async def receive_message(self, QueueUrl, MaxNumberOfMessages=1, WaitTimeSeconds=0, VisibilityTimeout=None,
+                              **kwargs):
+        await self._async_call()
+        deadline = time.time() + WaitTimeSeconds
+        while True:
+            response = super().receive_message(QueueUrl, MaxNumberOfMessages, 0, VisibilityTimeout)
+            if response or time.time() >= deadline:
+                return response
+            await asyncio.sleep(0.01)
+
+    async def delete_message(self, QueueUrl, ReceiptHandle):
+        await self._async_call()
+        return super().delete_message(QueueUrl, ReceiptHandle)
+
+    async def delete_message_batch(self, QueueUrl, Entries):
+        await self._async_call()
+        return super().delete_message_batch(QueueUrl, Entries)
+
+    async def change_message_visibility_batch(self, QueueUrl, Entries):
+        await self._async_call()
+        return super().change_message_visibility_batch(QueueUrl, Entries)
+
+    async def purge_queue(self, QueueUrl):
+        await self._async_call()
+        return super().purge_queue(QueueUrl)
+
+
+# the SQS calls every transport implements, with the same arguments and responses as the boto3 client.
+SQS_METHODS = ('send_message', 'send_message_batch', 'receive_message', 'delete_message', 'delete_message_batch',
+               'change_message_visibility_batch', 'purge_queue')
+
+
+class LocalBroker:
+    """
+    The queues of the "local" transport: one LocalSQS per queue url, created on first use, behind the calls of the
+    boto3 SQS client. Clients, aggregators and servers of one process that share a broker share its queues.
+    """
+
+    def __init__(self, latency=0.0, default_visibility_timeout=30):
+        self.latency = latency
+        self.default_visibility_timeout = default_visibility_timeout
+        self.queues = {}
+        self.lock = threading.Lock()
+
+    def queue(self, queue_url):
+        with self.lock:
+            if queue_url not in self.queues:
+                self.queues[queue_url] = LocalSQS(self.latency, self.default_visibility_timeout)
+            return self.queues[queue_url]
+
+    def call(self, method, QueueUrl, **kwargs):
+        """
+        Run one of the SQS_METHODS on the queue of QueueUrl.
+        """
+        if method not in SQS_METHODS:
+            raise Exception(f"Unsupported queue call: {method}.")
+        return getattr(self.queue(QueueUrl), method)(QueueUrl=QueueUrl, **kwargs)
+
+    def send_message(self, QueueUrl, **kwargs):
+        return self.call('send_message', QueueUrl, **kwargs)
+
+    def send_message_batch(self, QueueUrl, **kwargs):
+        return self.call('send_message_batch', QueueUrl, **kwargs)
+
+    def receive_message(self, QueueUrl, **kwargs):
+        return self.call('receive_message', QueueUrl, **kwargs)
+
+    def delete_message(self, QueueUrl, **kwargs):
+        return self.call('delete_message', QueueUrl, **kwargs)
+
+    def delete_message_batch(self, QueueUrl, **kwargs):
+        return self.call('delete_message_batch', QueueUrl, **kwargs)
+
+    def change_message_visibility_batch(self, QueueUrl, **kwargs):
+        return self.call('change_message_visibility_batch', QueueUrl, **kwargs)
+
+    def purge_queue(self, QueueUrl, **kwargs):
+        return self.call('purge_queue', QueueUrl, **kwargs)
+
+    def pending(self):
+        with self.lock:
+            queues = list(self.queues.values())
+        return sum(queue.pending() for queue in queues)
+
+
+# the broker of the "local" transport, shared by everything in the process.
+LOCAL_BROKER = LocalBroker()
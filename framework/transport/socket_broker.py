@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from botocore.exceptions import ClientError
+from transport.local_queue import SQS_METHODS, LocalBroker
+
+DEFAULT_BROKER_ADDRESS = 'tcp://127.0.0.1:9324'
+# every request and response is a json document prefixed by its length.
+FRAME_HEADER = struct.Struct('>I')
+
+
+def parse_address(address):
+    """
+    :param address: 'tcp://host:port' or 'unix:///path/to/socket'
+    :return: (socket family, address for bind/connect)
+    """
+    if address.startswith('unix://'):
+        return socket.AF_UNIX, address[len('unix://'):]
+    host, separator, port = address[len('tcp://'):].rpartition(':') if address.startswith('tcp://') \
+        else address.rpartition(':')
+    if not separator:
+        raise Exception(f"Invalid broker address: {address}, expected tcp://host:port or unix:///path.")
+    return socket.AF_INET, (host, int(port))
+
+
+def send_frame(sock, document):
+    payload = json.dumps(document).encode('utf-8')
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("The connection was closed.")
+        data += chunk
+    return bytes(data)
+
+
+def recv_frame(sock):
+    size, = FRAME_HEADER.unpack(recv_exactly(sock, FRAME_HEADER.size))
+    return json.loads(recv_exactly(sock, size))
+
+
+class _BrokerRequestHandler(socketserver.BaseRequestHandler):
+    """
+    One connection: requests are answered in order until the client closes it.
+    """
+
+    def handle(self):
+        while True:
+            try:
+                request = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                response = {'response': self.server.broker.call(request['method'], **request['params'])}
+            except Exception as e:
+                response = {'error': {'Code': type(e).__name__, 'Message': str(e)}}
+            send_frame(self.request, response)
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class SocketBroker:
+    """
+    The queues of the "socket" transport: a LocalBroker served on a TCP or Unix socket, so clients and servers in
+    separate processes of one machine exchange messages with the semantics of SQS (long polling, visibility timeouts,
+    receipt handles, batch calls) and without localstack. Run it with `python -m transport.socket_broker`.
+    """
+
+    def __init__(self, address=DEFAULT_BROKER_ADDRESS, latency=0.0, default_visibility_timeout=30):
+        """
+        :param latency: seconds added to every call, see LocalSQS
+        """
+        self.address = address
+        self.broker = LocalBroker(latency, default_visibility_timeout)
+        family, bind_address = parse_address(address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(bind_address):
+                os.remove(bind_address)
+            self.server = _UnixServer(bind_address, _BrokerRequestHandler)
+        else:
+            self.server = _TCPServer(bind_address, _BrokerRequestHandler)
+            # port 0 binds a free port.
+            self.address = 'tcp://{}:{}'.format(*self.server.server_address)
+        self.server.broker = self.broker
+        self.thread = None
+
+    def serve_forever(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def start(self):
+        """
+        Serve from a background thread.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.close()
+
+    def close(self):
+        self.server.server_close()
+        family, bind_address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(bind_address):
+            os.remove(bind_address)
+
+
+class SocketSQS:
+    """
+    Client of a SocketBroker with the calls, arguments and responses of the boto3 SQS client. Every thread has its own
+    connection. Errors of the broker, and a broker that cannot be reached, raise botocore's ClientError as the boto3
+    client would.
+    """
+
+    def __init__(self, address=DEFAULT_BROKER_ADDRESS, timeout=None):
+        """
+        :param timeout: socket timeout in seconds, it has to stay above the long poll WaitTimeSeconds
+        """
+        self.address = address
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        if getattr(self.local, 'sock', None) is None:
+            family, connect_address = parse_address(self.address)
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            if family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.settimeout(self.timeout)
+            sock.connect(connect_address)
+            self.local.sock = sock
+        return self.local.sock
+
+    def close(self):
+        if getattr(self.local, 'sock', None) is not None:
+            self.local.sock.close()
+            self.local.sock = None
+
+    def call(self, method, **params):
+        try:
+            sock = self.connection()
+            send_frame(sock, {'method': method, 'params': params})
+            reply = recv_frame(sock)
+        except (ConnectionError, OSError) as e:
+            # the next call reconnects.
+            self.close()
+            raise ClientError({'Error': {'Code': 'BrokerUnavailable', 'Message': str(e)}}, method)
+        if 'error' in reply:
+            raise ClientError({'Error': reply['error']}, method)
+        return reply['response']
+
+    def send_message(self, **kwargs):
+        return self.call('send_message', **kwargs)
+
+    def send_message_batch(self, **kwargs):
+        return self.call('send_message_batch', **kwargs)
+
+    def receive_message(self, **kwargs):
+        return self.call('receive_message', **kwargs)
+
+    def delete_message(self, **kwargs):
+        return self.call('delete_message', **kwargs)
+
+    def delete_message_batch(self, **kwargs):
+        return self.call('delete_message_batch', **kwargs)
+
+    def change_message_visibility_batch(self, **kwargs):
+        return self.call('change_message_visibility_batch', **kwargs)
+
+    def purge_queue(self, **kwargs):
+        return self.call('purge_queue', **kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the queues of the socket transport.")
+    parser.add_argument('--address', default=DEFAULT_BROKER_ADDRESS, help="tcp://host:port or unix:///path")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument('--visibility-timeout', type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"serving the {', '.join(SQS_METHODS)} calls on {args.address}")
+    SocketBroker(args.address, args.latency, args.visibility_timeout).serve_forever()